@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+'''
+@File    :   bench_annotation_scanner.py
+@Desc    :   Time the single-pass annotation scanner against the per-category find_* functions, on CHAT files and on adversarial inputs
+'''
+
+# here put the import lib
+import argparse
+import gc
+import glob
+import os
+import sys
+import time
+
+PACKAGE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Inputs that make one of the find_* patterns backtrack: size -> text
+ADVERSARIAL_INPUTS = {
+    'unclosed <': lambda size: '<' * size,                              # <[^>]+> rescans to the end from each '<'
+    'unclosed [': lambda size: '[' * size,                              # \[.*?\] likewise
+    'unclosed [: ': lambda size: '[: ' * (size // 3),                   # \[: [^\]]+\] and \[.*?\]
+    'retracing, no filler': lambda size: '<a> [/] (x) ' * (size // 12),  # \(.*?\) tries every later ')'
+    'shortened word': lambda size: '(' + 'a' * (size - 2) + '!',        # \(?\w*\(?\w+\)?\w*\)? splits the word every way
+    'xxx [=! unclosed': lambda size: 'xxx [=! ' * (size // 8),
+    'frozen / omitted words': lambda size: '0a_b ' * (size // 5),
+}
+
+
+def reference_matches(text):
+    """Matches per category as the find_* functions give them (what collect_all_matches used to run)."""
+    from utils import find_all_anotations as annotations
+    functions = [annotations.find_retracing_markers, annotations.find_interposed_words, annotations.find_overlap_markers,
+                 annotations.find_fillers, annotations.find_frozen_phrases, annotations.find_errors_and_replacements,
+                 annotations.find_omitted_words, annotations.find_word_fragments, annotations.find_annotations,
+                 annotations.find_nonverbal_activities, annotations.find_shortened_words, annotations.find_cheating_content]
+    return [sorted(filter(None, function(text))) for function in functions]
+
+
+def scanned_matches(text):
+    """Matches per category from scan_annotations, in the same form as reference_matches."""
+    from utils.find_all_anotations import ANNOTATION_CATEGORIES, scan_annotations
+    matches = [[] for _ in ANNOTATION_CATEGORIES]
+    for category, start, end in scan_annotations(text):
+        matches[category].append(text[start:end])
+    return [sorted(category_matches) for category_matches in matches]
+
+
+def best_time(function, text, repeats):
+    """Best of repeats timings of function(text), with the garbage collector off as in timeit, and its result."""
+    times = []
+    gc.disable()
+    try:
+        for _ in range(repeats):
+            start = time.perf_counter()
+            result = function(text)
+            times.append(time.perf_counter() - start)
+    finally:
+        gc.enable()
+    return min(times), result
+
+
+def read_cha_texts(cha_dir):
+    """Every .cha file of a directory as one joined text, as the strategies scan them."""
+    texts = []
+    for path in sorted(glob.glob(os.path.join(cha_dir, '*.cha'))):
+        with open(path, encoding='utf-8') as file:
+            texts.append((os.path.basename(path), ' '.join(file.read().splitlines())))
+    return texts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the single-pass annotation scanner.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 2000, 4000, 8000, 16000],
+                        help='Lengths (characters) of the adversarial inputs.')
+    parser.add_argument('--cha_dir', type=str, default=os.path.join(PACKAGE_DIR, 'anotation/cha_files'),
+                        help='Directory of .cha files to time as typical input.')
+    parser.add_argument('--repeats', type=int, default=5, help='Timings per input; the best is reported.')
+    parser.add_argument('--reference_budget', type=float, default=2.0,
+                        help='Seconds; larger inputs of a family are not run through the find_* functions once one took this long.')
+    args = parser.parse_args()
+
+    sys.path.append(PACKAGE_DIR)
+
+    print('CHAT files (joined text)')
+    for name, text in read_cha_texts(args.cha_dir):
+        reference_time, reference = best_time(reference_matches, text, args.repeats)
+        scan_time, scanned = best_time(scanned_matches, text, args.repeats)
+        assert scanned == reference, name
+        print(f"{name:>24} | {len(text):>7} chars | find_* {reference_time * 1e3:8.2f} ms | scanner {scan_time * 1e3:7.2f} ms")
+
+    print('\nAdversarial inputs (time per 1000 characters stays flat for a linear scan)')
+    for family, make_text in ADVERSARIAL_INPUTS.items():
+        over_budget = False
+        for size in args.sizes:
+            text = make_text(size)
+            scan_time, scanned = best_time(scanned_matches, text, args.repeats)
+            reference_column = 'skipped'
+            if not over_budget:
+                reference_time, reference = best_time(reference_matches, text, 1)
+                assert scanned == reference, (family, size)
+                reference_column = f"{reference_time * 1e3:10.1f} ms"
+                over_budget = reference_time > args.reference_budget
+            print(f"{family:>22} | {len(text):>6} chars | find_* {reference_column:>13} | "
+                  f"scanner {scan_time * 1e3:7.2f} ms ({scan_time * 1e6 / len(text) * 1000:6.1f} us / 1000 chars)")
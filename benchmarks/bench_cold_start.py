@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+'''
+@File    :   bench_cold_start.py
+@Desc    :   Cold-start time of a fresh process scoring one line, from the model path vs from a tokenizer bundle
+'''
+
+# here put the import lib
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+PACKAGE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Run in a fresh interpreter: imports, first tokenizer load and one scored line
+CHILD = '''
+import sys, time
+start = time.perf_counter()
+from wer_calculator import WERCalculator
+from wer_strategy import WERAnnotationLineByLineStrategy
+imported = time.perf_counter()
+calculator = WERCalculator(WERAnnotationLineByLineStrategy(use_fast={use_fast}), {source})
+calculator.calculate(['a rabbit [/] and his dog .'], ['a rabbit and his dog .'])
+print(imported - start, time.perf_counter() - imported)
+'''
+
+
+def cold_start(source, use_fast, runs):
+    """Median (import seconds, first-score seconds, wall seconds) over fresh processes, with the hub offline."""
+    env = dict(os.environ, HF_HUB_OFFLINE='1', TRANSFORMERS_OFFLINE='1')
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        output = subprocess.run([sys.executable, '-c', CHILD.format(source=source, use_fast=use_fast)], cwd=PACKAGE_DIR, env=env,
+                                capture_output=True, text=True, check=True).stdout
+        wall = time.perf_counter() - start
+        import_time, score_time = map(float, output.split()[-2:])
+        samples.append((import_time, score_time, wall))
+    return tuple(statistics.median(sample[k] for sample in samples) for k in range(3))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Measure cold start with and without a tokenizer bundle.')
+    parser.add_argument('--tokenizer_model_path', type=str, default='allenai/longformer-base-4096',
+                        help='Model path; must already be in the local HF cache, as the hub is kept offline.')
+    parser.add_argument('--runs', type=int, default=5, help='Fresh processes per configuration.')
+    args = parser.parse_args()
+
+    sys.path.append(PACKAGE_DIR)
+    from utils.ASR_utils import read_file
+    from utils.tokenizer_bundle import build_tokenizer_bundle
+
+    with tempfile.TemporaryDirectory() as bundle_path:
+        build_tokenizer_bundle(args.tokenizer_model_path, read_file(os.path.join(PACKAGE_DIR, 'utils/fix_anotation.txt')), bundle_path)
+        configurations = [
+            ('model path, slow', f"tokenizer_model_path={args.tokenizer_model_path!r}", False),
+            ('bundle, slow', f"tokenizer_bundle={bundle_path!r}", False),
+            ('model path, fast', f"tokenizer_model_path={args.tokenizer_model_path!r}", True),
+            ('bundle, fast', f"tokenizer_bundle={bundle_path!r}", True),
+        ]
+        for label, source, use_fast in configurations:
+            import_time, score_time, wall = cold_start(source, use_fast, args.runs)
+            print(f"{label:>17} | import {import_time:6.2f} s | tokenizer + first line {score_time:6.2f} s | process {wall:6.2f} s")
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+'''
+@File    :   bench_word_alignment.py
+@Desc    :   Time and peak memory of the word aligners against the original per-cell marker
+'''
+
+# here put the import lib
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+# Add parent directory to the module search path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.alignment import word_alignment_dense, word_alignment_linear
+
+WORDS = ['the', 'dog', 'ran', 'and', 'a', 'boy', 'said', 'frog', '[/]', '&-um', '(.)', '.']
+
+
+def make_transcripts(length, error_rate=0.2, seed=0):
+    """Build a reference transcript and a noisy hypothesis."""
+    rng = random.Random(seed)
+    reference = [rng.choice(WORDS) for _ in range(length)]
+    hypothesis = []
+    for word in reference:
+        roll = rng.random()
+        if roll < error_rate / 3:
+            continue
+        if roll < 2 * error_rate / 3:
+            hypothesis.append(rng.choice(WORDS))
+        elif roll < error_rate:
+            hypothesis.extend([word, rng.choice(WORDS)])
+        else:
+            hypothesis.append(word)
+    return reference, hypothesis
+
+
+def baseline_alignment(s1, s2):
+    """The original marker: an int64 NumPy table filled and read one dp[i][j] at a time."""
+    m, n = len(s1), len(s2)
+    dp = np.zeros((m + 1, n + 1), dtype=int)
+    for i in range(1, m + 1):
+        dp[i][0] = i
+    for j in range(1, n + 1):
+        dp[0][j] = j
+    for i in range(1, m + 1):
+        for j in range(1, n + 1):
+            if s1[i - 1] == s2[j - 1]:
+                dp[i][j] = dp[i - 1][j - 1]
+            else:
+                dp[i][j] = min(dp[i - 1][j] + 1, dp[i][j - 1] + 1, dp[i - 1][j - 1] + 1)
+
+    i, j = m, n
+    ops = []
+    while i > 0 or j > 0:
+        if i > 0 and j > 0 and s1[i - 1] == s2[j - 1]:
+            ops.append(('equal', i - 1, j - 1))
+            i, j = i - 1, j - 1
+        elif i > 0 and j > 0 and dp[i][j] == dp[i - 1][j - 1] + 1:
+            ops.append(('replace', i - 1, j - 1))
+            i, j = i - 1, j - 1
+        elif j > 0 and dp[i][j] == dp[i][j - 1] + 1:
+            ops.append(('insert', i - 1, j - 1))
+            j -= 1
+        elif i > 0 and dp[i][j] == dp[i - 1][j] + 1:
+            ops.append(('delete', i - 1, j - 1))
+            i -= 1
+    ops.reverse()
+    return ops
+
+
+def measure(aligner, reference, hypothesis):
+    tracemalloc.start()
+    start = time.perf_counter()
+    ops = aligner(reference, hypothesis)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return ops, elapsed, peak
+
+
+if __name__ == "__main__":
+    for length in [100, 500, 1000, 2000, 4000]:
+        reference, hypothesis = make_transcripts(length, seed=length)
+        dense_ops, dense_time, dense_peak = measure(word_alignment_dense, reference, hypothesis)
+        linear_ops, linear_time, linear_peak = measure(word_alignment_linear, reference, hypothesis)
+        assert dense_ops == linear_ops
+        row = (f"{length:>6} tokens | dense {dense_time:7.2f} s {dense_peak / 2**20:9.1f} MiB"
+               f" | linear {linear_time:7.2f} s {linear_peak / 2**20:9.1f} MiB")
+        if length <= 1000:
+            # The per-cell baseline is far too slow beyond this
+            baseline_ops, baseline_time, baseline_peak = measure(baseline_alignment, reference, hypothesis)
+            assert baseline_ops == dense_ops
+            row += f" | baseline {baseline_time:7.2f} s {baseline_peak / 2**20:9.1f} MiB"
+        print(row)
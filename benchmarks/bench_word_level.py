@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+'''
+@File    :   bench_word_level.py
+@Desc    :   Sequence length and scoring time of every strategy with subword tokens vs merged words
+'''
+
+# here put the import lib
+import argparse
+import contextlib
+import io
+import os
+import sys
+import time
+
+# Add parent directory to the module search path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import wer_strategy
+from utils.ASR_utils import read_file
+from utils.anotaion_utils import extract_lines_from_file
+from utils.pair_cache import PairCache
+
+STRATEGIES = [
+    'WERWholeTextStrategy',
+    'WERLineByLineStrategy',
+    'WERAnnotationWholeTextStrategy',
+    'WERAnnotationLineByLineStrategy',
+    'WERAnnotationOnlyWholeTextStrategy',
+    'WERAnnotationOnlyLineByLineStrategy',
+    'WERAnnotationOnlyLineByLineStrategy_marked',
+]
+
+
+def measure(strategy, ground_truth_lines, candidate_lines, tokenizer_model_path, fixed_annotations):
+    """Tokenize, then time scoring and marking alone (no pair cache); returns (mean units per pair, seconds)."""
+    token_pairs = strategy.tokenize_pairs(ground_truth_lines, candidate_lines, tokenizer_model_path, fixed_annotations)
+    mark_pairs = strategy.tokenize_mark_pairs(ground_truth_lines, candidate_lines, tokenizer_model_path, fixed_annotations)
+    start = time.perf_counter()
+    strategy.score_pairs(token_pairs, mark_pairs, pair_cache=PairCache(max_size=0))
+    elapsed = time.perf_counter() - start
+    units = sum(len(gt) + len(cand) for gt, cand in token_pairs) / (2 * len(token_pairs))
+    return units, elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare subword-level and word-level scoring per strategy.')
+    parser.add_argument('--ground_truth_path', type=str, default='anotation/cha_files/758_2.cha', help='Ground truth CHAT file.')
+    parser.add_argument('--candidate_path', type=str, default='anotation/cha_files/758_AI.cha', help='Candidate CHAT file.')
+    parser.add_argument('--tokenizer_model_path', type=str, default='allenai/longformer-base-4096', help='Tokenizer model path.')
+    args = parser.parse_args()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        ground_truth_lines = extract_lines_from_file(args.ground_truth_path, '*CHI:')
+        candidate_lines = extract_lines_from_file(args.candidate_path, '*PAR0:')
+    fixed_annotations = read_file('utils/fix_anotation.txt')
+
+    for name in STRATEGIES:
+        strategy_class = getattr(wer_strategy, name)
+        token_units, token_time = measure(strategy_class(), ground_truth_lines, candidate_lines, args.tokenizer_model_path, fixed_annotations)
+        word_units, word_time = measure(strategy_class(word_level=True), ground_truth_lines, candidate_lines, args.tokenizer_model_path, fixed_annotations)
+        print(f"{name:>44} | tokens {token_units:7.1f}/pair {token_time * 1e3:8.1f} ms"
+              f" | words {word_units:7.1f}/pair {word_time * 1e3:8.1f} ms | speedup {token_time / word_time:5.2f}x")
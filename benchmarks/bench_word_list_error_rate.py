@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+'''
+@File    :   bench_word_list_error_rate.py
+@Desc    :   Benchmark the edit-distance kernels against the pure-Python DP
+'''
+
+# here put the import lib
+import os
+import random
+import sys
+import timeit
+
+# Add parent directory to the module search path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.edit_distance import DISTANCE_KERNELS
+from utils.wer_by_tokens import word_list_error_rate, word_list_error_rate_batch, word_list_error_rate_python
+
+WORDS = ['Ġthe', 'Ġdog', 'Ġran', 'Ġand', 'Ġa', 'Ġboy', 'Ġsaid', 'Ġfrog', '[/]', '&-um', '(.)', '.']
+
+
+def make_pair(length, error_rate=0.2, seed=0):
+    """Build a reference and a noisy hypothesis with substitutions, deletions, insertions and swaps."""
+    rng = random.Random(seed)
+    reference = ['<s>'] + [rng.choice(WORDS) for _ in range(length)] + ['</s>']
+    hypothesis = []
+    for word in reference:
+        roll = rng.random()
+        if roll < error_rate / 4:
+            continue
+        if roll < error_rate / 2:
+            hypothesis.append(rng.choice(WORDS))
+        elif roll < 3 * error_rate / 4:
+            hypothesis.extend([word, rng.choice(WORDS)])
+        else:
+            hypothesis.append(word)
+        if roll > 1 - error_rate / 4 and len(hypothesis) > 1:
+            hypothesis[-1], hypothesis[-2] = hypothesis[-2], hypothesis[-1]
+    return reference, hypothesis
+
+
+def bench(length, repeat=3):
+    reference, hypothesis = make_pair(length, seed=length)
+    expected = word_list_error_rate_python(reference, hypothesis)
+
+    number = max(1, 2000 // max(length, 1))
+    python_time = min(timeit.repeat(lambda: word_list_error_rate_python(reference, hypothesis), number=number, repeat=repeat)) / number
+    row = f"{length:>6} tokens | reference {python_time * 1e3:9.3f} ms"
+    for kernel in ['auto'] + list(DISTANCE_KERNELS):
+        # Cross-check every kernel against the reference DP before timing it
+        assert word_list_error_rate(reference, hypothesis, kernel) == expected, kernel
+        kernel_time = min(timeit.repeat(lambda: word_list_error_rate(reference, hypothesis, kernel), number=number, repeat=repeat)) / number
+        row += f" | {kernel} {kernel_time * 1e3:9.3f} ms (x{python_time / kernel_time:6.1f})"
+    print(row)
+
+
+def bench_batch(count=2000, repeat=3):
+    """Score many short utterance pairs one by one and with word_list_error_rate_batch."""
+    rng = random.Random(count)
+    pairs = [make_pair(rng.randint(2, 30), seed=seed) for seed in range(count)]
+    assert word_list_error_rate_batch(pairs) == [word_list_error_rate(ref, hyp) for ref, hyp in pairs]
+
+    loop_time = min(timeit.repeat(lambda: [word_list_error_rate(ref, hyp) for ref, hyp in pairs], number=1, repeat=repeat))
+    batch_time = min(timeit.repeat(lambda: word_list_error_rate_batch(pairs), number=1, repeat=repeat))
+    print(f"{count:>6} pairs  | loop {loop_time * 1e3:9.3f} ms | batch {batch_time * 1e3:9.3f} ms (x{loop_time / batch_time:6.1f})")
+
+
+def bench_threshold(count=200, max_wer=0.3, repeat=3):
+    """
+    Score long noisy pairs exactly and with the thresholded max_wer mode.
+
+    The bound must make the pure-Python kernels faster. rapidfuzz's C++ OSA
+    leaves too little per-pair work for a bound to save, so 'auto' is only
+    asserted to get faster when rapidfuzz is not installed.
+    """
+    rng = random.Random(count)
+    pairs = [make_pair(rng.randint(200, 600), error_rate=rng.choice([0.05, 0.6]), seed=seed) for seed in range(count)]
+    for kernel in ['auto', 'bitparallel']:
+        exact = word_list_error_rate_batch(pairs, kernel)
+        assert word_list_error_rate_batch(pairs, kernel, max_wer) == [wer if wer <= max_wer else None for wer in exact], kernel
+
+        exact_time = min(timeit.repeat(lambda: word_list_error_rate_batch(pairs, kernel), number=1, repeat=repeat))
+        bounded_time = min(timeit.repeat(lambda: word_list_error_rate_batch(pairs, kernel, max_wer), number=1, repeat=repeat))
+        print(f"{count:>6} long   | {kernel} exact {exact_time * 1e3:9.3f} ms | max_wer={max_wer} {bounded_time * 1e3:9.3f} ms (x{exact_time / bounded_time:6.1f})")
+        if kernel != 'auto' or 'rapidfuzz' not in DISTANCE_KERNELS:
+            assert bounded_time < exact_time, (kernel, max_wer, exact_time, bounded_time)
+
+
+if __name__ == "__main__":
+    for length in [8, 16, 32, 128, 512, 2048]:
+        bench(length)
+    bench_batch()
+    for max_wer in [0.1, 0.3]:
+        bench_threshold(max_wer=max_wer)
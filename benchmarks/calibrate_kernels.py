@@ -0,0 +1,32 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+'''
+@File    :   calibrate_kernels.py
+@Desc    :   Fit the per-kernel cost model used by the 'auto' kernel planner
+'''
+
+# here put the import lib
+import argparse
+import json
+import os
+import sys
+
+# Add parent directory to the module search path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.edit_distance import calibrate_kernel_costs, plan_kernel
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Micro-benchmark the edit-distance kernels and save their cost model.')
+    parser.add_argument('--output_path', type=str, default='kernel_costs.json', help='Where to write the fitted costs (JSON).')
+    args = parser.parse_args()
+
+    costs = calibrate_kernel_costs()
+    for name, (fixed, per_row, per_cell) in costs.items():
+        print(f"{name:>12} | fixed {fixed * 1e6:8.2f} us | per row {per_row * 1e9:9.2f} ns | per cell {per_cell * 1e9:9.3f} ns")
+    for short, long in [(2, 2), (8, 8), (32, 32), (128, 128), (512, 512), (2048, 2048), (16, 512)]:
+        print(f"{short:>5} x {long:<5} -> {plan_kernel(short, long, costs)}")
+
+    with open(args.output_path, 'w', encoding='utf-8') as file:
+        json.dump(costs, file, indent=2)
+    print(f"Saved to {args.output_path}; load with utils.edit_distance.load_kernel_costs('{args.output_path}')")
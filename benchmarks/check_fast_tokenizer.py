@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+'''
+@File    :   check_fast_tokenizer.py
+@Desc    :   Check that the batched fast tokenizer gives the slow tokenizer's tokens on CHAT corpora
+'''
+
+# here put the import lib
+import argparse
+import glob
+import os
+import sys
+import time
+
+# Add parent directory to the module search path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from wer_strategy import encode_tokens, encode_tokens_batch, initialize_tokenizer, merge_word_pieces, whole_token_set
+from utils.ASR_utils import read_file
+from utils.find_all_anotations import collect_all_matches
+
+
+def read_utterances(cha_path):
+    """All speaker lines ('*XXX:\t...') of a CHAT file, without the speaker prefix."""
+    with open(cha_path, 'r', encoding='utf-8') as file:
+        return [line.split(':', 1)[1].strip() for line in file if line.startswith('*') and ':' in line]
+
+
+def compare(slow_tokens_list, fast_tokens_list, texts):
+    """Return the (text, slow tokens, fast tokens) of every text the two paths split differently."""
+    return [(text, slow_tokens, fast_tokens)
+            for text, slow_tokens, fast_tokens in zip(texts, slow_tokens_list, fast_tokens_list) if slow_tokens != fast_tokens]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare slow and fast tokenizer output on CHAT files.')
+    parser.add_argument('--cha_glob', type=str, default='anotation/cha_files/*.cha', help='CHAT files to check.')
+    parser.add_argument('--tokenizer_model_path', type=str, default='allenai/longformer-base-4096', help='Tokenizer model path.')
+    parser.add_argument('--show', type=int, default=5, help='Mismatches to print.')
+    args = parser.parse_args()
+
+    fixed_annotations = read_file('utils/fix_anotation.txt')
+    mismatches, checked = [], 0
+    for cha_path in sorted(glob.glob(args.cha_glob)):
+        lines = read_utterances(cha_path)
+        # Per line, as the line-by-line strategies encode, and the whole file, as the whole-text ones do
+        texts = lines + [' '.join(lines)]
+        for annotations in [fixed_annotations, fixed_annotations + collect_all_matches(' '.join(lines))]:
+            slow = initialize_tokenizer(args.tokenizer_model_path, annotations)
+            fast = initialize_tokenizer(args.tokenizer_model_path, annotations, use_fast=True)
+
+            start = time.perf_counter()
+            slow_tokens_list = [encode_tokens(slow, text) for text in texts]
+            slow_time = time.perf_counter() - start
+            start = time.perf_counter()
+            fast_tokens_list = encode_tokens_batch(fast, texts)
+            fast_time = time.perf_counter() - start
+
+            mismatches += compare(slow_tokens_list, fast_tokens_list, texts)
+            # The word-level merge and the annotation-only filter see the same tokens as well
+            slow_whole, fast_whole = whole_token_set(slow), whole_token_set(fast)
+            mismatches += compare([merge_word_pieces(tokens, slow_whole) for tokens in slow_tokens_list],
+                                  [merge_word_pieces(tokens, fast_whole) for tokens in fast_tokens_list], texts)
+            mismatches += compare([slow.tokenize(line) for line in lines], [fast.tokenize(line) for line in lines], lines)
+            checked += len(texts)
+            print(f"{os.path.basename(cha_path):>24} | {len(annotations):4d} annotations | {len(texts):5d} texts"
+                  f" | slow {slow_time * 1e3:8.1f} ms | fast batched {fast_time * 1e3:8.1f} ms")
+
+    for text, slow_tokens, fast_tokens in mismatches[:args.show]:
+        print(f"MISMATCH {text!r}\n  slow: {slow_tokens}\n  fast: {fast_tokens}")
+    if mismatches:
+        print(f"{len(mismatches)} mismatches in {checked} texts: keep use_fast=False for this tokenizer.")
+        sys.exit(1)
+    print(f"All {checked} texts match: use_fast=True is safe for {args.tokenizer_model_path} on these files.")
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+'''
+@File    :   fuzz_distance_kernels.py
+@Desc    :   Differential fuzzing of every edit-distance backend against the pure-Python DP
+'''
+
+# here put the import lib
+import argparse
+import os
+import random
+import sys
+
+# Add parent directory to the module search path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from utils.edit_distance import DISTANCE_KERNELS
+from utils.wer_by_tokens import (
+    word_list_error_counts_batch,
+    word_list_error_rate,
+    word_list_error_rate_batch,
+    word_list_error_rate_python,
+)
+
+
+def random_pair(rng):
+    """A random reference and an edited hypothesis; small alphabets make swaps and repeats likely."""
+    alphabet = [f"Ġw{k}" for k in range(rng.choice([2, 3, 5, 20, 200]))]
+    length = rng.choice([0, 1, 2, 3, rng.randint(4, 40), rng.randint(40, 400)])
+    reference = [rng.choice(alphabet) for _ in range(length)]
+    hypothesis = list(reference)
+    for _ in range(rng.randint(0, max(1, length // 2))):
+        roll = rng.random()
+        position = rng.randint(0, max(0, len(hypothesis) - 1))
+        if roll < 0.25 and hypothesis:
+            hypothesis[position] = rng.choice(alphabet)
+        elif roll < 0.5 and hypothesis:
+            del hypothesis[position]
+        elif roll < 0.75:
+            hypothesis.insert(position, rng.choice(alphabet))
+        elif len(hypothesis) > 1 and position + 1 < len(hypothesis):
+            hypothesis[position], hypothesis[position + 1] = hypothesis[position + 1], hypothesis[position]
+    if rng.random() < 0.1:
+        hypothesis = [rng.choice(alphabet) for _ in range(rng.randint(0, 40))]
+    return ['<s>'] + reference + ['</s>'], ['<s>'] + hypothesis + ['</s>']
+
+
+def fuzz(iterations, seed):
+    rng = random.Random(seed)
+    kernels = ['auto'] + list(DISTANCE_KERNELS)
+    pairs = []
+    for iteration in range(iterations):
+        reference, hypothesis = random_pair(rng)
+        expected = word_list_error_rate_python(reference, hypothesis)
+        for kernel in kernels:
+            actual = word_list_error_rate(reference, hypothesis, kernel)
+            assert actual == expected, (iteration, kernel, actual, expected, reference, hypothesis)
+        max_wer = rng.choice([0.0, 0.1, 0.25, 0.5, 1.0])
+        for kernel in kernels:
+            bounded = word_list_error_rate(reference, hypothesis, kernel, max_wer)
+            assert bounded == (expected if expected <= max_wer else None), (iteration, kernel, max_wer, bounded, expected)
+        pairs.append((reference, hypothesis))
+
+    # Batched paths see every pair at once
+    expected = [word_list_error_rate_python(reference, hypothesis) for reference, hypothesis in pairs]
+    for kernel in kernels:
+        assert word_list_error_rate_batch(pairs, kernel) == expected, kernel
+    for max_wer in [0.1, 0.5]:
+        bounded = [wer if wer <= max_wer else None for wer in expected]
+        for kernel in kernels:
+            assert word_list_error_rate_batch(pairs, kernel, max_wer) == bounded, (kernel, max_wer)
+    assert [counts.wer for counts in word_list_error_counts_batch(pairs)] == expected
+    print(f"{iterations} pairs x {len(kernels)} kernels ({', '.join(kernels)}): all agree with word_list_error_rate_python")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Fuzz the edit-distance kernels against the reference DP.')
+    parser.add_argument('--iterations', type=int, default=500, help='Number of random pairs.')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed.')
+    args = parser.parse_args()
+    fuzz(args.iterations, args.seed)
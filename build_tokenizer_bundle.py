@@ -0,0 +1,25 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+'''
+@File    :   build_tokenizer_bundle.py
+@Desc    :   Build an offline tokenizer bundle for WERCalculator(tokenizer_bundle=...)
+'''
+
+# here put the import lib
+import argparse
+
+from utils.ASR_utils import read_file
+from utils.tokenizer_bundle import build_tokenizer_bundle
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Save the tokenizer with the fixed annotations, a vocab hash and a manifest for offline use.')
+    parser.add_argument('--tokenizer_model_path', type=str, default='allenai/longformer-base-4096', help='Hub name or path of the tokenizer model.')
+    parser.add_argument('--fixed_annotations_path', type=str, default='utils/fix_anotation.txt', help='Annotations to add, one per line.')
+    parser.add_argument('--output_path', type=str, default='tokenizer_bundle', help='Bundle directory to write.')
+    args = parser.parse_args()
+
+    manifest = build_tokenizer_bundle(args.tokenizer_model_path, read_file(args.fixed_annotations_path), args.output_path)
+    print(f"Saved {manifest['tokenizer_class']} ({manifest['vocab_size']} tokens, {len(manifest['fixed_annotations'])} fixed annotations)"
+          f" to {args.output_path}")
+    print(f"Vocab hash: {manifest['vocab_hash']}")
+    print(f"Use it offline with WERCalculator(strategy, tokenizer_bundle='{args.output_path}')")
@@ -1,6 +1,8 @@
 import jiwer
 import nltk
 
+from utils.edit_distance import intern_tokens, osa_distance_batch
+
 # Ensure the required NLTK data files are downloaded
 nltk.download('punkt')
 nltk.download('averaged_perceptron_tagger')
@@ -31,25 +33,57 @@ def count_words_from_dictionary(text, dictionary):
     dictionary_count = sum(1 for word in words if word in dictionary_set)
     return dictionary_count
 
+def levenshtein_distance_batch(pairs):
+    """
+    Plain Levenshtein distances (jiwer's S + D + I) of many (reference, hypothesis)
+    sequence pairs, scored in one batched call.
+
+    Args:
+    - pairs (list): (reference, hypothesis) pairs of word lists or strings.
+
+    Returns:
+    - list: int edit distances in the same order as pairs.
+    """
+    interned = intern_tokens(*(seq for pair in pairs for seq in pair))
+    return osa_distance_batch(list(zip(interned[0::2], interned[1::2])), transpositions=False)
+
+def sentence_error_counts(candidate_sentences, ground_truth_sentences):
+    """
+    Exact word and character error counts for many sentence pairs at once.
+
+    Sentences are normalized once the way jiwer's default transforms do
+    (strip, then whitespace-split words for WER and characters for CER), and
+    all pairs are scored with two batched calls instead of one jiwer.wer plus
+    one jiwer.cer call per sentence.
+
+    Args:
+    - candidate_sentences (list): Hypothesis sentences.
+    - ground_truth_sentences (list): Reference sentences, paired by position.
+
+    Returns:
+    - tuple: (word_errors, word_lengths, character_errors, character_lengths),
+      four int lists; word_errors / word_lengths is the jiwer WER and
+      character_errors / character_lengths the jiwer CER of each pair.
+    """
+    ground_truth_sentences = [s.strip() for s in ground_truth_sentences]
+    candidate_sentences = [s.strip() for s in candidate_sentences]
+    ground_truth_words = [s.split() for s in ground_truth_sentences]
+
+    word_errors = levenshtein_distance_batch(list(zip(ground_truth_words, (s.split() for s in candidate_sentences))))
+    character_errors = levenshtein_distance_batch(list(zip(ground_truth_sentences, candidate_sentences)))
+    word_lengths = [len(words) for words in ground_truth_words]
+    character_lengths = [len(s) for s in ground_truth_sentences]
+    return word_errors, word_lengths, character_errors, character_lengths
+
 def calculate_per_sentence_errors(candidate, ground_truth):
     candidate_sentences = [s.strip() for s in candidate.split('.') if s.strip()]
     ground_truth_sentences = [s.strip() for s in ground_truth.split('.') if s.strip()]
+    pair_count = min(len(candidate_sentences), len(ground_truth_sentences))
 
-    wer_list = []
-    cer_list = []
-    word_errors_list = []
-    character_errors_list = []
-
-    for cand_sentence, gt_sentence in zip(candidate_sentences, ground_truth_sentences):
-        wer = calculate_wer(cand_sentence, gt_sentence)
-        cer = calculate_cer(cand_sentence, gt_sentence)
-        word_errors = int(wer * len(gt_sentence.split()))
-        character_errors = int(cer * len(gt_sentence))
-
-        wer_list.append(wer)
-        cer_list.append(cer)
-        word_errors_list.append(word_errors)
-        character_errors_list.append(character_errors)
+    word_errors_list, word_lengths, character_errors_list, character_lengths = sentence_error_counts(
+        candidate_sentences[:pair_count], ground_truth_sentences[:pair_count])
+    wer_list = [errors / length for errors, length in zip(word_errors_list, word_lengths)]
+    cer_list = [errors / length for errors, length in zip(character_errors_list, character_lengths)]
 
     return wer_list, cer_list, word_errors_list, character_errors_list
 
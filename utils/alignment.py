@@ -0,0 +1,302 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+'''
+@File    :   alignment.py
+@Desc    :   Word alignment (operation sequences) for diff marking
+'''
+
+# here put the import lib
+from array import array
+
+import numpy as np
+
+from utils.edit_distance import intern_tokens
+from utils.wer_by_tokens import WordErrorCounts
+
+# Operation codes of CompactAlignment.ops
+EQUAL, REPLACE, INSERT, DELETE = range(4)
+OP_NAMES = ('equal', 'replace', 'insert', 'delete')
+OP_CODES = {name: code for code, name in enumerate(OP_NAMES)}
+
+# Alignments at or above this many DP cells (bytes of the dense direction matrix)
+# use the linear-space aligner
+LINEAR_SPACE_MIN_CELLS = 64_000_000
+# Rows per leaf block of the linear-space aligner
+LINEAR_SPACE_BLOCK_ROWS = 64
+
+
+def _levenshtein_rows(ids1, ids2, row, start, stop):
+    """
+    Plain Levenshtein DP rows start+1 .. stop, continuing from `row` (row `start`).
+
+    Yields each new row as an int32 array; the insertion chain along a row is
+    resolved with a running minimum, as in utils.edit_distance.
+    """
+    steps = np.arange(len(ids2) + 1, dtype=np.int32)
+    for i in range(start + 1, stop + 1):
+        t = np.empty_like(row)
+        t[0] = i
+        np.add(row[:-1], ids2 != ids1[i - 1], out=t[1:], casting='unsafe')
+        np.minimum(t[1:], row[1:] + 1, out=t[1:])
+        t -= steps
+        np.minimum.accumulate(t, out=t)
+        t += steps
+        row = t
+        yield row
+
+
+def _backtrace(ids1, ids2, dp, row_offset, i, j, stop_row, ops):
+    """
+    Walk back from (i, j) until row stop_row, appending (op, i - 1, j - 1) to ops.
+
+    dp holds rows row_offset.. of the DP as lists. Ties are broken exactly like
+    the original dense marker: match, then replacement, insertion, deletion.
+
+    Returns:
+    - int: The column where the walk reached stop_row.
+    """
+    while i > stop_row or (stop_row == 0 and j > 0):
+        here = dp[i - row_offset]
+        if i > 0 and j > 0 and ids1[i - 1] == ids2[j - 1]:
+            ops.append(('equal', i - 1, j - 1))
+            i -= 1
+            j -= 1
+        elif i > 0 and j > 0 and here[j] == dp[i - 1 - row_offset][j - 1] + 1:
+            ops.append(('replace', i - 1, j - 1))
+            i -= 1
+            j -= 1
+        elif j > 0 and here[j] == here[j - 1] + 1:
+            ops.append(('insert', i - 1, j - 1))
+            j -= 1
+        elif i > 0 and here[j] == dp[i - 1 - row_offset][j] + 1:
+            ops.append(('delete', i - 1, j - 1))
+            i -= 1
+    return j
+
+
+def direction_matrix(ids1, ids2):
+    """
+    uint8 matrix of backtrace directions (EQUAL / REPLACE / INSERT / DELETE) of
+    the Levenshtein DP of two id arrays.
+
+    Only two cost rows are alive at a time; every cell keeps one byte, chosen
+    with the backtrace's tie order (match, then replacement, insertion,
+    deletion). Row 0 (all insertions) and column 0 (all deletions) are set in
+    one vectorized step each.
+
+    Returns:
+    - np.ndarray: uint8 array of shape (len(ids1) + 1, len(ids2) + 1).
+    """
+    m, n = len(ids1), len(ids2)
+    directions = np.empty((m + 1, n + 1), dtype=np.uint8)
+    directions[0, :] = INSERT
+    directions[:, 0] = DELETE
+    directions[0, 0] = EQUAL
+
+    prev = np.arange(n + 1, dtype=np.int32)
+    for i, cur in enumerate(_levenshtein_rows(ids1, ids2, prev, 0, m), 1):
+        # Lowest priority first, so later assignments win ties
+        row = directions[i, 1:]
+        row[:] = DELETE
+        row[cur[1:] == cur[:-1] + 1] = INSERT
+        row[cur[1:] == prev[:-1] + 1] = REPLACE
+        row[ids2 == ids1[i - 1]] = EQUAL
+        prev = cur
+    return directions
+
+
+def word_alignment_dense(s1, s2):
+    """
+    Levenshtein alignment of s1 (target) and s2 (source), backtraced from a
+    uint8 direction matrix (one byte per DP cell, see direction_matrix).
+
+    Returns:
+    - list: (op, s1_index, s2_index) tuples in order, op being 'equal',
+      'replace', 'insert' (s2 token only) or 'delete' (s1 token only).
+    """
+    ids1, ids2 = intern_tokens(s1, s2)
+    directions = direction_matrix(ids1, ids2)
+
+    # Flat byte view: indexing it yields plain ints without per-cell NumPy scalars
+    cells = memoryview(directions.reshape(-1))
+    width = len(ids2) + 1
+
+    ops = []
+    i, j = len(ids1), len(ids2)
+    while i > 0 or j > 0:
+        op = cells[i * width + j]
+        ops.append((OP_NAMES[op], i - 1, j - 1))
+        if op != INSERT:
+            i -= 1
+        if op != DELETE:
+            j -= 1
+    ops.reverse()
+    return ops
+
+
+def word_alignment_linear(s1, s2, block_rows=LINEAR_SPACE_BLOCK_ROWS):
+    """
+    The same alignment as word_alignment_dense in linear space (Hirschberg's
+    divide and conquer).
+
+    Rows [top, bottom] are split at the middle row, which is recomputed from
+    the top boundary row; the lower half is backtraced first and tells the
+    upper half at which column the path leaves the middle row. Only leaf
+    blocks of block_rows rows are ever materialised, so memory is
+    O(n * (block_rows + log m)) instead of O(m * n), at the cost of
+    O(m * n * log m) recomputed cells. Because every leaf backtrace sees the
+    exact DP values of the full table, the operation sequence is identical
+    to the dense one.
+
+    Returns:
+    - list: (op, s1_index, s2_index) tuples in order.
+    """
+    ids1, ids2 = intern_tokens(s1, s2)
+    list1, list2 = ids1.tolist(), ids2.tolist()
+    ops = []
+
+    def solve(top, top_row, bottom, j):
+        if bottom - top <= block_rows:
+            dp = [top_row.tolist()] + [row.tolist() for row in _levenshtein_rows(ids1, ids2, top_row, top, bottom)]
+            return _backtrace(list1, list2, dp, top, bottom, j, top, ops)
+        middle = (top + bottom) // 2
+        for middle_row in _levenshtein_rows(ids1, ids2, top_row, top, middle):
+            pass
+        j = solve(middle, middle_row, bottom, j)
+        return solve(top, top_row, middle, j)
+
+    first = np.arange(len(ids2) + 1, dtype=np.int32)
+    solve(0, first, len(ids1), len(ids2))
+    ops.reverse()
+    return ops
+
+
+def word_alignment(s1, s2, linear_space_min_cells=None):
+    """
+    Align s1 (target) and s2 (source), picking the dense or linear-space
+    aligner by DP size.
+
+    Args:
+    - s1 (list): Target tokens.
+    - s2 (list): Source tokens.
+    - linear_space_min_cells (int or None): Size (m+1)*(n+1) from which the
+      linear-space aligner is used; defaults to LINEAR_SPACE_MIN_CELLS.
+
+    Returns:
+    - list: (op, s1_index, s2_index) tuples in order.
+    """
+    if linear_space_min_cells is None:
+        linear_space_min_cells = LINEAR_SPACE_MIN_CELLS
+    if (len(s1) + 1) * (len(s2) + 1) >= linear_space_min_cells:
+        return word_alignment_linear(s1, s2)
+    return word_alignment_dense(s1, s2)
+
+
+class CompactAlignment:
+    """
+    An alignment stored as one opcode byte and two int32 indices per step.
+
+    ops is an array('b') of EQUAL / REPLACE / INSERT / DELETE codes and
+    ref_index / hyp_index are array('i') positions into ref_tokens (target, s1)
+    and hyp_tokens (source, s2), -1 where a side does not apply. Nothing is
+    rendered up front; see utils.alignment_render for HTML, ANSI and JSON.
+    """
+    __slots__ = ('ref_tokens', 'hyp_tokens', 'ops', 'ref_index', 'hyp_index')
+
+    def __init__(self, ref_tokens, hyp_tokens, ops, ref_index, hyp_index):
+        self.ref_tokens = ref_tokens
+        self.hyp_tokens = hyp_tokens
+        self.ops = ops
+        self.ref_index = ref_index
+        self.hyp_index = hyp_index
+
+    @classmethod
+    def from_ops(cls, ref_tokens, hyp_tokens, ops):
+        """Pack the (op, s1_index, s2_index) tuples of word_alignment."""
+        return cls(ref_tokens, hyp_tokens,
+                   array('b', [OP_CODES[op] for op, _, _ in ops]),
+                   array('i', [i for _, i, _ in ops]),
+                   array('i', [j for _, _, j in ops]))
+
+    def __len__(self):
+        return len(self.ops)
+
+    def __iter__(self):
+        """Yield (op code, ref index, hyp index) per step."""
+        return zip(self.ops, self.ref_index, self.hyp_index)
+
+    def __eq__(self, other):
+        return (isinstance(other, CompactAlignment) and self.ops == other.ops and self.ref_index == other.ref_index
+                and self.hyp_index == other.hyp_index and list(self.ref_tokens) == list(other.ref_tokens)
+                and list(self.hyp_tokens) == list(other.hyp_tokens))
+
+    def operations(self):
+        """The alignment as (op name, s1_index, s2_index) tuples, as returned by word_alignment."""
+        return [(OP_NAMES[op], i, j) for op, i, j in self]
+
+    def counts(self):
+        """
+        Returns:
+        - dict: Number of steps per op name.
+        """
+        return {name: self.ops.count(code) for code, name in enumerate(OP_NAMES)}
+
+    def transposed_steps(self):
+        """
+        Steps that begin a swap of two adjacent words: two replacements where each ref word is the other's hyp word.
+
+        The aligner has no transposition step, so it shows a swap as two
+        replacements; the scoring DP counts it as one transposition.
+
+        Returns:
+        - list: The index of the first of the two steps, per swap.
+        """
+        steps, k = [], 0
+        while k + 1 < len(self.ops):
+            if (self.ops[k] == REPLACE and self.ops[k + 1] == REPLACE
+                    and self.ref_tokens[self.ref_index[k]] == self.hyp_tokens[self.hyp_index[k + 1]]
+                    and self.ref_tokens[self.ref_index[k + 1]] == self.hyp_tokens[self.hyp_index[k]]):
+                steps.append(k)
+                k += 2
+            else:
+                k += 1
+        return steps
+
+    def error_counts(self):
+        """
+        The edits this alignment marks, with each swap (see transposed_steps) as one transposition.
+
+        Unlike the counts of the scoring DP (utils.wer_by_tokens), these always agree
+        with the rendered row, as they come from the same steps.
+
+        Returns:
+        - WordErrorCounts
+        """
+        transpositions = len(self.transposed_steps())
+        return WordErrorCounts(self.ops.count(REPLACE) - 2 * transpositions, self.ops.count(DELETE),
+                               self.ops.count(INSERT), transpositions, len(self.ref_tokens))
+
+    def to_dict(self):
+        """JSON-serialisable form, see from_dict."""
+        return {
+            'ref_tokens': list(self.ref_tokens),
+            'hyp_tokens': list(self.hyp_tokens),
+            'ops': self.ops.tolist(),
+            'ref_index': self.ref_index.tolist(),
+            'hyp_index': self.hyp_index.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['ref_tokens'], data['hyp_tokens'], array('b', data['ops']),
+                   array('i', data['ref_index']), array('i', data['hyp_index']))
+
+
+def compact_word_alignment(s1, s2, linear_space_min_cells=None):
+    """
+    word_alignment of s1 (target) and s2 (source), packed as a CompactAlignment.
+
+    Returns:
+    - CompactAlignment: The alignment, holding s1 and s2 as its token lists.
+    """
+    return CompactAlignment.from_ops(s1, s2, word_alignment(s1, s2, linear_space_min_cells))
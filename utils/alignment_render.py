@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+'''
+@File    :   alignment_render.py
+@Desc    :   HTML, ANSI and JSON renderers for CompactAlignment rows
+'''
+
+# here put the import lib
+import json
+from functools import lru_cache
+
+from utils.alignment import EQUAL, REPLACE, INSERT, DELETE, word_alignment_dense
+
+# Colours of the marked operations, as in wer_strategy.mark_word_changes_list
+HTML_COLORS = {REPLACE: 'green', INSERT: 'blue', DELETE: 'red'}
+ANSI_COLORS = {REPLACE: '\033[32m', INSERT: '\033[34m', DELETE: '\033[31m'}
+# Colour of swapped word pairs when render_html_lists shows transpositions
+TRANSPOSITION_COLOR = 'darkorange'
+ANSI_RESET = '\033[0m'
+
+# Substituted word pairs whose character diff is memoized
+CHAR_DIFF_CACHE_SIZE = 65_536
+
+
+def escape_html(word):
+    return word.replace("<", "&lt;").replace(">", "&gt;")
+
+
+def _visible_length(word):
+    """Display length of an escaped word, each &lt; / &gt; counting as one character."""
+    return len(word.replace("&lt;", "#").replace("&gt;", "#"))
+
+
+def _span(color, word):
+    return f"<span style=\"color: {color};\">{word}</span>"
+
+
+@lru_cache(maxsize=CHAR_DIFF_CACHE_SIZE)
+def word_char_diff(ref_word, hyp_word):
+    """
+    Which characters of a substituted word pair differ, e.g. 'rabbit' vs 'rabbits'.
+
+    Computed with the word aligner on characters, only when a substitution is
+    rendered with char_diff, and memoized per word pair.
+
+    Args:
+    - ref_word (str): The reference word.
+    - hyp_word (str): The hypothesis word.
+
+    Returns:
+    - tuple: (ref_changed, hyp_changed), one bool per character of each word.
+    """
+    ref_changed, hyp_changed = [False] * len(ref_word), [False] * len(hyp_word)
+    for op, i, j in word_alignment_dense(list(ref_word), list(hyp_word)):
+        if op in ('replace', 'delete'):
+            ref_changed[i] = True
+        if op in ('replace', 'insert'):
+            hyp_changed[j] = True
+    return tuple(ref_changed), tuple(hyp_changed)
+
+
+def _underline_changes(word, changed):
+    """Escape a word and wrap each run of changed characters in <u>."""
+    parts, in_run = [], False
+    for char, is_changed in zip(word, changed):
+        if is_changed != in_run:
+            parts.append('<u>' if is_changed else '</u>')
+            in_run = is_changed
+        parts.append(escape_html(char))
+    if in_run:
+        parts.append('</u>')
+    return ''.join(parts)
+
+
+def render_html_lists(alignment, char_diff=False, transpositions=False):
+    """
+    Render an alignment as the column-balanced HTML token lists of mark_word_changes_list.
+
+    Every column gets the same display width on both sides: gaps are filled
+    with '-' of the other token's length, the shorter side is padded with '-',
+    and all '-' become '&nbsp;'.
+
+    Args:
+    - alignment (CompactAlignment): ref = target (s1), hyp = source (s2).
+    - char_diff (bool): Also underline the differing characters inside each substituted
+      word (see word_char_diff); the column widths are unchanged.
+    - transpositions (bool): Mark swapped adjacent words (CompactAlignment.transposed_steps) in
+      TRANSPOSITION_COLOR instead of as two substitutions.
+
+    Returns:
+    - tuple: (marked_ref_list, marked_hyp_list)
+    """
+    ref = [escape_html(word) for word in alignment.ref_tokens]
+    hyp = [escape_html(word) for word in alignment.hyp_tokens]
+    marked_ref, marked_hyp = [], []
+    transposed = set()
+    if transpositions:
+        for step in alignment.transposed_steps():
+            transposed.update((step, step + 1))
+
+    for step, (op, i, j) in enumerate(alignment):
+        if op == EQUAL:
+            ref_cell = hyp_cell = ref[i]
+            ref_length = hyp_length = _visible_length(ref[i])
+        elif step in transposed:
+            ref_cell, hyp_cell = _span(TRANSPOSITION_COLOR, ref[i]), _span(TRANSPOSITION_COLOR, hyp[j])
+            ref_length, hyp_length = _visible_length(ref[i]), _visible_length(hyp[j])
+        elif op == REPLACE:
+            ref_word, hyp_word = ref[i], hyp[j]
+            ref_length, hyp_length = _visible_length(ref_word), _visible_length(hyp_word)
+            if char_diff:
+                ref_changed, hyp_changed = word_char_diff(alignment.ref_tokens[i], alignment.hyp_tokens[j])
+                ref_word = _underline_changes(alignment.ref_tokens[i], ref_changed)
+                hyp_word = _underline_changes(alignment.hyp_tokens[j], hyp_changed)
+            ref_cell, hyp_cell = _span(HTML_COLORS[op], ref_word), _span(HTML_COLORS[op], hyp_word)
+        elif op == INSERT:
+            ref_cell, hyp_cell = '-' * len(hyp[j]), _span(HTML_COLORS[op], hyp[j])
+            ref_length, hyp_length = len(hyp[j]), _visible_length(hyp[j])
+        else:
+            ref_cell, hyp_cell = _span(HTML_COLORS[op], ref[i]), '-' * len(ref[i])
+            ref_length, hyp_length = _visible_length(ref[i]), len(ref[i])
+
+        if ref_length > hyp_length:
+            hyp_cell += '-' * (ref_length - hyp_length)
+        elif hyp_length > ref_length:
+            ref_cell += '-' * (hyp_length - ref_length)
+        marked_ref.append(ref_cell.replace('-', '&nbsp;'))
+        marked_hyp.append(hyp_cell.replace('-', '&nbsp;'))
+
+    return marked_ref, marked_hyp
+
+
+def render_html(alignment, char_diff=False):
+    """
+    Render an alignment as the two marked HTML strings of mark_word_changes (see render_html_lists).
+
+    Returns:
+    - tuple: (marked_ref, marked_hyp)
+    """
+    marked_ref, marked_hyp = render_html_lists(alignment, char_diff)
+    return ' '.join(marked_ref), ' '.join(marked_hyp)
+
+
+def render_ansi(alignment):
+    """
+    Render an alignment as two column-aligned lines with ANSI colours for a terminal.
+
+    Replacements are green, insertions (hyp only) blue and deletions (ref only) red.
+
+    Returns:
+    - tuple: (ref_line, hyp_line)
+    """
+    ref_cells, hyp_cells = [], []
+    for op, i, j in alignment:
+        ref_word = alignment.ref_tokens[i] if i >= 0 else ''
+        hyp_word = alignment.hyp_tokens[j] if j >= 0 else ''
+        width = max(len(ref_word), len(hyp_word))
+        color, reset = ANSI_COLORS.get(op, ''), ANSI_RESET if op != EQUAL else ''
+        ref_cells.append(f"{color}{ref_word.ljust(width)}{reset}")
+        hyp_cells.append(f"{color}{hyp_word.ljust(width)}{reset}")
+    return ' '.join(ref_cells), ' '.join(hyp_cells)
+
+
+def render_json(alignment):
+    """
+    Serialise an alignment for export; CompactAlignment.from_dict(json.loads(...)) restores it.
+
+    Returns:
+    - str: JSON text.
+    """
+    return json.dumps(alignment.to_dict(), ensure_ascii=False)
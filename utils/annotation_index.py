@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+'''
+@File    :   annotation_index.py
+@Desc    :   Per-line annotation spans of a file, found once and shared by the annotation strategies
+'''
+
+# here put the import lib
+import re
+from functools import lru_cache
+
+import numpy as np
+
+from utils.find_all_anotations import ANNOTATION_CATEGORIES, scan_annotations
+
+# Category of fixed annotations that scan_annotations does not find in the text
+FIXED_ANNOTATION = len(ANNOTATION_CATEGORIES)
+INDEX_CATEGORIES = ANNOTATION_CATEGORIES + ('fixed',)
+
+# Indexes kept by annotation_index (one per file and fixed annotation list)
+ANNOTATION_INDEX_CACHE_SIZE = 256
+
+
+class AnnotationIndex:
+    """
+    The annotations of a file's lines and where they are in each line.
+
+    The joined text (' '.join(lines), as the strategies scan it) goes through
+    scan_annotations once. Each line is then split at the distinct
+    annotations and the fixed annotations, leftmost and longest first, as a
+    tokenizer splits out its added tokens. The spans of these whole
+    annotation tokens are stored line after line in compact arrays:
+    categories (int8, into INDEX_CATEGORIES), starts and ends (int32 offsets
+    into the line). line_starts[i]:line_starts[i + 1] selects line i's spans.
+    """
+
+    def __init__(self, lines, fixed_annotations=()):
+        """
+        Args:
+        - lines (list): The lines of one file (ground truth or candidate).
+        - fixed_annotations (list): Annotations kept whole wherever they occur, as in initialize_tokenizer.
+        """
+        self.lines = list(lines)
+        joined = ' '.join(self.lines)
+
+        # Each distinct annotation with the first category (in ANNOTATION_CATEGORIES order) it was found as
+        categories = {}
+        for category, start, end in sorted(scan_annotations(joined)):
+            categories.setdefault(joined[start:end], category)
+        self.annotations = sorted(categories)
+        for annotation in fixed_annotations:
+            if annotation:
+                categories.setdefault(annotation, FIXED_ANNOTATION)
+
+        span_categories, starts, ends, line_starts = [], [], [], [0]
+        if categories:
+            pattern = re.compile('|'.join(map(re.escape, sorted(categories, key=len, reverse=True))))
+            for line in self.lines:
+                for match in pattern.finditer(line):
+                    span_categories.append(categories[match.group()])
+                    starts.append(match.start())
+                    ends.append(match.end())
+                line_starts.append(len(starts))
+        else:
+            line_starts.extend([0] * len(self.lines))
+        self.categories = np.asarray(span_categories, dtype=np.int8)
+        self.starts = np.asarray(starts, dtype=np.int32)
+        self.ends = np.asarray(ends, dtype=np.int32)
+        self.line_starts = np.asarray(line_starts, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.lines)
+
+    def line_tokens(self, index):
+        """The whole annotation tokens of line index, in order."""
+        line = self.lines[index]
+        first, last = self.line_starts[index], self.line_starts[index + 1]
+        return [line[start:end] for start, end in zip(self.starts[first:last].tolist(), self.ends[first:last].tolist())]
+
+    def filtered_lines(self):
+        """
+        Each line reduced to its annotations, as the annotation-only strategies score it.
+
+        Returns:
+        - list: The annotation tokens of each line joined by spaces; ' ' for a line without any.
+        """
+        return [' '.join(self.line_tokens(index)) or ' ' for index in range(len(self.lines))]
+
+
+@lru_cache(maxsize=ANNOTATION_INDEX_CACHE_SIZE)
+def _cached_annotation_index(lines, fixed_annotations):
+    return AnnotationIndex(lines, fixed_annotations)
+
+
+def annotation_index(lines, fixed_annotations=()):
+    """
+    The AnnotationIndex of a file's lines, built once per (lines, fixed annotations) and shared.
+
+    Scoring and marking the same file, or scoring it with several strategies,
+    thus scans it only once. The index is shared; do not change it.
+
+    Returns:
+    - AnnotationIndex
+    """
+    return _cached_annotation_index(tuple(lines), tuple(fixed_annotations))
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+'''
+@File    :   annotation_placeholders.py
+@Desc    :   Keep a file's annotations whole as placeholder ids, so the tokenizer itself never changes
+'''
+
+# here put the import lib
+import re
+
+import numpy as np
+
+
+def added_token_ids(tokenizer):
+    """
+    The tokens a tokenizer already keeps whole (special and added tokens) with their ids.
+
+    Returns:
+    - dict: token -> id.
+    """
+    added = dict(tokenizer.get_added_vocab())
+    for token in tokenizer.all_special_tokens:
+        added.setdefault(token, tokenizer.convert_tokens_to_ids(token))
+    return added
+
+
+class AnnotationPlaceholders:
+    """
+    Encode texts with a static tokenizer as if a file's annotations had been added to it.
+
+    A tokenizer with added tokens first splits them out of the text, leftmost
+    and longest first, and only encodes the text between them. This does the
+    same split with the tokenizer's own added tokens and the annotations: the
+    tokenizer's tokens keep their ids, each annotation gets a placeholder id
+    (-1, -2, ... in sorted order) and the text in between is encoded by the
+    unchanged tokenizer. table() then maps the placeholders back to the
+    annotation strings. The tokenizer, and every cache keyed by it, is thus
+    shared by all files, whatever their annotations.
+    """
+
+    def __init__(self, tokenizer, annotations):
+        """
+        Args:
+        - tokenizer: A tokenizer from initialize_tokenizer, with the fixed annotations only.
+        - annotations (iterable): The annotations of the texts, e.g. from collect_annotations.
+        """
+        added = added_token_ids(tokenizer)
+        self.annotations = sorted(set(filter(None, annotations)) - set(added))
+        self.token_ids = dict(added)
+        self.token_ids.update((annotation, -1 - index) for index, annotation in enumerate(self.annotations))
+        whole_tokens = sorted(self.token_ids, key=len, reverse=True)
+        self.pattern = re.compile('({})'.format('|'.join(map(re.escape, whole_tokens)))) if whole_tokens else None
+        self._table = None
+        self._annotation_ids = None
+
+    def split(self, text):
+        """
+        Split a text at the whole tokens.
+
+        Returns:
+        - list: Text between whole tokens at even positions (possibly empty), whole tokens at odd ones.
+        """
+        return [text] if self.pattern is None else self.pattern.split(text)
+
+    def whole_tokens(self, text):
+        """The whole tokens (added tokens and annotations) of a text, in order."""
+        return self.split(text)[1::2]
+
+    def encode(self, texts, encode_pieces):
+        """
+        Encode texts, the text between whole tokens in one encode_pieces call.
+
+        Args:
+        - texts (list): The texts.
+        - encode_pieces (callable): Maps a list of texts to their int32 id arrays without
+          special tokens, e.g. wer_strategy.encode_pieces_batch.
+
+        Returns:
+        - list: An int32 array per text, with negative placeholder ids for the annotations
+          (see resolve).
+        """
+        splits = [self.split(text) for text in texts]
+        plain = [part for parts in splits for part in parts[0::2] if part]
+        plain_ids = iter(encode_pieces(plain) if plain else [])
+        ids_list = []
+        for parts in splits:
+            chunks = []
+            for index, part in enumerate(parts):
+                if index % 2:
+                    chunks.append(np.asarray([self.token_ids[part]], dtype=np.int32))
+                elif part:
+                    chunks.append(next(plain_ids))
+            ids_list.append(np.concatenate(chunks).astype(np.int32, copy=False) if chunks else np.zeros(0, dtype=np.int32))
+        return ids_list
+
+    def table(self, id_table):
+        """
+        The id table of this run: a copy of the tokenizer's TokenTable with the annotations interned.
+
+        Args:
+        - id_table (TokenTable): token_table(tokenizer), covering every id encoded so far.
+
+        Returns:
+        - TokenTable: Made on the first call and returned by the later ones.
+        """
+        if self._table is None:
+            self._table = id_table.copy() if self.annotations else id_table
+            self._annotation_ids = self._table.intern(self.annotations)
+        return self._table
+
+    def resolve(self, ids_list, id_table):
+        """
+        Map the placeholder ids of encode to the ids of the annotations in table(id_table).
+
+        Returns:
+        - list: int32 arrays of ids into table(id_table).
+        """
+        self.table(id_table)
+        if not self.annotations:
+            return ids_list
+        return [np.where(ids < 0, self._annotation_ids[np.maximum(-1 - ids, 0)], ids).astype(np.int32, copy=False)
+                for ids in ids_list]
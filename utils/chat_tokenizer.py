@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+'''
+@File    :   chat_tokenizer.py
+@Desc    :   Regex word tokenizer for CHAT transcripts, a transformers-free stand-in for the subword tokenizer
+'''
+
+# here put the import lib
+import re
+import threading
+
+# Model path that selects the CHAT tokenizer in initialize_tokenizer / TokenizerCache
+CHAT_TOKENIZER = 'chat'
+
+# CHAT codes kept as one token, tried in order; whitespace and the \x15 around time bullets separate tokens
+CHAT_CODE_PATTERN = re.compile('|'.join([
+    r'\[[^\[\]]*\]',                    # [/] [//] [: has got] [* m] [+ exc] [=! laughs]
+    r'<[^<>]*>',                        # <retraced words>, <um>
+    r'\((?:\.{1,3}|[?!]|\d+(?:\.\d+)?)\)(?![^\s\x15\[\]<>])',  # (.) (..) (...) (?) (!) (1.5) as whole tokens
+    r'\+(?:<|[^\s\x15\w\[\]<>]+)',       # utterance terminators and linkers: +... +/. +//. +< +"/.
+    r'&[-+=*~]?[^\s\x15\[\]<>]+',        # &-um fillers, &+fr fragments, &=laughs events, &*INV:yeah
+    r'[^\s\x15\[\]<>]+',                 # words, including 0word omissions, (be)cause shortenings and 123_456 times
+]))
+
+
+class ChatTokenizer:
+    """
+    Word tokenizer for CHAT text with the subset of the tokenizer interface the strategies use.
+
+    Text is split on whitespace, except that CHAT codes ([/], &-um, <...>, [: x],
+    (.), +...) are single tokens. As with the subword tokenizer, added tokens
+    (the annotations, e.g. '<um> [/]') are split out first, longest first,
+    wherever they occur, and kept whole. Tokens are plain words: no Ġ markers
+    and no <s> / </s>, so WER is over the words.
+    """
+
+    is_fast = False
+    all_special_tokens = []
+
+    def __init__(self, annotations=()):
+        """
+        Args:
+        - annotations (iterable): Tokens to keep whole, as add_tokens.
+        """
+        self._added = []
+        self._vocab = {}
+        self._tokens = []
+        self._lock = threading.Lock()
+        self._added_pattern = None
+        self.add_tokens(annotations)
+
+    def __len__(self):
+        return len(self._vocab)
+
+    def __deepcopy__(self, memo):
+        return ChatTokenizer(self._added)
+
+    def add_tokens(self, tokens, special_tokens=False):
+        """
+        Keep the tokens whole from now on; like the subword tokenizer, they take precedence over the CHAT patterns.
+
+        Returns:
+        - int: The number of tokens that were not added before.
+        """
+        new_tokens = [token for token in dict.fromkeys(tokens) if token and token not in self._added]
+        self._added.extend(new_tokens)
+        for token in new_tokens:
+            self._token_id(token)
+        if self._added:
+            added = '|'.join(re.escape(token) for token in sorted(self._added, key=len, reverse=True))
+            self._added_pattern = re.compile(f'({added})')
+        return len(new_tokens)
+
+    def get_added_vocab(self):
+        return {token: self._vocab[token] for token in self._added}
+
+    def get_vocab(self):
+        return dict(self._vocab)
+
+    def tokenize(self, text):
+        if self._added_pattern is None:
+            return CHAT_CODE_PATTERN.findall(text)
+        tokens = []
+        # split() with a capturing group alternates plain text and added tokens
+        for index, part in enumerate(self._added_pattern.split(text)):
+            if index % 2:
+                tokens.append(part)
+            elif part:
+                tokens.extend(CHAT_CODE_PATTERN.findall(part))
+        return tokens
+
+    def _token_id(self, token):
+        token_id = self._vocab.get(token)
+        if token_id is None:
+            with self._lock:
+                token_id = self._vocab.get(token)
+                if token_id is None:
+                    token_id = self._vocab[token] = len(self._tokens)
+                    self._tokens.append(token)
+        return token_id
+
+    def encode(self, text, max_length=None, truncation=False, add_special_tokens=True):
+        tokens = self.tokenize(text)
+        if truncation and max_length is not None:
+            tokens = tokens[:max_length]
+        return [self._token_id(token) for token in tokens]
+
+    def convert_ids_to_tokens(self, ids):
+        return [self._tokens[token_id] for token_id in ids]
@@ -0,0 +1,989 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+'''
+@File    :   edit_distance.py
+@Desc    :   Edit-distance kernels on interned token ids
+'''
+
+# here put the import lib
+import json
+import time
+
+import numpy as np
+
+# Optional C++ backend; the kernels below do not need it
+try:
+    from rapidfuzz.distance import OSA as _rapidfuzz_osa, Levenshtein as _rapidfuzz_levenshtein
+except ImportError:
+    _rapidfuzz_osa = _rapidfuzz_levenshtein = None
+
+
+def intern_tokens(*sequences):
+    """
+    Map every distinct token in the given sequences to a small integer id.
+
+    All sequences share one vocabulary, so equal tokens get equal ids and the
+    kernels below can compare ints instead of Python strings.
+
+    Sequences that are integer arrays already (token ids, see utils.token_table)
+    are remapped together to dense ids in one np.unique pass, which keeps the
+    ids small for osa_lower_bound's bincount.
+
+    Args:
+    - *sequences (list): Token sequences (strings or any hashable items), or integer NumPy arrays.
+
+    Returns:
+    - list: One int32 NumPy array per input sequence.
+    """
+    if sequences and all(isinstance(seq, np.ndarray) and seq.dtype.kind in 'iu' for seq in sequences):
+        _, dense = np.unique(np.concatenate(sequences), return_inverse=True)
+        return np.split(dense.astype(np.int32).reshape(-1), np.cumsum([len(seq) for seq in sequences[:-1]]))
+    # One pass over every token into one array, then a view per sequence
+    vocab = {}
+    ids = np.array([vocab.setdefault(token, len(vocab)) for seq in sequences for token in seq], dtype=np.int32)
+    interned = []
+    start = 0
+    for seq in sequences:
+        interned.append(ids[start:start + len(seq)])
+        start += len(seq)
+    return interned
+
+
+def trim_common_affixes(ids1, ids2):
+    """
+    Drop the common prefix and suffix of two id arrays.
+
+    Shared leading and trailing tokens never change the optimal alignment, so
+    the kernels only need to look at the differing middle part.
+
+    Returns:
+    - tuple: (ids1_middle, ids2_middle)
+    """
+    limit = min(len(ids1), len(ids2))
+    if limit == 0:
+        return ids1, ids2
+
+    diff = np.flatnonzero(ids1[:limit] != ids2[:limit])
+    prefix = diff[0] if len(diff) else limit
+    ids1, ids2 = ids1[prefix:], ids2[prefix:]
+
+    limit = min(len(ids1), len(ids2))
+    if limit == 0:
+        return ids1, ids2
+    diff = np.flatnonzero(ids1[::-1][:limit] != ids2[::-1][:limit])
+    suffix = diff[0] if len(diff) else limit
+    return ids1[:len(ids1) - suffix], ids2[:len(ids2) - suffix]
+
+
+def _within(distance, max_distance):
+    """The distance, or None when it exceeds max_distance (if one is given)."""
+    return None if max_distance is not None and distance > max_distance else distance
+
+
+def osa_distance_python(ids1, ids2, max_distance=None, transpositions=True):
+    """
+    Optimal string alignment distance with the plain two-row DP on Python lists.
+
+    No NumPy call per row, so it is the cheapest kernel for very short pairs.
+
+    With max_distance, the DP stops as soon as the cell on the diagonal that
+    ends in (m, n) exceeds it: costs never decrease along a diagonal.
+
+    Args:
+    - ids1 (np.ndarray): Reference ids.
+    - ids2 (np.ndarray): Hypothesis ids.
+    - max_distance (int or None): Optional bound on the distance.
+    - transpositions (bool): False gives the plain Levenshtein distance.
+
+    Returns:
+    - int or None: The edit distance, or None when it exceeds max_distance.
+    """
+    ids1, ids2 = trim_common_affixes(ids1, ids2)
+    list1, list2 = ids1.tolist(), ids2.tolist()
+    m, n = len(list1), len(list2)
+    if m == 0 or n == 0:
+        return _within(m + n, max_distance)
+
+    prev2 = None
+    prev = list(range(n + 1))
+    for i, token1 in enumerate(list1, 1):
+        cur = [i] + [0] * n
+        for j, token2 in enumerate(list2, 1):
+            value = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (token1 != token2))
+            if transpositions and prev2 is not None and j > 1 and token1 == list2[j - 2] and list1[i - 2] == token2:
+                value = min(value, prev2[j - 2] + 1)
+            cur[j] = value
+        if max_distance is not None and 0 <= i + n - m and cur[i + n - m] > max_distance:
+            return None
+        prev2, prev = prev, cur
+    return _within(prev[n], max_distance)
+
+
+def osa_distance_numpy(ids1, ids2, max_distance=None, transpositions=True):
+    """
+    Optimal string alignment distance (Levenshtein plus adjacent transposition)
+    between two int id arrays.
+
+    Keeps three rolling int32 rows. Each row is built with vectorized deletion,
+    substitution and transposition candidates, and the left-to-right insertion
+    chain is resolved with a running minimum:
+    row[j] = min_k(t[k] + j - k) = cummin(t - j) + j.
+
+    With max_distance, the sweep stops once the row's cell on the final
+    diagonal exceeds it.
+
+    Args:
+    - ids1 (np.ndarray): Reference ids.
+    - ids2 (np.ndarray): Hypothesis ids.
+    - max_distance (int or None): Optional bound on the distance.
+    - transpositions (bool): False gives the plain Levenshtein distance.
+
+    Returns:
+    - int or None: The edit distance, or None when it exceeds max_distance.
+    """
+    ids1, ids2 = trim_common_affixes(ids1, ids2)
+    # Both distances are symmetric: loop over the shorter side, vectorize over the longer one
+    if len(ids1) > len(ids2):
+        ids1, ids2 = ids2, ids1
+    m, n = len(ids1), len(ids2)
+    if m == 0:
+        return _within(n, max_distance)
+
+    steps = np.arange(n + 1, dtype=np.int32)
+    prev2 = np.empty(n + 1, dtype=np.int32)
+    prev = steps.copy()
+    cur = np.empty(n + 1, dtype=np.int32)
+    t = np.empty(n + 1, dtype=np.int32)
+    eq_prev = None
+
+    for i in range(1, m + 1):
+        eq = ids2 == ids1[i - 1]
+        t[0] = i
+        # Substitution (or match) from the diagonal, deletion from above
+        np.add(prev[:-1], ~eq, out=t[1:], casting='unsafe')
+        np.minimum(t[1:], prev[1:] + 1, out=t[1:])
+        if transpositions and eq_prev is not None and n > 1:
+            # Transposition: ids1[i-1] == ids2[j-2] and ids1[i-2] == ids2[j-1]
+            swap = eq[:-1] & eq_prev[1:]
+            if swap.any():
+                np.minimum(t[2:], np.where(swap, prev2[:-2] + 1, t[2:]), out=t[2:])
+        # Insertion chain along the row
+        np.subtract(t, steps, out=cur)
+        np.minimum.accumulate(cur, out=cur)
+        cur += steps
+        if max_distance is not None and cur[i + n - m] > max_distance:
+            return None
+        prev2, prev, cur = prev, cur, prev2
+        eq_prev = eq
+
+    return _within(int(prev[n]), max_distance)
+
+
+def osa_distance_bitparallel(ids1, ids2, max_distance=None, transpositions=True):
+    """
+    Optimal string alignment distance with Hyyrö's bit-parallel extension of
+    Myers' algorithm.
+
+    The longer sequence is the bit pattern and is held in Python big ints, so
+    each column of the DP is a handful of word-parallel operations instead of
+    one Python step per cell: O(ceil(m/64) * n) machine-word work.
+
+    With max_distance, every 16th column reads the cell on the final diagonal
+    off the vertical deltas (a popcount) and stops once it exceeds the bound.
+    Without transpositions the transposition bits stay zero, which is Myers'
+    Levenshtein algorithm.
+
+    Args:
+    - ids1 (np.ndarray): Reference ids.
+    - ids2 (np.ndarray): Hypothesis ids.
+    - max_distance (int or None): Optional bound on the distance.
+    - transpositions (bool): False gives the plain Levenshtein distance.
+
+    Returns:
+    - int or None: The edit distance (same value as osa_distance_numpy), or
+      None when it exceeds max_distance.
+    """
+    ids1, ids2 = trim_common_affixes(ids1, ids2)
+    # Pattern = longer side, text = shorter side: fewer Python-level iterations
+    if len(ids1) < len(ids2):
+        ids1, ids2 = ids2, ids1
+    m, n = len(ids1), len(ids2)
+    if n == 0:
+        return _within(m, max_distance)
+
+    # Match masks: bit i of peq[token] is set when ids1[i] == token
+    peq = {}
+    for i, token in enumerate(ids1.tolist()):
+        peq[token] = peq.get(token, 0) | (1 << i)
+
+    mask = (1 << m) - 1
+    last = 1 << (m - 1)
+    vp, vn, d0, pm_prev = mask, 0, 0, 0
+    distance = m
+    # The final-diagonal cell of column j is at most j + m - n, so it cannot exceed the bound earlier
+    check = n + 1 if max_distance is None else max(1, max_distance - (m - n) + 1)
+
+    for j, token in enumerate(ids2.tolist(), 1):
+        pm = peq.get(token, 0)
+        # Transposition bits: a match here whose neighbour matched the previous column
+        tr = ((~d0 & pm) << 1) & pm_prev
+        d0 = (((((pm & vp) + vp) ^ vp) | pm | vn) & mask) | tr
+        hp = vn | (~(d0 | vp) & mask)
+        hn = d0 & vp
+        if hp & last:
+            distance += 1
+        elif hn & last:
+            distance -= 1
+        hp = ((hp << 1) | 1) & mask
+        hn = (hn << 1) & mask
+        vp = hn | (~(d0 | hp) & mask)
+        vn = hp & d0
+        if transpositions:
+            pm_prev = pm
+        if j == check:
+            # D[j + m - n][j] = j + (sum of the vertical deltas in rows 1 .. j + m - n)
+            diagonal = (1 << (j + m - n)) - 1
+            if j + (vp & diagonal).bit_count() - (vn & diagonal).bit_count() > max_distance:
+                return None
+            check += 16
+
+    return _within(distance, max_distance)
+
+
+def osa_lower_bound(ids1, ids2):
+    """
+    Cheap O(m + n) lower bound on the OSA distance.
+
+    Every edit changes the length by at most one, and every edit except a
+    transposition fixes at most one token of each side's multiset difference,
+    so the distance is at least the length difference and at least the larger
+    side of the bag-of-tokens difference.
+
+    Returns:
+    - int: A value <= osa_distance_numpy(ids1, ids2).
+    """
+    bound = abs(len(ids1) - len(ids2))
+    if len(ids1) == 0 or len(ids2) == 0:
+        return bound
+    size = int(max(ids1.max(), ids2.max())) + 1
+    surplus = np.bincount(ids1, minlength=size) - np.bincount(ids2, minlength=size)
+    return max(bound, int(surplus[surplus > 0].sum()), int(-surplus[surplus < 0].sum()))
+
+
+# Pairs longer than this are scored one by one instead of being padded into a bucket
+BATCH_MAX_LENGTH = 256
+# Upper bound on the cells of one (pairs x ref x hyp) comparison block
+BATCH_MAX_CELLS = 1 << 22
+
+
+def _bucket_length(length):
+    """Round a length up to the next power of two (minimum 4) for bucketing."""
+    size = 4
+    while size < length:
+        size <<= 1
+    return size
+
+
+def osa_distance_block(refs, hyps, transpositions=True):
+    """
+    OSA distances for a bucket of pairs padded into 2-D blocks.
+
+    The equality of every (ref token, hyp token) cell is computed up front as
+    one 3-D boolean block, then the DP sweeps the reference axis once while
+    every row update is vectorized across both the pairs and the hypothesis
+    axis.
+
+    Args:
+    - refs (list): Reference id arrays.
+    - hyps (list): Hypothesis id arrays, same length as refs.
+    - transpositions (bool): False gives plain Levenshtein distances.
+
+    Returns:
+    - np.ndarray: int32 distances, one per pair.
+    """
+    count = len(refs)
+    ref_lengths = np.fromiter((len(ref) for ref in refs), dtype=np.intp, count=count)
+    hyp_lengths = np.fromiter((len(hyp) for hyp in hyps), dtype=np.intp, count=count)
+    m, n = int(ref_lengths.max()), int(hyp_lengths.max())
+
+    # Distinct negative pads never match each other or a real token
+    ref_block = np.full((count, m), -1, dtype=np.int32)
+    hyp_block = np.full((count, n), -2, dtype=np.int32)
+    for k in range(count):
+        ref_block[k, :ref_lengths[k]] = refs[k]
+        hyp_block[k, :hyp_lengths[k]] = hyps[k]
+    return _osa_distance_padded(ref_block, hyp_block, ref_lengths, hyp_lengths, transpositions)
+
+
+def _osa_distance_padded(ref_block, hyp_block, ref_lengths, hyp_lengths, transpositions=True):
+    """osa_distance_block on blocks already padded with -1 (refs) and -2 (hyps)."""
+    count, m = ref_block.shape
+    n = hyp_block.shape[1]
+    eq_block = ref_block[:, :, None] == hyp_block[:, None, :]
+
+    rows = np.arange(count)
+    steps = np.arange(n + 1, dtype=np.int32)
+    prev2 = np.empty((count, n + 1), dtype=np.int32)
+    prev = np.broadcast_to(steps, (count, n + 1)).copy()
+    cur = np.empty((count, n + 1), dtype=np.int32)
+    t = np.empty((count, n + 1), dtype=np.int32)
+
+    # Cell (i, j) only depends on cells above and to the left of it, so each
+    # pair's answer can be read at (m_k, n_k) regardless of the padding
+    distances = np.empty(count, dtype=np.int32)
+    done = ref_lengths == 0
+    distances[done] = hyp_lengths[done]
+
+    for i in range(1, m + 1):
+        eq = eq_block[:, i - 1, :]
+        t[:, 0] = i
+        np.add(prev[:, :-1], ~eq, out=t[:, 1:], casting='unsafe')
+        np.minimum(t[:, 1:], prev[:, 1:] + 1, out=t[:, 1:])
+        if transpositions and i > 1 and n > 1:
+            swap = eq[:, :-1] & eq_block[:, i - 2, 1:]
+            if swap.any():
+                np.minimum(t[:, 2:], np.where(swap, prev2[:, :-2] + 1, t[:, 2:]), out=t[:, 2:])
+        np.subtract(t, steps, out=cur)
+        np.minimum.accumulate(cur, axis=1, out=cur)
+        cur += steps
+
+        done = ref_lengths == i
+        if done.any():
+            distances[done] = cur[rows[done], hyp_lengths[done]]
+        prev2, prev, cur = prev, cur, prev2
+
+    return distances
+
+
+# Row order of the per-cell operation counts in osa_edit_counts_block
+SUBSTITUTION, DELETION, INSERTION, TRANSPOSITION = range(4)
+
+
+def osa_edit_counts_block(refs, hyps):
+    """
+    OSA distances and edit-operation counts for a bucket of padded pairs.
+
+    Same sweep as osa_distance_block, but every cell also carries the
+    substitution / deletion / insertion / transposition counts of the path
+    that reached it, so the breakdown comes out of the scoring DP itself
+    without a backtrace. On ties the diagonal (match or substitution) wins,
+    then deletion, transposition and insertion.
+
+    Args:
+    - refs (list): Reference id arrays.
+    - hyps (list): Hypothesis id arrays, same length as refs.
+
+    Returns:
+    - np.ndarray: int32 array of shape (pairs, 4) with S, D, I, T counts.
+    """
+    count = len(refs)
+    ref_lengths = np.fromiter((len(ref) for ref in refs), dtype=np.intp, count=count)
+    hyp_lengths = np.fromiter((len(hyp) for hyp in hyps), dtype=np.intp, count=count)
+    m, n = int(ref_lengths.max()), int(hyp_lengths.max())
+
+    ref_block = np.full((count, m), -1, dtype=np.int32)
+    hyp_block = np.full((count, n), -2, dtype=np.int32)
+    for k in range(count):
+        ref_block[k, :ref_lengths[k]] = refs[k]
+        hyp_block[k, :hyp_lengths[k]] = hyps[k]
+    eq_block = ref_block[:, :, None] == hyp_block[:, None, :]
+
+    rows = np.arange(count)
+    steps = np.arange(n + 1, dtype=np.int32)
+    big = np.int32(np.iinfo(np.int32).max // 2)
+
+    # Row 0: every hypothesis token so far is an insertion
+    prev = np.broadcast_to(steps, (count, n + 1)).copy()
+    prev_ops = np.zeros((4, count, n + 1), dtype=np.int32)
+    prev_ops[INSERTION] = steps
+    prev2, prev2_ops = prev, prev_ops
+
+    counts = np.zeros((count, 4), dtype=np.int32)
+    done = ref_lengths == 0
+    counts[done, INSERTION] = hyp_lengths[done]
+
+    for i in range(1, m + 1):
+        eq = eq_block[:, i - 1, :]
+        t = np.empty((count, n + 1), dtype=np.int32)
+        t_ops = np.empty((4, count, n + 1), dtype=np.int32)
+
+        # Column 0: every reference token so far is a deletion
+        t[:, 0] = i
+        t_ops[:, :, 0] = 0
+        t_ops[DELETION, :, 0] = i
+
+        # Diagonal: match or substitution
+        t[:, 1:] = prev[:, :-1] + ~eq
+        t_ops[:, :, 1:] = prev_ops[:, :, :-1]
+        t_ops[SUBSTITUTION, :, 1:] += ~eq
+
+        # Deletion from the row above
+        better = prev[:, 1:] + 1 < t[:, 1:]
+        np.copyto(t[:, 1:], prev[:, 1:] + 1, where=better)
+        np.copyto(t_ops[:, :, 1:], prev_ops[:, :, 1:], where=better)
+        t_ops[DELETION, :, 1:] += better
+
+        # Transposition from two rows above
+        if i > 1 and n > 1:
+            swap = eq[:, :-1] & eq_block[:, i - 2, 1:]
+            better = swap & (prev2[:, :-2] + 1 < t[:, 2:])
+            if better.any():
+                np.copyto(t[:, 2:], prev2[:, :-2] + 1, where=better)
+                np.copyto(t_ops[:, :, 2:], prev2_ops[:, :, :-2], where=better)
+                t_ops[TRANSPOSITION, :, 2:] += better
+
+        # Insertion chain: cell j takes its own candidate unless some k < j
+        # beats it by more than the j - k insertions needed to get there
+        key = t - steps
+        running = np.minimum.accumulate(key, axis=1)
+        shifted = np.concatenate((np.full((count, 1), big, dtype=np.int32), running[:, :-1]), axis=1)
+        source = np.maximum.accumulate(np.where(key <= shifted, steps, 0), axis=1)
+        cur = np.take_along_axis(t, source, axis=1) + (steps - source)
+        cur_ops = np.take_along_axis(t_ops, np.broadcast_to(source, t_ops.shape), axis=2)
+        cur_ops[INSERTION] += steps - source
+
+        done = ref_lengths == i
+        if done.any():
+            counts[done] = cur_ops[:, rows[done], hyp_lengths[done]].T
+        prev2, prev2_ops, prev, prev_ops = prev, prev_ops, cur, cur_ops
+
+    return counts
+
+
+def osa_edit_counts_batch(id_pairs):
+    """
+    Edit-operation counts for many (ref ids, hyp ids) pairs.
+
+    Pairs are trimmed of common affixes (shared tokens are matches) and
+    bucketed by padded length like osa_distance_batch; each bucket is one
+    osa_edit_counts_block sweep.
+
+    Returns:
+    - list: (substitutions, deletions, insertions, transpositions) tuples in
+      the same order as id_pairs.
+    """
+    counts = [(0, 0, 0, 0)] * len(id_pairs)
+    buckets = {}
+
+    for index, (ids1, ids2) in enumerate(id_pairs):
+        ids1, ids2 = trim_common_affixes(ids1, ids2)
+        if len(ids1) == 0 or len(ids2) == 0:
+            counts[index] = (0, len(ids1), len(ids2), 0)
+        else:
+            key = (_bucket_length(len(ids1)), _bucket_length(len(ids2)))
+            buckets.setdefault(key, []).append((index, ids1, ids2))
+
+    for (m, n), members in buckets.items():
+        # Five int32 rows of state per cell instead of one
+        chunk = max(1, BATCH_MAX_CELLS // (5 * m * n))
+        for start in range(0, len(members), chunk):
+            part = members[start:start + chunk]
+            block = osa_edit_counts_block([ids1 for _, ids1, _ in part], [ids2 for _, _, ids2 in part])
+            for (index, _, _), row in zip(part, block.tolist()):
+                counts[index] = tuple(row)
+
+    return counts
+
+
+def osa_distance_banded_block(refs, hyps, max_distances, transpositions=True):
+    """
+    Thresholded OSA distances for a bucket of pairs, banded and batched.
+
+    Each pair only fills the Ukkonen band of diagonals j - i in
+    [n - m - k, k] (with m <= n): a cell outside it cannot lie on a path of
+    cost <= k to (m, n), since both halves of the path pay for their own
+    length difference. Rows are stored in diagonal coordinates, so the band of
+    every pair is a fixed-width slice and one row update is vectorized across
+    the whole bucket. Values are capped at k + 1 and the sweep stops once every
+    pair is finished or has two consecutive rows (transpositions skip one row)
+    entirely over its bound.
+
+    Args:
+    - refs (list): Reference id arrays, each no longer than its hypothesis.
+    - hyps (list): Hypothesis id arrays.
+    - max_distances (list): Per-pair bound k, at least the length difference.
+    - transpositions (bool): False gives plain Levenshtein distances.
+
+    Returns:
+    - list: The distance of each pair, or None when it exceeds its bound.
+    """
+    count = len(refs)
+    ref_lengths = np.fromiter((len(ref) for ref in refs), dtype=np.intp, count=count)
+    hyp_lengths = np.fromiter((len(hyp) for hyp in hyps), dtype=np.intp, count=count)
+    bounds = np.asarray(max_distances, dtype=np.intp)
+    caps = (bounds + 1).astype(np.int32)[:, None]
+    low_diags = (hyp_lengths - ref_lengths - bounds)[:, None]
+    widths = 2 * bounds - (hyp_lengths - ref_lengths) + 1
+    m, n, width = int(ref_lengths.max()), int(hyp_lengths.max()), int(widths.max())
+
+    ref_block = np.full((count, m), -1, dtype=np.int32)
+    hyp_block = np.full((count, n), -2, dtype=np.int32)
+    for k in range(count):
+        ref_block[k, :ref_lengths[k]] = refs[k]
+        hyp_block[k, :hyp_lengths[k]] = hyps[k]
+
+    rows = np.arange(count)[:, None]
+    offsets = np.arange(width, dtype=np.intp)[None, :]
+    in_band = offsets < widths[:, None]
+
+    def columns(i):
+        """Column j of every band cell in row i, and the cells outside the matrix."""
+        j = i + low_diags + offsets
+        return j, ~in_band | (j < 0) | (j > hyp_lengths[:, None])
+
+    j, outside = columns(0)
+    prev = np.where(outside, caps, np.minimum(j, caps)).astype(np.int32)
+    prev2 = np.broadcast_to(caps, (count, width)).copy()
+    cur = np.empty((count, width), dtype=np.int32)
+    steps = offsets.astype(np.int32)
+
+    distances = [None] * count
+    finished = np.zeros(count, dtype=bool)
+    prev_alive = np.ones(count, dtype=bool)
+
+    for i in range(1, m + 1):
+        j, outside = columns(i)
+        hyp_prev = hyp_block[rows, np.clip(j - 1, 0, n - 1)]
+        ref_token = ref_block[:, i - 1][:, None]
+
+        # Substitution (or match) from (i-1, j-1): same diagonal, previous row
+        np.add(prev, hyp_prev != ref_token, out=cur, casting='unsafe')
+        # Deletion from (i-1, j): next diagonal, previous row
+        np.minimum(cur[:, :-1], prev[:, 1:] + 1, out=cur[:, :-1])
+        if transpositions and i > 1:
+            # Transposition from (i-2, j-2): same diagonal, two rows up
+            swap = (hyp_block[rows, np.clip(j - 2, 0, n - 1)] == ref_token) & (hyp_prev == ref_block[:, i - 2][:, None]) & (j >= 2)
+            if swap.any():
+                np.minimum(cur, np.where(swap, prev2 + 1, cur), out=cur)
+        np.copyto(cur, np.minimum(i, caps), where=(j == 0))
+        np.copyto(cur, caps, where=outside)
+        # Insertion chain from (i, j-1): previous diagonal, same row
+        cur -= steps
+        np.minimum.accumulate(cur, axis=1, out=cur)
+        cur += steps
+        np.minimum(cur, caps, out=cur)
+        np.copyto(cur, caps, where=outside)
+
+        done = (ref_lengths == i) & ~finished
+        for k in np.flatnonzero(done):
+            distance = int(cur[k, bounds[k]])
+            distances[k] = distance if distance <= bounds[k] else None
+        finished |= done
+
+        alive = (cur <= caps - 1).any(axis=1)
+        finished |= ~alive & ~prev_alive
+        if finished.all():
+            break
+        prev_alive = alive
+        prev2, prev, cur = prev, cur, prev2
+
+    return distances
+
+
+def osa_distance_banded(ids1, ids2, max_distance, transpositions=True):
+    """
+    Thresholded OSA distance: the exact distance if it is <= max_distance,
+    otherwise None.
+
+    The pair is first rejected by length difference and by the
+    bag-of-tokens lower bound; only the rest run the banded DP of
+    osa_distance_banded_block.
+
+    Returns:
+    - int or None: The distance, or None when it exceeds max_distance.
+    """
+    if abs(len(ids1) - len(ids2)) > max_distance:
+        return None
+    ids1, ids2 = trim_common_affixes(ids1, ids2)
+    if len(ids1) > len(ids2):
+        ids1, ids2 = ids2, ids1
+    if len(ids1) == 0:
+        return len(ids2) if len(ids2) <= max_distance else None
+    if osa_lower_bound(ids1, ids2) > max_distance:
+        return None
+    return osa_distance_banded_block([ids1], [ids2], [max_distance], transpositions)[0]
+
+
+def osa_distance_banded_exact(ids1, ids2, max_distance=None, transpositions=True):
+    """
+    Exact OSA distance from the banded DP with a doubling bound (Ukkonen).
+
+    Starts from osa_lower_bound and doubles the band until the distance fits,
+    so the work is O(short side * distance): fastest for long, near-identical
+    pairs. With max_distance, the band is that bound (osa_distance_banded).
+
+    Returns:
+    - int or None: The edit distance, or None when it exceeds max_distance.
+    """
+    if max_distance is not None:
+        return osa_distance_banded(ids1, ids2, max_distance, transpositions)
+    ids1, ids2 = trim_common_affixes(ids1, ids2)
+    if len(ids1) > len(ids2):
+        ids1, ids2 = ids2, ids1
+    if len(ids1) == 0:
+        return len(ids2)
+    bound = max(1, osa_lower_bound(ids1, ids2))
+    while True:
+        # The distance never exceeds the longer length, so that bound always succeeds
+        bound = min(bound, len(ids2))
+        distance = osa_distance_banded_block([ids1], [ids2], [bound], transpositions)[0]
+        if distance is not None:
+            return distance
+        bound *= 2
+
+
+def osa_distance_rapidfuzz(ids1, ids2, max_distance=None, transpositions=True):
+    """
+    OSA (or, without transpositions, Levenshtein) distance from rapidfuzz's
+    C++ implementation (only registered when rapidfuzz is installed).
+    max_distance is passed on as its score_cutoff.
+
+    Returns:
+    - int or None: The edit distance, or None when it exceeds max_distance.
+    """
+    metric = _rapidfuzz_osa if transpositions else _rapidfuzz_levenshtein
+    return _within(metric.distance(ids1.tolist(), ids2.tolist(), score_cutoff=max_distance), max_distance)
+
+
+def _bucket_lengths(lengths):
+    """_bucket_length of every entry of an int array."""
+    return np.maximum(4, 2 ** np.ceil(np.log2(np.maximum(lengths, 1))).astype(np.intp))
+
+
+def _common_affix_lengths(flat, starts1, lengths1, starts2, lengths2):
+    """
+    trim_common_affixes for many pairs at once: the lengths of each pair's
+    common prefix and (within the rest) common suffix.
+
+    Both sides of every pair are given by their starts and lengths in one flat
+    id array; all positions of all pairs are compared in a few vectorized passes.
+    """
+    prefixes = np.minimum(lengths1, lengths2)
+    suffixes = np.zeros_like(prefixes)
+    for suffix in (False, True):
+        # The common suffix is searched in what the prefix left over
+        limits = prefixes if not suffix else np.minimum(lengths1, lengths2) - prefixes
+        total = int(limits.sum())
+        if total == 0:
+            continue
+        pairs = np.repeat(np.arange(len(limits)), limits)
+        positions = np.arange(total) - np.repeat(np.cumsum(limits) - limits, limits)
+        if suffix:
+            index1 = (starts1 + lengths1 - 1)[pairs] - positions
+            index2 = (starts2 + lengths2 - 1)[pairs] - positions
+        else:
+            index1, index2 = starts1[pairs] + positions, starts2[pairs] + positions
+        differ = np.flatnonzero(flat[index1] != flat[index2])
+        # First differing position of each pair that has one (pairs are in order)
+        first = differ[np.flatnonzero(np.diff(pairs[differ], prepend=-1))]
+        lengths = suffixes if suffix else prefixes
+        lengths[:] = limits
+        lengths[pairs[first]] = positions[first]
+    return prefixes, suffixes
+
+
+def _gather_block(flat, starts, lengths, width, pad):
+    """A (pairs, width) block of the given slices of flat, padded with pad."""
+    offsets = np.arange(width)
+    block = flat[np.minimum(starts[:, None] + offsets, len(flat) - 1)].astype(np.int32)
+    block[offsets >= lengths[:, None]] = pad
+    return block
+
+
+def osa_distance_batch(id_pairs, kernel='auto', max_distances=None, transpositions=True):
+    """
+    OSA distances for many (ref ids, hyp ids) pairs at once.
+
+    Pairs are trimmed of common affixes, bucketed by their padded lengths and
+    each bucket is scored with one osa_distance_block sweep. Pairs longer than
+    BATCH_MAX_LENGTH fall back to the named single-pair kernel. Trimming,
+    planning and bucketing run on all pairs at once over flat id arrays, so
+    short pairs only pay for their share of the vectorized passes.
+
+    With max_distances, pairs whose length difference exceeds their bound are
+    rejected in one vectorized pass. The rest are routed as in the exact case;
+    where osa_lower_bound is modelled at most 1/LOWER_BOUND_PAYOFF of the
+    pair's scoring cost it is tried first, single-pair kernels stop early at
+    the bound, and bucketed pairs are compared with it after the sweep. Every
+    distance above its bound is None.
+
+    With kernel='auto', a pair whose planned single-pair kernel is modelled
+    cheaper than its share of a bucket sweep (KERNEL_COSTS['block']) is scored
+    with that kernel instead.
+
+    With transpositions=False the distances are plain Levenshtein, from the
+    same buckets and single-pair kernels (all of them keep O(n) rows).
+
+    Args:
+    - id_pairs (list): List of (ids1, ids2) int arrays.
+    - kernel (str): Single-pair kernel used for oversized pairs.
+    - max_distances (list or None): Optional per-pair distance bounds.
+    - transpositions (bool): False gives plain Levenshtein distances.
+
+    Returns:
+    - list: int distances (or None above the bound) in the same order as id_pairs.
+    """
+    count = len(id_pairs)
+    if count == 0:
+        return []
+    single = get_distance_kernel(kernel)
+    # The planner may also send a pair to a single-pair kernel instead of a bucket
+    planned = kernel == 'auto'
+
+    # Both sides of every pair in one flat array; side 2 starts after side 1
+    refs, hyps = [ids1 for ids1, _ in id_pairs], [ids2 for _, ids2 in id_pairs]
+    lengths1 = np.fromiter(map(len, refs), dtype=np.intp, count=count)
+    lengths2 = np.fromiter(map(len, hyps), dtype=np.intp, count=count)
+    flat = np.concatenate(refs + hyps)
+    starts1 = np.cumsum(lengths1) - lengths1
+    starts2 = np.cumsum(lengths2) - lengths2 + int(lengths1.sum())
+    prefixes, suffixes = _common_affix_lengths(flat, starts1, lengths1, starts2, lengths2)
+    starts1, starts2 = starts1 + prefixes, starts2 + prefixes
+    lengths1, lengths2 = lengths1 - prefixes - suffixes, lengths2 - prefixes - suffixes
+
+    # Short side first, as the block kernel expects
+    swap = lengths1 > lengths2
+    short_starts, long_starts = np.where(swap, starts2, starts1), np.where(swap, starts1, starts2)
+    shorts, longs = np.minimum(lengths1, lengths2), np.maximum(lengths1, lengths2)
+    distances = np.where(shorts == 0, longs, -1)
+
+    # Route every pair to a bucket sweep or to a single-pair kernel
+    todo = distances < 0
+    in_block = todo & (longs <= BATCH_MAX_LENGTH)
+    names = [name for name in KERNEL_COSTS if name in DISTANCE_KERNELS]
+    # Modelled seconds to score each pair where it is routed (for the lower-bound screen)
+    route_costs = None
+    if planned and names:
+        # plan_kernel and the bucket-or-single choice for every pair at once
+        costs = np.stack([kernel_cost(name, shorts, longs) for name in names])
+        best = costs.argmin(axis=0)
+        route_costs = costs.min(axis=0)
+        if 'block' in KERNEL_COSTS:
+            block_costs = kernel_cost('block', _bucket_lengths(shorts), _bucket_lengths(longs))
+            in_block &= route_costs >= block_costs
+            route_costs = np.minimum(route_costs, block_costs)
+    elif kernel in KERNEL_COSTS:
+        route_costs = kernel_cost(kernel, shorts, longs)
+
+    bounds = None
+    if max_distances is not None:
+        bounded = np.fromiter((bound is not None for bound in max_distances), dtype=bool, count=count)
+        bounds = np.fromiter((-1 if bound is None else bound for bound in max_distances), dtype=np.intp, count=count)
+        # The distance is at least the length difference; any value over the bound reads as None below
+        rejected = todo & bounded & (longs - shorts > bounds)
+        distances[rejected] = longs[rejected]
+        todo &= ~rejected
+        if route_costs is not None and 'lower_bound' in KERNEL_COSTS:
+            screened = todo & bounded & (route_costs >= LOWER_BOUND_PAYOFF * kernel_cost('lower_bound', shorts, longs))
+            for index, start1, length1, start2, length2 in zip(
+                    np.flatnonzero(screened).tolist(), short_starts[screened].tolist(), shorts[screened].tolist(),
+                    long_starts[screened].tolist(), longs[screened].tolist()):
+                if osa_lower_bound(flat[start1:start1 + length1], flat[start2:start2 + length2]) > bounds[index]:
+                    distances[index] = longs[index]
+                    todo[index] = False
+        in_block &= todo
+
+    results = {}
+    singles = np.flatnonzero(todo & ~in_block)
+    kernels = [DISTANCE_KERNELS[names[choice]] for choice in best[singles].tolist()] if planned and names else None
+    limits = [None] * len(singles) if bounds is None else [None if bound < 0 else bound for bound in bounds[singles].tolist()]
+    for position, (index, start1, length1, start2, length2) in enumerate(zip(
+            singles.tolist(), short_starts[singles].tolist(), shorts[singles].tolist(),
+            long_starts[singles].tolist(), longs[singles].tolist())):
+        ids1, ids2 = flat[start1:start1 + length1], flat[start2:start2 + length2]
+        pair_kernel = kernels[position] if kernels is not None else single
+        results[index] = pair_kernel(ids1, ids2, limits[position], transpositions)
+
+    members = np.flatnonzero(in_block)
+    if len(members):
+        keys = _bucket_lengths(shorts[members]) * (BATCH_MAX_LENGTH + 1) + _bucket_lengths(longs[members])
+        for key in np.unique(keys).tolist():
+            bucket = members[keys == key]
+            m, n = divmod(key, BATCH_MAX_LENGTH + 1)
+            chunk = max(1, BATCH_MAX_CELLS // (m * n))
+            for start in range(0, len(bucket), chunk):
+                part = bucket[start:start + chunk]
+                ref_block = _gather_block(flat, short_starts[part], shorts[part], int(shorts[part].max()), -1)
+                hyp_block = _gather_block(flat, long_starts[part], longs[part], int(longs[part].max()), -2)
+                distances[part] = _osa_distance_padded(ref_block, hyp_block, shorts[part], longs[part], transpositions)
+
+    distances = distances.tolist()
+    for index, distance in results.items():
+        distances[index] = distance
+    if max_distances is not None:
+        distances = [None if distance is None or (bound is not None and distance > bound) else distance
+                     for distance, bound in zip(distances, max_distances)]
+    return distances
+
+# Kernels selectable by name from word_list_error_rate and WERCalculator
+DISTANCE_KERNELS = {
+    'python': osa_distance_python,
+    'numpy': osa_distance_numpy,
+    'bitparallel': osa_distance_bitparallel,
+    'banded': osa_distance_banded_exact,
+}
+if _rapidfuzz_osa is not None:
+    DISTANCE_KERNELS['rapidfuzz'] = osa_distance_rapidfuzz
+
+# Per-kernel cost model: seconds ~= fixed + per_row * short + per_cell * short * long,
+# with short/long the trimmed pair lengths; 'block' is the per-pair share of a
+# bucket sweep in osa_distance_batch and 'lower_bound' is osa_lower_bound.
+# Fitted by calibrate_kernel_costs on synthetic pairs with 20% errors;
+# recalibrate on the target machine with benchmarks/calibrate_kernels.py and
+# load the result with load_kernel_costs.
+KERNEL_COSTS = {
+    'python': (1.05e-05, 9.98e-07, 4.00e-07),
+    'numpy': (4.35e-06, 9.96e-06, 4.44e-09),
+    'bitparallel': (7.91e-06, 1.34e-06, 7.29e-10),
+    'banded': (4.25e-05, 8.27e-05, 0.0),
+    'rapidfuzz': (8.06e-07, 3.99e-08, 1.30e-10),
+    'block': (1.11e-06, 1.15e-07, 6.23e-09),
+    'lower_bound': (6.63e-06, 6.06e-09, 0.0),
+}
+# osa_distance_batch tries osa_lower_bound on a bounded pair when it is modelled
+# at most this fraction of the pair's scoring cost, i.e. when rejecting one
+# pair in LOWER_BOUND_PAYOFF pays for the screen
+LOWER_BOUND_PAYOFF = 8
+
+
+def kernel_cost(name, short, long, costs=None):
+    """
+    Modelled seconds for scoring one pair of the given lengths with a kernel
+    (or 'block' for the per-pair share of a batched bucket).
+    """
+    fixed, per_row, per_cell = (KERNEL_COSTS if costs is None else costs)[name]
+    return fixed + per_row * short + per_cell * short * long
+
+
+def plan_kernel(short, long, costs=None):
+    """
+    Pick the kernel with the lowest modelled cost for a pair of the given lengths.
+
+    Args:
+    - short (int): Length of the shorter (trimmed) sequence.
+    - long (int): Length of the longer (trimmed) sequence.
+    - costs (dict or None): Kernel name -> (fixed, per_row, per_cell);
+      defaults to KERNEL_COSTS. Kernels that are not registered are skipped.
+
+    Returns:
+    - str: The kernel name.
+    """
+    costs = KERNEL_COSTS if costs is None else costs
+    best, best_cost = 'numpy', None
+    for name in costs:
+        if name not in DISTANCE_KERNELS:
+            continue
+        cost = kernel_cost(name, short, long, costs)
+        if best_cost is None or cost < best_cost:
+            best, best_cost = name, cost
+    return best
+
+
+def osa_distance_auto(ids1, ids2, max_distance=None, transpositions=True):
+    """
+    OSA distance with the kernel chosen per pair by plan_kernel.
+
+    Returns:
+    - int or None: The edit distance, or None when it exceeds max_distance.
+    """
+    ids1, ids2 = trim_common_affixes(ids1, ids2)
+    if len(ids1) == 0 or len(ids2) == 0:
+        return _within(len(ids1) + len(ids2), max_distance)
+    short, long = sorted((len(ids1), len(ids2)))
+    return DISTANCE_KERNELS[plan_kernel(short, long)](ids1, ids2, max_distance, transpositions)
+
+
+def calibrate_kernel_costs(lengths=(4, 8, 16, 32, 64, 128, 256, 512, 1024), error_rate=0.2, repeat=3, seed=0):
+    """
+    Micro-benchmark every registered kernel and fit its cost model.
+
+    Each kernel is timed on random pairs of the given lengths (equal length and
+    1:4 shapes) and (fixed, per_row, per_cell) is a non-negative least-squares
+    fit of the timings. The 'block' entry is the per-pair share of one
+    osa_distance_block sweep over a full bucket, as used by osa_distance_batch,
+    and 'lower_bound' times osa_lower_bound.
+
+    Args:
+    - lengths (tuple): Longer-side lengths to time.
+    - error_rate (float): Share of positions substituted in the hypothesis.
+    - repeat (int): Timings per point; the fastest is used.
+    - seed (int): Seed of the random pairs.
+
+    Returns:
+    - dict: Kernel name -> (fixed, per_row, per_cell) in seconds.
+    """
+    rng = np.random.default_rng(seed)
+    pairs = []
+    for long in lengths:
+        for short in sorted({long, max(1, long // 4)}):
+            ids1 = rng.integers(0, 50, size=short).astype(np.int32)
+            ids2 = np.resize(ids1, long)
+            noisy = rng.random(long) < error_rate
+            # Differ at both ends so trim_common_affixes keeps the full pair
+            noisy[[0, -1]] = True
+            ids2[noisy] = rng.integers(50, 100, size=int(noisy.sum()))
+            pairs.append((ids1, ids2))
+
+    def fit(points):
+        """Fit the cost model to (short, columns, run) points; run() scores some pairs and returns how many."""
+        features, timings = [], []
+        for short, columns, run in points:
+            number = max(1, 20000 // (short * columns))
+            best = None
+            for _ in range(repeat):
+                start = time.perf_counter()
+                scored = sum(run() for _ in range(number))
+                elapsed = (time.perf_counter() - start) / scored
+                best = elapsed if best is None else min(best, elapsed)
+            features.append((1.0, short, short * columns))
+            timings.append(best)
+        features, timings = np.asarray(features), np.asarray(timings)
+        # Relative error matters at every size, so weight each point by 1 / time
+        weights = 1.0 / timings
+        coefficients = np.linalg.lstsq(features * weights[:, None], timings * weights, rcond=None)[0]
+        return tuple(float(c) for c in np.maximum(coefficients, 0.0))
+
+    def single(kernel, ids1, ids2):
+        def run():
+            kernel(ids1, ids2)
+            return 1
+        return len(ids1), len(ids2), run
+
+    def block(ids1, ids2):
+        count = max(1, min(256, BATCH_MAX_CELLS // (len(ids1) * len(ids2))))
+
+        def run():
+            osa_distance_block([ids1] * count, [ids2] * count)
+            return count
+        return len(ids1), len(ids2), run
+
+    costs = {name: fit([single(kernel, ids1, ids2) for ids1, ids2 in pairs]) for name, kernel in DISTANCE_KERNELS.items()}
+    costs['block'] = fit([block(ids1, ids2) for ids1, ids2 in pairs if len(ids2) <= BATCH_MAX_LENGTH])
+    costs['lower_bound'] = fit([single(osa_lower_bound, ids1, ids2) for ids1, ids2 in pairs])
+    return costs
+
+
+def load_kernel_costs(path):
+    """
+    Replace KERNEL_COSTS with the calibration saved at path (JSON from
+    benchmarks/calibrate_kernels.py).
+    """
+    with open(path, 'r', encoding='utf-8') as file:
+        costs = json.load(file)
+    KERNEL_COSTS.clear()
+    KERNEL_COSTS.update({name: tuple(values) for name, values in costs.items()})
+
+
+def get_distance_kernel(name):
+    """
+    Look up an edit-distance kernel by name; 'auto' picks one per pair with plan_kernel.
+
+    Raises:
+    - ValueError: If the kernel name is unknown.
+    """
+    if name == 'auto':
+        return osa_distance_auto
+    try:
+        return DISTANCE_KERNELS[name]
+    except KeyError:
+        raise ValueError(f"Unknown edit-distance kernel '{name}'. Choose from {['auto'] + sorted(DISTANCE_KERNELS)}.")
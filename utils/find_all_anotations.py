@@ -1,4 +1,5 @@
 import re
+from bisect import bisect_right
 
 def find_retracing_markers(text):
     retracing_with_brackets_pattern = r'(<[^>]+> \[//\])|(<[^>]+> \[/\])'
@@ -103,25 +104,201 @@ def find_cheating_content(text):
     
     return matches
 
+# Annotation categories of scan_annotations, in the order collect_all_matches lists the find_* functions
+ANNOTATION_CATEGORIES = ('retracing', 'interposed', 'overlap', 'filler', 'frozen_phrase', 'replacement',
+                         'omitted', 'fragment', 'annotation', 'nonverbal', 'shortened', 'bracketed')
+(RETRACING, INTERPOSED, OVERLAP, FILLER, FROZEN_PHRASE, REPLACEMENT,
+ OMITTED, FRAGMENT, ANNOTATION, NONVERBAL, SHORTENED, BRACKETED) = range(len(ANNOTATION_CATEGORIES))
+
+# The one pass over a text: whitespace-separated chunks of word characters and parentheses
+# (find_shortened_words candidates), other word runs, and the characters annotations start with
+SCAN_PATTERN = re.compile(r'(?P<chunk>(?<!\S)[\w()]+(?!\S))|(?P<word>\w+)|(?P<anchor>[<&\[])')
+WORD_PATTERN = re.compile(r'\w+')
+
+# Anchored patterns tried at an anchor; each only runs over characters no other anchor of its kind reaches
+OVERLAP_PATTERN = re.compile(r'<[a-zA-Z ]+> \[([<>])\]')
+INTERPOSED_PATTERN = re.compile(r'&\*[A-Z]{3}:[a-zA-Z]+')
+FILLER_PATTERN = re.compile(r'&-[a-zA-Z_]+')
+FRAGMENT_PATTERN = re.compile(r'&\+\w+')
+NONVERBAL_PATTERN = re.compile(r'&=\w+(:\w+)?')
+RETRACING_FILLER_TAIL_PATTERN = re.compile(r' &-[a-z]+ \[')
+
+
+class _NextIndex:
+    """First index of a character at or after a position, remembering the last answer so rising queries scan each character once."""
+
+    def __init__(self, text, char):
+        self.text = text
+        self.char = char
+        self.start = 0
+        self.found = -1
+
+    def __call__(self, position):
+        # The last answer holds for every position between its query and itself
+        if not self.start <= position <= self.found:
+            found = self.text.find(self.char, position)
+            self.start, self.found = position, len(self.text) if found < 0 else found
+        return self.found
+
+
+def _is_shortened(chunk):
+    # Helper function to fullmatch find_shortened_words' \(?\w*\(?\w+\)?\w*\)? on a chunk of word characters and parentheses, without backtracking
+    opens = [index for index, char in enumerate(chunk) if char == '(']
+    closes = [index for index, char in enumerate(chunk) if char == ')']
+    if not opens and not closes or len(opens) > 2 or len(closes) > 2:
+        return False
+    if opens and closes and opens[-1] > closes[0]:
+        return False
+    if len(opens) == 2 and opens[0] != 0 or len(closes) == 2 and closes[-1] != len(chunk) - 1:
+        return False
+    # \w+ sits between the last '(' and the first ')'
+    return (closes[0] if closes else len(chunk)) - (opens[-1] if opens else -1) > 1
+
+
+def _is_word_char(char):
+    # Helper function to test one character against \w
+    return char.isalnum() or char == '_'
+
+
+def _retracing_filler_tails(text):
+    # Helper function to list the ')' that end \(.*?\) in find_retracing_markers' filler pattern, with the end of the match
+    positions, ends = [], []
+    next_close, next_newline = _NextIndex(text, ']'), _NextIndex(text, '\n')
+    position = text.find(')')
+    while position >= 0:
+        tail = RETRACING_FILLER_TAIL_PATTERN.match(text, position + 1)
+        # \[.*?\] closes at the first ']' unless a newline comes first
+        if tail and next_close(tail.end()) < next_newline(tail.end()):
+            positions.append(position)
+            ends.append(next_close(tail.end()) + 1)
+        position = text.find(')', position + 1)
+    return positions, ends
+
+
+def scan_annotations(text):
+    """
+    Find the annotations of every category in one pass over a text.
+
+    Gives the same matches as the find_* functions, each of which runs
+    re.findall over the whole text (or re.fullmatch over every word), but in
+    time linear in the text: SCAN_PATTERN visits each character once and
+    every match is read off at the anchor it starts from. Patterns that
+    search ahead for a closing character (<[^>]+>, \[.*?\], \[: [^\]]+\])
+    look it up with _NextIndex instead, so a run of unclosed '<' or '[' is not
+    rescanned from each one. As with findall, matches of one pattern do not
+    overlap; matches of different patterns may.
+
+    Args:
+    - text (str): A line or a joined text.
+
+    Returns:
+    - list: (category, start, end) per match, category indexing ANNOTATION_CATEGORIES.
+    """
+    spans = []
+    next_gt, next_close = _NextIndex(text, '>'), _NextIndex(text, ']')
+    next_newline, next_paren_newline = _NextIndex(text, '\n'), _NextIndex(text, '\n')
+    filler_tails = None
+    # End of the last match of each findall pattern that can overlap itself
+    retracing_end = retracing_filler_end = replacement_end = annotation_end = bracketed_end = 0
+
+    for match in SCAN_PATTERN.finditer(text):
+        kind = match.lastgroup
+        start, end = match.span()
+
+        if kind != 'anchor':
+            if kind == 'chunk':
+                chunk = match.group()
+                if '(' not in chunk and ')' not in chunk:
+                    words = [(start, end)]
+                else:
+                    if _is_shortened(chunk):
+                        spans.append((SHORTENED, start, end))
+                    words = [word.span() for word in WORD_PATTERN.finditer(chunk)]
+                    words = [(start + word_start, start + word_end) for word_start, word_end in words]
+            else:
+                words = [(start, end)]
+            for word_start, word_end in words:
+                if text.startswith(' [/]', word_end):
+                    spans.append((RETRACING, word_start, word_end + 4))
+                if word_end - word_start > 2 and '_' in text[word_start + 1:word_end - 1]:
+                    spans.append((FROZEN_PHRASE, word_start, word_end))
+                if text[word_start] == '0' and word_end - word_start > 1:
+                    spans.append((OMITTED, word_start, word_end))
+            continue
+
+        char = text[start]
+        if char == '<':
+            found = OVERLAP_PATTERN.match(text, start)
+            if found:
+                spans.append((OVERLAP, start, found.end()))
+            gt = next_gt(start + 1)
+            if gt == len(text) or gt == start + 1:
+                continue
+            if start >= retracing_end:
+                for marker in (' [//]', ' [/]'):
+                    if text.startswith(marker, gt + 1):
+                        retracing_end = gt + 1 + len(marker)
+                        spans.append((RETRACING, start, retracing_end))
+                        break
+            if start >= retracing_filler_end and text.startswith(' [/] (', gt + 1):
+                if filler_tails is None:
+                    filler_tails = _retracing_filler_tails(text)
+                paren = gt + 5
+                # \(.*?\) ends at the first ')' followed by the rest of the pattern, on the same line
+                index = bisect_right(filler_tails[0], paren)
+                if index < len(filler_tails[0]) and filler_tails[0][index] < next_paren_newline(paren + 1):
+                    retracing_filler_end = filler_tails[1][index]
+                    spans.append((RETRACING, start, retracing_filler_end))
+
+        elif char == '&':
+            marker = text[start + 1:start + 2]
+            if marker == '*':
+                found = INTERPOSED_PATTERN.match(text, start)
+                if found:
+                    spans.append((INTERPOSED, start, found.end()))
+            elif marker == '-':
+                found = FILLER_PATTERN.match(text, start)
+                if found:
+                    spans.append((FILLER, start, found.end()))
+            elif marker == '+':
+                found = FRAGMENT_PATTERN.match(text, start)
+                if found:
+                    spans.append((FRAGMENT, start, found.end()))
+            elif marker == '=':
+                found = NONVERBAL_PATTERN.match(text, start)
+                # findall returns the (:\w+)? group, not the whole match
+                if found and found.group(1):
+                    spans.append((NONVERBAL, *found.span(1)))
+
+        else:
+            close = next_close(start + 1)
+            if close == len(text):
+                continue
+            if start >= replacement_end and text.startswith('[: ', start) and close > start + 3:
+                replacement_end = close + 1
+                spans.append((REPLACEMENT, start, replacement_end))
+            # find_annotations matches from the yyy / xxx before the bracket and keeps the bracket
+            if (text.startswith('[=! ', start) and close > start + 4 and start - 4 >= annotation_end
+                    and text[start - 4:start] in ('yyy ', 'xxx ') and (start == 4 or not _is_word_char(text[start - 5]))):
+                annotation_end = close + 1
+                spans.append((ANNOTATION, start, annotation_end))
+            if start >= bracketed_end and close < next_newline(start + 1):
+                bracketed_end = close + 1
+                spans.append((BRACKETED, start, bracketed_end))
+    return spans
+
+
 def collect_all_matches(text):
-    all_matches = []
-    all_matches += find_retracing_markers(text)
-    all_matches += find_interposed_words(text)
-    all_matches += find_overlap_markers(text)
-    all_matches += find_fillers(text)
-    # all_matches += find_quotation_markers(text)
-    all_matches += find_frozen_phrases(text)
-    all_matches += find_errors_and_replacements(text)
-    all_matches += find_omitted_words(text)
-    all_matches += find_word_fragments(text)
-    all_matches += find_annotations(text)
-    all_matches += find_nonverbal_activities(text)
-    all_matches += find_shortened_words(text)
-    all_matches += find_cheating_content(text)
-
-    # Remove duplicates and empty values
-    all_matches = list(set(filter(None, all_matches)))
-    return all_matches
+    """
+    The distinct annotations of a text, as found by the find_* functions.
+
+    Args:
+    - text (str): The text to scan (see scan_annotations).
+
+    Returns:
+    - list: The distinct non-empty matches, in no particular order.
+    """
+    return list({text[start:end] for _, start, end in scan_annotations(text)})
 
 # Example transcript text
 transcript_text = """
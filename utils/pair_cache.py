@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+'''
+@File    :   pair_cache.py
+@Desc    :   Content-addressed LRU memo cache for per-line-pair results
+'''
+
+# here put the import lib
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Entries kept by the shared cache before the least recently used are evicted
+DEFAULT_PAIR_CACHE_SIZE = 100_000
+
+
+def pair_key(kind, seq1, seq2):
+    """
+    Content hash of one (reference, hypothesis) token pair.
+
+    Tokens are joined with unit separators (control characters never occur in
+    byte-level BPE tokens), so equal keys mean equal token sequences. Token id
+    arrays (see utils.token_table) are hashed as their int32 bytes, behind a
+    separate marker.
+
+    Args:
+    - kind (str): What is cached for the pair, e.g. 'distance' or 'mark:list'.
+    - seq1 (list or np.ndarray): Reference tokens or token ids.
+    - seq2 (list or np.ndarray): Hypothesis tokens or token ids.
+
+    Returns:
+    - bytes: A 16-byte blake2b digest.
+    """
+    digest = hashlib.blake2b(kind.encode('utf-8'), digest_size=16)
+    for seq in (seq1, seq2):
+        if isinstance(seq, np.ndarray):
+            digest.update(b'\x1d')
+            digest.update(seq.astype(np.int32, copy=False).tobytes())
+        else:
+            digest.update(b'\x1e')
+            digest.update('\x1f'.join(seq).encode('utf-8'))
+    return digest.digest()
+
+
+class PairCache:
+    """
+    LRU memo of results per token pair, shared across strategies and runs.
+
+    The same utterance pairs recur a lot (short stock lines, one ground truth
+    scored against many candidate revisions), so the line-by-line strategies
+    and mark_changes_line look every pair up here before scoring it.
+    """
+
+    def __init__(self, max_size=DEFAULT_PAIR_CACHE_SIZE, path=None):
+        """
+        Args:
+        - max_size (int): Maximum number of entries; 0 disables caching.
+        - path (str or None): Optional backing file. It is loaded here if it
+          exists and written by save().
+        """
+        self.max_size = max_size
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if path is not None and os.path.exists(path):
+            self.load(path)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value = self._entries[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def lookup_pairs(self, kind, pairs, compute):
+        """
+        Results for many pairs, computing only the cache misses in one call.
+
+        Args:
+        - kind (str): What is cached, part of the key.
+        - pairs (list): (reference tokens, hypothesis tokens) pairs.
+        - compute (callable): Maps a list of missing pairs to their results.
+          None results are returned but not cached.
+
+        Returns:
+        - list: One result per pair, in order.
+        """
+        keys = [pair_key(kind, seq1, seq2) for seq1, seq2 in pairs]
+        results = [self.get(key) for key in keys]
+        missing = [index for index, result in enumerate(results) if result is None]
+        if missing:
+            for index, result in zip(missing, compute([pairs[index] for index in missing])):
+                results[index] = result
+                if result is not None:
+                    self.put(keys[index], result)
+        return results
+
+    def stats(self):
+        """
+        Returns:
+        - dict: hits, misses, hit_rate, size and max_size.
+        """
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'size': len(self._entries),
+            'max_size': self.max_size,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def load(self, path=None):
+        """Merge the entries of a backing file into the cache."""
+        with open(path or self.path, 'rb') as file:
+            entries = pickle.load(file)
+        for key, value in entries.items():
+            self.put(key, value)
+
+    def save(self, path=None):
+        """Write the cache to its backing file (atomically replaced)."""
+        path = path or self.path
+        if path is None:
+            raise ValueError("PairCache.save() needs a path when the cache has no backing file.")
+        with self._lock:
+            entries = OrderedDict(self._entries)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'wb') as file:
+            pickle.dump(entries, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, path)
+
+
+# Process-wide cache used by WERCalculator unless it is given its own
+shared_pair_cache = PairCache()
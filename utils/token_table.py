@@ -0,0 +1,204 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+'''
+@File    :   token_table.py
+@Desc    :   Per-tokenizer id tables: token id -> normalized word id and drop mask, so pairs are scored as int arrays
+'''
+
+# here put the import lib
+import threading
+import weakref
+
+import numpy as np
+
+from utils.tokenizer_cache import shared_tokenizer_cache
+
+# Tokens the marking never shows, besides the ones that clean to an empty word
+DROPPED_TOKENS = frozenset(['<s>', '</s>'])
+
+
+def normalize_token(token):
+    """
+    The word a token is marked as: the Ġ word-start marker removed and surrounding whitespace stripped.
+
+    Returns:
+    - str or None: None for <s>, </s> and tokens that clean to nothing (not shown by the marking).
+    """
+    if token is None or token in DROPPED_TOKENS:
+        return None
+    return token.replace("Ġ", "").strip() or None
+
+
+class WordView:
+    """
+    Read-only sequence of the words behind an array of normalized word ids.
+
+    CompactAlignment holds these as its ref_tokens / hyp_tokens, so a word
+    string is only looked up when the alignment is rendered. Pickling (process
+    pools, the pair cache file) resolves the view into a plain list.
+    """
+    __slots__ = ('word_ids', 'words')
+
+    def __init__(self, word_ids, words):
+        self.word_ids = word_ids
+        self.words = words
+
+    def __len__(self):
+        return len(self.word_ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.words[word_id] for word_id in self.word_ids[index].tolist()]
+        return self.words[self.word_ids[index]]
+
+    def __iter__(self):
+        words = self.words
+        return (words[word_id] for word_id in self.word_ids.tolist())
+
+    def __reduce__(self):
+        return list, (list(self),)
+
+
+class TokenTable:
+    """
+    Token strings of one vocabulary with their normalized word ids and drop mask.
+
+    tokens[i] is the string of token id i, word_ids[i] the id of its
+    normalized word in words (see normalize_token; equal words share an id)
+    and drop[i] marks the ids the marking leaves out. A table filled by sync()
+    follows the tokenizer's own ids; one filled by intern() (word-level
+    strategies, whose merged words have no tokenizer id) numbers the strings
+    it is given. Tables only grow, so ids handed out stay valid.
+    """
+
+    def __init__(self):
+        self.tokens = []
+        self.words = []
+        self.word_ids = np.zeros(0, dtype=np.int32)
+        self.drop = np.zeros(0, dtype=bool)
+        self._token_index = {}
+        self._word_index = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def __getstate__(self):
+        state = dict(vars(self))
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        vars(self).update(state)
+        self._lock = threading.Lock()
+
+    def copy(self):
+        """A table with the same entries that grows separately (the arrays are shared, they are never changed in place)."""
+        with self._lock:
+            table = TokenTable()
+            table.tokens = list(self.tokens)
+            table.words = list(self.words)
+            table.word_ids = self.word_ids
+            table.drop = self.drop
+            table._token_index = dict(self._token_index)
+            table._word_index = dict(self._word_index)
+        return table
+
+    def _add_tokens(self, tokens):
+        # Helper function to append tokens and their normalized words; the caller holds the lock
+        word_ids, drop = [], []
+        for token in tokens:
+            self._token_index.setdefault(token, len(self.tokens))
+            self.tokens.append(token)
+            word = normalize_token(token)
+            drop.append(word is None)
+            if word is None:
+                word_ids.append(0)
+                continue
+            word_id = self._word_index.get(word)
+            if word_id is None:
+                word_id = self._word_index[word] = len(self.words)
+                self.words.append(word)
+            word_ids.append(word_id)
+        # Swap in new arrays rather than resizing, so concurrent readers keep a consistent one
+        self.word_ids = np.concatenate([self.word_ids, np.asarray(word_ids, dtype=np.int32)])
+        self.drop = np.concatenate([self.drop, np.asarray(drop, dtype=bool)])
+
+    def sync(self, tokenizer):
+        """Add the tokenizer ids the table does not cover yet (len() of a fast tokenizer is not cheap; see cover)."""
+        with self._lock:
+            size = len(tokenizer)
+            if size > len(self.tokens):
+                self._add_tokens(tokenizer.convert_ids_to_tokens(list(range(len(self.tokens), size))))
+        return self
+
+    def cover(self, tokenizer, ids_list):
+        """Sync with the tokenizer if it handed out ids the table does not know yet (the CHAT tokenizer keeps growing)."""
+        ids_list = [ids for ids in ids_list if len(ids)]
+        if ids_list and int(np.concatenate(ids_list).max()) >= len(self.tokens):
+            self.sync(tokenizer)
+        return self
+
+    def intern(self, tokens):
+        """
+        Ids of token strings, numbering the ones not seen before.
+
+        Returns:
+        - np.ndarray: int32 ids into tokens.
+        """
+        index = self._token_index
+        if any(token not in index for token in tokens):
+            with self._lock:
+                self._add_tokens([token for token in dict.fromkeys(tokens) if token not in index])
+        return np.asarray([index[token] for token in tokens], dtype=np.int32)
+
+    def normalize(self, ids):
+        """
+        The normalized word ids of a token id array, dropped tokens left out.
+
+        Returns:
+        - np.ndarray: int32 ids into words, as the marking aligns them.
+        """
+        ids = np.asarray(ids, dtype=np.intp)
+        return self.word_ids[ids[~self.drop[ids]]]
+
+    def resolve(self, word_ids):
+        """The words of a normalized word id array, looked up lazily (see WordView)."""
+        return WordView(word_ids, self.words)
+
+
+class TokenPairs(list):
+    """(ground truth ids, candidate ids) pairs together with the TokenTable their ids index."""
+
+    def __init__(self, pairs, table):
+        super().__init__(pairs)
+        self.table = table
+
+
+# Tables per tokenizer; entries go away with their tokenizer
+_tables = weakref.WeakKeyDictionary()
+_tables_lock = threading.Lock()
+
+
+def token_table(tokenizer, word_level=False):
+    """
+    The shared TokenTable of a tokenizer.
+
+    Args:
+    - tokenizer: A tokenizer from initialize_tokenizer.
+    - word_level (bool): The table of merged words (filled by intern) instead of the token id table.
+
+    Returns:
+    - TokenTable: The id table is synced with the tokenizer when it is created; call cover
+      after encoding with a tokenizer whose vocabulary grows.
+    """
+    with _tables_lock:
+        tables = _tables.get(tokenizer)
+    if tables is None:
+        # A clone from the tokenizer cache only adds ids after its base's, so start from the base's table
+        base = shared_tokenizer_cache.base_of(tokenizer)
+        table = token_table(base).copy() if base is not None else TokenTable()
+        tables = (table.sync(tokenizer), TokenTable())
+        with _tables_lock:
+            tables = _tables.setdefault(tokenizer, tables)
+    return tables[1] if word_level else tables[0]
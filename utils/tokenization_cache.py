@@ -0,0 +1,337 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+'''
+@File    :   tokenization_cache.py
+@Desc    :   Persistent SQLite cache of encoded token ids per (tokenizer, added tokens, text), shared by processes
+'''
+
+# here put the import lib
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import weakref
+
+import numpy as np
+
+from utils.chat_tokenizer import ChatTokenizer
+from utils.tokenizer_cache import shared_tokenizer_cache
+
+# Encoded texts kept before the least recently used are evicted
+DEFAULT_TOKENIZATION_CACHE_SIZE = 1_000_000
+
+# Part of every tokenizer fingerprint; bump it when the way texts are encoded changes
+TOKENIZATION_CACHE_FORMAT = 1
+
+# Text hashes per SELECT (below SQLite's bound-parameter limit)
+QUERY_CHUNK_SIZE = 500
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS tokens (
+    tokenizer TEXT NOT NULL,
+    added_tokens TEXT NOT NULL,
+    text_hash BLOB NOT NULL,
+    ids BLOB NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (tokenizer, added_tokens, text_hash)
+);
+CREATE INDEX IF NOT EXISTS tokens_last_used ON tokens (last_used);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO counters VALUES ('hits', 0), ('misses', 0);
+INSERT INTO counters SELECT 'size', (SELECT COUNT(*) FROM tokens)
+WHERE NOT EXISTS (SELECT 1 FROM counters WHERE name = 'size');
+CREATE TRIGGER IF NOT EXISTS tokens_inserted AFTER INSERT ON tokens
+BEGIN UPDATE counters SET value = value + 1 WHERE name = 'size'; END;
+CREATE TRIGGER IF NOT EXISTS tokens_deleted AFTER DELETE ON tokens
+BEGIN UPDATE counters SET value = value - 1 WHERE name = 'size'; END;
+'''
+
+# Stores ids; an entry that already exists (another process encoded the same text) is refreshed,
+# not deleted and re-inserted, so the size counter only moves for new entries
+INSERT_SQL = ('''INSERT INTO tokens VALUES (?, ?, ?, ?, ?) ON CONFLICT (tokenizer, added_tokens, text_hash)
+DO UPDATE SET ids = excluded.ids, last_used = excluded.last_used''')
+TOUCH_SQL = 'UPDATE tokens SET last_used = ? WHERE tokenizer = ? AND added_tokens = ? AND text_hash = ?'
+COUNTER_SQL = 'UPDATE counters SET value = value + ? WHERE name = ?'
+# Deletes the least recently used entries beyond the size given as parameter
+EVICT_SQL = ('''DELETE FROM tokens WHERE rowid IN (SELECT rowid FROM tokens ORDER BY last_used
+LIMIT max(0, (SELECT value FROM counters WHERE name = 'size') - ?))''')
+
+# A cache hit only rewrites last_used when the stored one is older than this (seconds), so
+# lookups that hit recently used entries stay read-only
+TOUCH_INTERVAL = 3600.0
+
+# Hit and miss counts are added to the file with the next write, or after this many seconds
+COUNTER_FLUSH_INTERVAL = 60.0
+
+# Vocabulary hashes of base tokenizers, computed once each
+_vocab_fingerprints = weakref.WeakKeyDictionary()
+
+
+def _sha256(value):
+    return hashlib.sha256(json.dumps(value, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def tokenizer_fingerprint(tokenizer):
+    """
+    The (tokenizer fingerprint, added-token set hash) of a tokenizer, the first two parts of a cache key.
+
+    The fingerprint hashes the class and vocabulary of the base tokenizer the
+    cached tokenizer was cloned from (once per base), so every annotation set
+    of a model shares it; the second part hashes the added tokens and their ids.
+
+    Args:
+    - tokenizer: A tokenizer from initialize_tokenizer.
+
+    Returns:
+    - tuple or None: Two hex strings, or None for the CHAT tokenizer, whose ids are
+      numbered per process and so cannot be stored.
+    """
+    if isinstance(tokenizer, ChatTokenizer):
+        return None
+    base = shared_tokenizer_cache.base_of(tokenizer) or tokenizer
+    fingerprint = _vocab_fingerprints.get(base)
+    if fingerprint is None:
+        fingerprint = _vocab_fingerprints[base] = _sha256([TOKENIZATION_CACHE_FORMAT, type(base).__name__,
+                                                           sorted(base.get_vocab().items())])
+    return fingerprint, _sha256(sorted(tokenizer.get_added_vocab().items()))
+
+
+def text_hash(text):
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
+
+def _connect(path, timeout):
+    # Helper function to open a connection to a cache file
+    connection = sqlite3.connect(path, timeout=timeout, isolation_level=None)
+    connection.execute('PRAGMA journal_mode=WAL')
+    connection.execute('PRAGMA synchronous=NORMAL')
+    return connection
+
+
+def _write(connection, statements):
+    # Helper function to run (sql, rows) statements in one write transaction, taking the write lock up front
+    connection.execute('BEGIN IMMEDIATE')
+    try:
+        for sql, rows in statements:
+            connection.executemany(sql, rows)
+        connection.execute('COMMIT')
+    except BaseException:
+        connection.execute('ROLLBACK')
+        raise
+
+
+def _counter_statements(pending):
+    # Helper function to add [hits, misses] counts to the file's counters, nothing if both are 0
+    return [(COUNTER_SQL, [(pending[0], 'hits'), (pending[1], 'misses')])] if any(pending) else []
+
+
+def _flush_counters(path, timeout, pending, lock):
+    # Helper function to write the counts a cache still buffers when it is dropped or the process exits
+    with lock:
+        counts, pending[:] = list(pending), [0, 0]
+    if any(counts):
+        connection = _connect(path, timeout)
+        try:
+            _write(connection, _counter_statements(counts))
+        finally:
+            connection.close()
+
+
+class TokenizationCache:
+    """
+    Encoded token ids of texts, stored in an SQLite file across runs and processes.
+
+    The same .cha files are scored again and again while strategies,
+    annotation lists and candidates change; a line is only encoded again when
+    its text, the tokenizer or its added tokens differ. Entries are keyed by
+    (tokenizer fingerprint, added-token set hash, text hash) and hold the ids
+    as int32 bytes. The file is opened in WAL mode, so any number of processes
+    can read it while one writes; every thread and process uses its own
+    connection. A lookup whose texts are all cached and recently used only
+    reads: last_used is rewritten at most every TOUCH_INTERVAL seconds per
+    entry, and the hit and miss counters are buffered (see flush). When there
+    are more than max_size entries, the least recently used ones are evicted;
+    the entry count is kept in the file by triggers, so it is never counted.
+    """
+
+    def __init__(self, path, max_size=DEFAULT_TOKENIZATION_CACHE_SIZE, timeout=60.0):
+        """
+        Args:
+        - path (str): The SQLite file; created if it does not exist.
+        - max_size (int): Maximum number of encoded texts kept in the file.
+        - timeout (float): Seconds to wait for another process's write to finish.
+        """
+        self.path = path
+        self.max_size = max_size
+        self.timeout = timeout
+        self._start()
+        self._connection().executescript(SCHEMA)
+
+    def __getstate__(self):
+        # Connections and locks stay in their process; workers open their own
+        return {'path': self.path, 'max_size': self.max_size, 'timeout': self.timeout}
+
+    def __setstate__(self, state):
+        vars(self).update(state)
+        self._start()
+
+    def _start(self):
+        # Helper function to set up the per-process state: session counters, the counts not yet in the file
+        self.hits = 0
+        self.misses = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pending = [0, 0]
+        self._flushed_at = time.monotonic()
+        # Counts still pending when the cache is dropped or the process exits are written then
+        weakref.finalize(self, _flush_counters, self.path, self.timeout, self._pending, self._lock)
+
+    def _connection(self):
+        # Helper function to open (once per thread and process) the connection to the cache file
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = _connect(self.path, self.timeout)
+            self._local.connection, self._local.pid = connection, os.getpid()
+        return connection
+
+    def _write(self, statements):
+        # Helper function to run (sql, rows) statements, with the pending counts, in one write transaction
+        with self._lock:
+            pending, self._pending[:] = list(self._pending), [0, 0]
+            self._flushed_at = time.monotonic()
+        try:
+            _write(self._connection(), statements + _counter_statements(pending))
+        except BaseException:
+            with self._lock:
+                self._pending[0] += pending[0]
+                self._pending[1] += pending[1]
+            raise
+
+    def _fetch(self, fingerprint, hashes):
+        # Helper function to read {text hash: (ids bytes, last_used)} of the cached hashes
+        found = {}
+        connection = self._connection()
+        unique_hashes = list(dict.fromkeys(hashes))
+        for start in range(0, len(unique_hashes), QUERY_CHUNK_SIZE):
+            chunk = unique_hashes[start:start + QUERY_CHUNK_SIZE]
+            rows = connection.execute(
+                'SELECT text_hash, ids, last_used FROM tokens WHERE tokenizer = ? AND added_tokens = ? AND text_hash IN '
+                f"({', '.join('?' * len(chunk))})", [*fingerprint, *chunk])
+            found.update((key, (ids, last_used)) for key, ids, last_used in rows)
+        return found
+
+    def get_many(self, fingerprint, texts):
+        """
+        Cached ids of texts encoded by a tokenizer with the given fingerprint.
+
+        Returns:
+        - list: An int32 array per text, None where it is not cached.
+        """
+        hashes = [text_hash(text) for text in texts]
+        found = self._fetch(fingerprint, hashes)
+        return [np.frombuffer(found[key][0], dtype=np.int32) if key in found else None for key in hashes]
+
+    def put_many(self, fingerprint, texts, ids_list, touch_texts=()):
+        """
+        Store the ids of encoded texts, mark touch_texts as recently used and evict beyond max_size.
+
+        The pending hit and miss counts are written in the same transaction.
+        """
+        now = time.time()
+        rows = [(*fingerprint, text_hash(text), np.asarray(ids, dtype=np.int32).tobytes(), now)
+                for text, ids in zip(texts, ids_list)]
+        touched = [(now, *fingerprint, key) for key in {text_hash(text) for text in touch_texts}]
+        statements = [(INSERT_SQL, rows), (TOUCH_SQL, touched)]
+        if rows:
+            statements.append((EVICT_SQL, [(self.max_size,)]))
+        self._write(statements)
+
+    def evict(self):
+        """Delete the least recently used entries beyond max_size."""
+        self._write([(EVICT_SQL, [(self.max_size,)])])
+
+    def flush(self):
+        """Add the buffered hit and miss counts to the file's counters."""
+        with self._lock:
+            if not any(self._pending):
+                return
+        self._write([])
+
+    def lookup_texts(self, tokenizer, texts, compute, kind='text'):
+        """
+        The ids of many texts, encoding only the ones not cached, in one call.
+
+        Only writes to the file when texts were missing, cached entries are due
+        for a new last_used (TOUCH_INTERVAL) or the buffered counts are due
+        (COUNTER_FLUSH_INTERVAL).
+
+        Args:
+        - tokenizer: The tokenizer the texts are encoded with (see tokenizer_fingerprint).
+        - texts (list): The texts.
+        - compute (callable): Maps a list of texts to their int32 id arrays.
+        - kind (str): How compute encodes, part of the fingerprint, e.g. 'text' (with special
+          tokens) or 'piece' (without).
+
+        Returns:
+        - list: One int32 array per text, in order.
+        """
+        texts = list(texts)
+        fingerprint = tokenizer_fingerprint(tokenizer)
+        if fingerprint is None or not texts:
+            return compute(texts)
+        fingerprint = (f'{kind}:{fingerprint[0]}', fingerprint[1])
+
+        hashes = [text_hash(text) for text in texts]
+        found = self._fetch(fingerprint, hashes)
+        missing = list(dict.fromkeys(text for text, key in zip(texts, hashes) if key not in found))
+        encoded = dict(zip(missing, compute(missing))) if missing else {}
+        stale_before = time.time() - TOUCH_INTERVAL
+        stale = [text for text, key in zip(texts, hashes) if key in found and found[key][1] < stale_before]
+        hit_count = sum(key in found for key in hashes)
+        with self._lock:
+            self.hits += hit_count
+            self.misses += len(texts) - hit_count
+            self._pending[0] += hit_count
+            self._pending[1] += len(texts) - hit_count
+            counts_due = time.monotonic() - self._flushed_at >= COUNTER_FLUSH_INTERVAL
+        if missing or stale or counts_due:
+            self.put_many(fingerprint, missing, [encoded[text] for text in missing], stale)
+        return [np.frombuffer(found[key][0], dtype=np.int32) if key in found else encoded[text]
+                for text, key in zip(texts, hashes)]
+
+    def __len__(self):
+        return self._connection().execute("SELECT value FROM counters WHERE name = 'size'").fetchone()[0]
+
+    def stats(self):
+        """
+        Returns:
+        - dict: hits, misses and hit_rate of this process, total_hits, total_misses and
+          total_hit_rate over every run on the file (this process's counts flushed first),
+          size and max_size.
+        """
+        self.flush()
+        lookups = self.hits + self.misses
+        totals = dict(self._connection().execute('SELECT name, value FROM counters'))
+        total_lookups = totals['hits'] + totals['misses']
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'total_hits': totals['hits'],
+            'total_misses': totals['misses'],
+            'total_hit_rate': totals['hits'] / total_lookups if total_lookups else 0.0,
+            'size': totals['size'],
+            'max_size': self.max_size,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._pending[:] = [0, 0]
+            self.hits = 0
+            self.misses = 0
+        self._write([('DELETE FROM tokens', [()]), ("UPDATE counters SET value = 0", [()])])
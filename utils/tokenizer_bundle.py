@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+'''
+@File    :   tokenizer_bundle.py
+@Desc    :   Prebuilt offline tokenizer bundles: the tokenizer with the fixed annotations, a vocab hash and a manifest
+'''
+
+# here put the import lib
+import hashlib
+import json
+import os
+
+# Written last by build_tokenizer_bundle; a directory with this file is a bundle
+BUNDLE_MANIFEST = 'tokenizer_bundle.json'
+BUNDLE_FORMAT = 1
+
+
+def vocab_hash(tokenizer):
+    """
+    Content hash of a tokenizer's full vocabulary (base vocabulary and added tokens).
+
+    Args:
+    - tokenizer: A slow or fast tokenizer.
+
+    Returns:
+    - str: 'sha256:<hex digest>' of the sorted (token, id) pairs.
+    """
+    vocab = sorted(tokenizer.get_vocab().items())
+    return 'sha256:' + hashlib.sha256(json.dumps(vocab, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+def _file_hash(path):
+    with open(path, 'rb') as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+
+def is_tokenizer_bundle(path):
+    return os.path.isfile(os.path.join(path, BUNDLE_MANIFEST))
+
+
+def read_bundle_manifest(bundle_path):
+    with open(os.path.join(bundle_path, BUNDLE_MANIFEST), 'r', encoding='utf-8') as file:
+        return json.load(file)
+
+
+def build_tokenizer_bundle(tokenizer_model_path, fixed_annotations, bundle_path):
+    """
+    Save a tokenizer with the fixed annotations added, for loading without network access.
+
+    The fast tokenizer is saved when it can be built (its directory then holds
+    tokenizer.json next to the slow vocab.json / merges.txt), otherwise the
+    slow one. The manifest records the source, the annotations, the vocab hash
+    and a SHA-256 per saved file.
+
+    Args:
+    - tokenizer_model_path (str): Hub name or path of the tokenizer model.
+    - fixed_annotations (list): Annotations to add as special tokens.
+    - bundle_path (str): Output directory.
+
+    Returns:
+    - dict: The manifest.
+    """
+    import transformers
+    from transformers import AutoTokenizer
+
+    try:
+        tokenizer = AutoTokenizer.from_pretrained(tokenizer_model_path, use_fast=True)
+    except (ImportError, ValueError):
+        tokenizer = AutoTokenizer.from_pretrained(tokenizer_model_path, use_fast=False)
+    tokenizer.add_tokens(fixed_annotations, special_tokens=True)
+
+    os.makedirs(bundle_path, exist_ok=True)
+    saved_files = tokenizer.save_pretrained(bundle_path)
+    manifest = {
+        'format': BUNDLE_FORMAT,
+        'source': tokenizer_model_path,
+        'tokenizer_class': type(tokenizer).__name__,
+        'fast': tokenizer.is_fast,
+        'transformers_version': transformers.__version__,
+        'fixed_annotations': list(fixed_annotations),
+        'vocab_size': len(tokenizer),
+        'vocab_hash': vocab_hash(tokenizer),
+        'files': {os.path.basename(path): _file_hash(path) for path in saved_files if os.path.isfile(path)},
+    }
+    with open(os.path.join(bundle_path, BUNDLE_MANIFEST), 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, ensure_ascii=False, indent=2)
+    return manifest
+
+
+def load_tokenizer_bundle(bundle_path, use_fast=False, verify=True):
+    """
+    Load a bundle written by build_tokenizer_bundle, from local files only.
+
+    Args:
+    - bundle_path (str): The bundle directory.
+    - use_fast (bool): Load the fast tokenizer (the bundle must have been built with one).
+    - verify (bool): Check the saved files against the manifest hashes first, and the loaded
+      vocabulary against the manifest's vocab hash (it can differ when another transformers
+      version rebuilds the vocabulary from the same files).
+
+    Returns:
+    - The tokenizer, with the bundle's fixed annotations already added.
+    """
+    manifest = read_bundle_manifest(bundle_path)
+    if manifest.get('format') != BUNDLE_FORMAT:
+        raise ValueError(f"Unsupported tokenizer bundle format {manifest.get('format')} in {bundle_path}.")
+    if use_fast and not manifest['fast']:
+        raise ValueError(f"The tokenizer bundle {bundle_path} has no fast tokenizer; load it with use_fast=False.")
+    if verify:
+        for name, digest in manifest['files'].items():
+            if _file_hash(os.path.join(bundle_path, name)) != digest:
+                raise ValueError(f"{name} in the tokenizer bundle {bundle_path} does not match its manifest hash.")
+    from transformers import AutoTokenizer
+    tokenizer = AutoTokenizer.from_pretrained(bundle_path, use_fast=use_fast, local_files_only=True)
+    if verify and vocab_hash(tokenizer) != manifest['vocab_hash']:
+        raise ValueError(f"The vocabulary loaded from the tokenizer bundle {bundle_path} does not match its manifest "
+                         f"vocab hash (built with transformers {manifest['transformers_version']}); rebuild the bundle.")
+    return tokenizer
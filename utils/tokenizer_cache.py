@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+'''
+@File    :   tokenizer_cache.py
+@Desc    :   Process-wide LRU cache of tokenizers keyed by model path and added annotations
+'''
+
+# here put the import lib
+import copy
+import threading
+import weakref
+from collections import OrderedDict
+
+from utils.chat_tokenizer import CHAT_TOKENIZER, ChatTokenizer
+from utils.tokenizer_bundle import is_tokenizer_bundle, load_tokenizer_bundle
+
+# Tokenizers (one per model path and annotation set) kept before the least recently used are evicted
+DEFAULT_TOKENIZER_CACHE_SIZE = 32
+
+# Tokenizer attributes at least this large are vocabulary tables that add_tokens never
+# changes; clones share them instead of copying them
+SHARED_TABLE_MIN_SIZE = 1024
+
+
+def load_base_tokenizer(tokenizer_model_path, use_fast=False):
+    """
+    Load the tokenizer of a model path as the strategies use it (slow by default).
+
+    A tokenizer bundle directory (see utils.tokenizer_bundle) is loaded from its
+    local files, with its fixed annotations already added. CHAT_TOKENIZER gives
+    the regex CHAT word tokenizer; transformers is only imported for the others.
+    """
+    if tokenizer_model_path == CHAT_TOKENIZER:
+        return ChatTokenizer()
+    if is_tokenizer_bundle(tokenizer_model_path):
+        return load_tokenizer_bundle(tokenizer_model_path, use_fast)
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(tokenizer_model_path, use_fast=use_fast)
+
+
+def clone_tokenizer(tokenizer):
+    """
+    Copy a tokenizer so that tokens can be added to the copy only.
+
+    For slow tokenizers everything is deep-copied except the large vocabulary
+    tables (encoder, decoder, BPE ranks), which add_tokens leaves untouched;
+    the clone shares them with the original, so cloning is much cheaper than
+    from_pretrained. Fast tokenizers copy their Rust tokenizer as a whole.
+
+    Args:
+    - tokenizer: The tokenizer to copy.
+
+    Returns:
+    - A new tokenizer.
+    """
+    if tokenizer.is_fast:
+        return copy.deepcopy(tokenizer)
+    memo = {id(value): value for value in vars(tokenizer).values()
+            if isinstance(value, dict) and len(value) >= SHARED_TABLE_MIN_SIZE}
+    return copy.deepcopy(tokenizer, memo)
+
+
+class TokenizerCache:
+    """
+    Thread-safe LRU cache of tokenizers with added annotation tokens.
+
+    Each model path is loaded from disk once (the base tokenizer); the
+    tokenizer for an annotation set is a clone of the base with the
+    annotations added as special tokens. The cached tokenizers are shared:
+    callers must not add tokens to them.
+    """
+
+    def __init__(self, max_size=DEFAULT_TOKENIZER_CACHE_SIZE, loader=load_base_tokenizer):
+        """
+        Args:
+        - max_size (int): Maximum number of tokenizers with added tokens; 0 disables caching
+          (the base tokenizers are still loaded only once).
+        - loader (callable): loader(tokenizer_model_path, use_fast) loads a base tokenizer.
+        """
+        self.max_size = max_size
+        self.loader = loader
+        self.hits = 0
+        self.misses = 0
+        self._bases = {}
+        self._entries = OrderedDict()
+        self._base_of = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def base(self, tokenizer_model_path, use_fast=False):
+        """The tokenizer of a model path without added tokens, loaded on first use."""
+        with self._lock:
+            if (tokenizer_model_path, use_fast) not in self._bases:
+                self._bases[tokenizer_model_path, use_fast] = self.loader(tokenizer_model_path, use_fast)
+            return self._bases[tokenizer_model_path, use_fast]
+
+    def get(self, tokenizer_model_path, annotations, use_fast=False):
+        """
+        The tokenizer of a model path with the given annotations added as special tokens.
+
+        Args:
+        - tokenizer_model_path (str): Path or hub name of the tokenizer model.
+        - annotations (iterable): Tokens to add; order and duplicates do not matter.
+        - use_fast (bool): The fast (Rust) tokenizer instead of the slow one; cached separately.
+
+        Returns:
+        - The shared tokenizer for (tokenizer_model_path, frozenset(annotations)).
+        """
+        key = (tokenizer_model_path, frozenset(annotations), use_fast)
+        with self._lock:
+            tokenizer = self._entries.get(key)
+            if tokenizer is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return tokenizer
+            self.misses += 1
+
+        base = self.base(tokenizer_model_path, use_fast)
+        tokenizer = clone_tokenizer(base)
+        tokenizer.add_tokens(sorted(key[1]), special_tokens=True)
+        # The CHAT tokenizer numbers its words per instance, so only subword clones keep the base's ids
+        if not isinstance(base, ChatTokenizer):
+            self._base_of[tokenizer] = base
+
+        if self.max_size > 0:
+            with self._lock:
+                # Another thread may have built the same tokenizer meanwhile; keep the first one
+                tokenizer = self._entries.setdefault(key, tokenizer)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_size:
+                    self._entries.popitem(last=False)
+        return tokenizer
+
+    def base_of(self, tokenizer):
+        """
+        The base tokenizer a cached tokenizer was cloned from, if its ids extend the base's.
+
+        Returns:
+        - The base tokenizer, or None (not from this cache, or a CHAT tokenizer).
+        """
+        return self._base_of.get(tokenizer)
+
+    def stats(self):
+        """
+        Returns:
+        - dict: hits, misses, hit_rate, size, max_size and the number of loaded base tokenizers.
+        """
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'base_tokenizers': len(self._bases),
+        }
+
+    def clear(self):
+        with self._lock:
+            self._bases.clear()
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+# Process-wide cache used by initialize_tokenizer
+shared_tokenizer_cache = TokenizerCache()
@@ -1,4 +1,12 @@
-from collections import defaultdict
+import math
+from collections import defaultdict, namedtuple
+
+from utils.edit_distance import (
+    intern_tokens,
+    get_distance_kernel,
+    osa_distance_batch,
+    osa_edit_counts_batch,
+)
 
 # def damerau_levenshtein_distance(seq1, seq2):
 #     '''
@@ -245,7 +253,7 @@ def word_list_error_rate_old(seq1_words, seq2_words):
     distance = damerau_levenshtein_distance(seq1_words, seq2_words)
     
     return distance / len(seq1_words)
-def word_list_error_rate(seq1_words, seq2_words):
+def word_list_error_rate_python(seq1_words, seq2_words):
 
     # print(f's1:{seq1_words}')
     # # print(f's2:{seq2_words}')
@@ -260,6 +268,9 @@ def word_list_error_rate(seq1_words, seq2_words):
     '''
     Calculates the Word Error Rate (WER) using the formula:
     WER = (D + S + I) / N
+
+    Pure-Python reference implementation with a full DP table. Kept for
+    cross-checking and benchmarking the NumPy kernel.
     '''
     N = len(seq1_words)  # Total words in the reference
     m, n = len(seq1_words), len(seq2_words)
@@ -292,6 +303,124 @@ def word_list_error_rate(seq1_words, seq2_words):
     WER = edit_distance / N if N > 0 else 0
     return WER
 
+def max_edit_distance(max_wer, N):
+    '''
+    Largest edit distance whose WER over N reference tokens is <= max_wer.
+    '''
+    distance = int(math.floor(max_wer * N))
+    # Guard against float rounding on the boundary (e.g. 0.3 * 10)
+    while distance > 0 and distance / N > max_wer:
+        distance -= 1
+    return distance
+
+
+def word_list_error_rate(seq1_words, seq2_words, kernel='auto', max_wer=None):
+    '''
+    Calculates the Word Error Rate (WER) using the formula:
+    WER = (D + S + I) / N
+
+    Tokens are interned to int32 arrays and scored with an optimal string
+    alignment kernel from utils.edit_distance; 'auto' lets plan_kernel pick
+    one from the pair's lengths. Returns the same value as
+    word_list_error_rate_python.
+
+    With max_wer, the kernel stops as soon as the WER is bound to exceed
+    max_wer and None is returned.
+    '''
+    N = len(seq1_words)  # Total words in the reference
+    if N == 0:
+        return 0
+
+    ids1, ids2 = intern_tokens(seq1_words, seq2_words)
+    if max_wer is not None:
+        edit_distance = get_distance_kernel(kernel)(ids1, ids2, max_edit_distance(max_wer, N))
+        return edit_distance / N if edit_distance is not None else None
+
+    edit_distance = get_distance_kernel(kernel)(ids1, ids2)
+    return edit_distance / N
+
+def word_list_edit_distance_batch(pairs, kernel='auto', max_wer=None):
+    '''
+    Calculates the edit distance (D + S + I + T) of many (reference tokens, hypothesis tokens) pairs.
+
+    With max_wer, every pair whose WER would exceed max_wer comes back as None.
+    '''
+    interned = intern_tokens(*(seq for pair in pairs for seq in pair))
+    id_pairs = list(zip(interned[0::2], interned[1::2]))
+    max_distances = None
+    if max_wer is not None:
+        max_distances = [max_edit_distance(max_wer, len(seq1_words)) if len(seq1_words) > 0 else None
+                         for seq1_words, _ in pairs]
+    return osa_distance_batch(id_pairs, kernel, max_distances)
+
+def word_list_error_rate_batch(pairs, kernel='auto', max_wer=None):
+    '''
+    Calculates the WER of many (reference tokens, hypothesis tokens) pairs.
+
+    All tokens share one interned vocabulary; pairs are bucketed by length and
+    each bucket is scored in one vectorized sweep (see osa_distance_batch).
+    Returns the per-pair WER values in the original order, each equal to
+    word_list_error_rate(seq1_words, seq2_words).
+
+    With max_wer, pairs are pruned by cheap lower bounds first, the kernels
+    stop early at the bound, and every pair whose WER exceeds max_wer comes
+    back as None.
+    '''
+    distances = word_list_edit_distance_batch(pairs, kernel, max_wer)
+
+    return [None if distance is None else distance / len(seq1_words) if len(seq1_words) > 0 else 0
+            for distance, (seq1_words, _) in zip(distances, pairs)]
+
+class WordErrorCounts(namedtuple('WordErrorCounts', 'substitutions deletions insertions transpositions reference_length')):
+    '''
+    Edit-operation breakdown of one scored pair, straight from the DP.
+
+    Counts add up, so a corpus-level (micro-averaged) WER is the sum of the
+    errors over the sum of the reference lengths; see micro_average_wer.
+    '''
+    __slots__ = ()
+
+    @property
+    def errors(self):
+        return self.substitutions + self.deletions + self.insertions + self.transpositions
+
+    @property
+    def wer(self):
+        return self.errors / self.reference_length if self.reference_length > 0 else 0
+
+    def __add__(self, other):
+        return WordErrorCounts(*(a + b for a, b in zip(self, other)))
+
+
+def word_list_error_counts_batch(pairs):
+    '''
+    Calculates the S/D/I/T breakdown of many (reference tokens, hypothesis tokens) pairs.
+
+    Same DP as word_list_error_rate_batch; each result's .wer equals
+    word_list_error_rate(seq1_words, seq2_words).
+    '''
+    interned = intern_tokens(*(seq for pair in pairs for seq in pair))
+    id_pairs = list(zip(interned[0::2], interned[1::2]))
+    counts = osa_edit_counts_batch(id_pairs)
+
+    return [WordErrorCounts(*ops, len(seq1_words)) for ops, (seq1_words, _) in zip(counts, pairs)]
+
+
+def word_list_error_counts(seq1_words, seq2_words):
+    '''
+    Calculates the S/D/I/T breakdown of one reference / hypothesis pair.
+    '''
+    return word_list_error_counts_batch([(seq1_words, seq2_words)])[0]
+
+
+def micro_average_wer(counts_list):
+    '''
+    Corpus-level WER summed from per-line WordErrorCounts:
+    WER = sum(S + D + I + T) / sum(N)
+    '''
+    total = sum(counts_list, WordErrorCounts(0, 0, 0, 0, 0))
+    return total.wer
+
 reference = "this is test b a"
 hypothesis = "this is a test b"
 
@@ -1,5 +1,6 @@
 from flask import Flask, request, render_template, redirect, url_for,session
 import pandas as pd
+import json
 import os
 import re
 import sys
@@ -11,10 +12,12 @@ from werkzeug.utils import secure_filename
 from wer_calculator import WERCalculator
 from wer_strategy import (
     WERAnnotationOnlyWholeTextStrategy, 
-    WERAnnotationLineByLineStrategy_marked,
-    WERAnnotationWholeTextStrategy
+    WERAnnotationLineByLineStrategy_marked
 )
 from utils.anotaion_utils import extract_lines_from_file
+from utils.wer_by_tokens import WordErrorCounts, micro_average_wer
+from utils.alignment import CompactAlignment
+from utils.alignment_render import render_html_lists, render_json
 
 app = Flask(__name__)
 
@@ -75,41 +78,26 @@ def index():
 
         # Calculate WER with the marked strategy and return lists of lists
         calculator = WERCalculator(WERAnnotationLineByLineStrategy_marked())
-        compared_ground_truth_lines, compared_candidate_lines = calculator.mark_changes(ground_truth_lines, candidate_lines, 'list')
-
-        # Calculate WER again for line-by-line results
-        calculator = WERCalculator(WERAnnotationLineByLineStrategy_marked())
-        line_wer_list = calculator.calculate(ground_truth_lines, candidate_lines)
-
-        # Calculate WER again for overall results
-        calculator = WERCalculator(WERAnnotationWholeTextStrategy())
-        overall_annotation_wer = calculator.calculate(ground_truth_lines, candidate_lines)
-
-
+        # One pass: alignments, per-line WER and edit-operation counts from the same tokenization and DP.
+        # The alignments are stored compactly and only rendered as HTML for the rows on display.
+        evaluation = calculator.evaluate(ground_truth_lines, candidate_lines, return_type=None)
+        line_counts = evaluation.counts
+        line_wer_list = evaluation.wer
+
+        # Corpus-level (micro-averaged) WER summed from the per-line counts
+        overall_annotation_wer = round(micro_average_wer(line_counts), calculator.decimal_places)
+        # The scored totals come from the same DP as the WER, so they add up to it
+        total_counts = sum(line_counts, WordErrorCounts(0, 0, 0, 0, 0))
+        # The marked spans come from the alignments that draw them (cleaned tokens, their own reference length)
+        marked_counts = sum((alignment.error_counts() for alignment in evaluation.alignment), WordErrorCounts(0, 0, 0, 0, 0))
 
         df = pd.DataFrame({
-            'Ground Truth Line': compared_ground_truth_lines,
+            'Alignment': [render_json(alignment) for alignment in evaluation.alignment],
             # 'Ground Truth Line': " ".join(compared_ground_truth_lines),
-            'Candidate Line (Compared)': compared_candidate_lines,
             # 'Candidate Line (Compared)': " ".join(compared_candidate_lines),
             'Line WER': line_wer_list
         })
 
-        # 统计 "substitution" (绿色) 的个数
-        green_count = sum(
-            str(line).count('<span style="color: green;">') 
-            for line in compared_ground_truth_lines + compared_candidate_lines
-        )
-        blue_count = sum(
-            str(line).count('<span style="color: blue;">') 
-            for line in compared_ground_truth_lines + compared_candidate_lines
-        )
-        red_count = sum(
-            str(line).count('<span style="color: red;">') 
-            for line in compared_ground_truth_lines + compared_candidate_lines
-        )
-        # print(compared_ground_truth_lines[0])
-
         output_csv_path = os.path.join(app.config['OUTPUT_FOLDER'], 'wer_output.csv')
         df.to_csv(output_csv_path, index=False)
         #deliver WER score 
@@ -118,8 +106,12 @@ def index():
 
         return redirect(url_for('display', page=1, 
                                 per_page=10,overall_wer=overall_annotation_wer,
-                                green_count=int(green_count/2),red_count=red_count,
-                                blue_count=blue_count))
+                                green_count=total_counts.substitutions,red_count=total_counts.deletions,
+                                blue_count=total_counts.insertions,swap_count=total_counts.transpositions,
+                                reference_length=total_counts.reference_length,
+                                marked_green_count=marked_counts.substitutions,marked_red_count=marked_counts.deletions,
+                                marked_blue_count=marked_counts.insertions,marked_swap_count=marked_counts.transpositions,
+                                marked_reference_length=marked_counts.reference_length))
     else:
         return render_template('index.html')
 
@@ -130,7 +122,7 @@ def display():
     if not os.path.exists(csv_file):
         return redirect(url_for('index'))
 
-    df = pd.read_csv(csv_file, converters={'Ground Truth Line': eval, 'Candidate Line (Compared)': eval})
+    df = pd.read_csv(csv_file)
 
     page = request.args.get('page', 1, type=int)
     per_page = request.args.get('per_page', 10, type=int)
@@ -138,13 +130,28 @@ def display():
     green_count = request.args.get('green_count', 'N/A',)
     red_count = request.args.get('red_count', 'N/A')
     blue_count = request.args.get('blue_count', 'N/A')
+    swap_count = request.args.get('swap_count', 'N/A')
+    reference_length = request.args.get('reference_length', 'N/A')
+    marked_green_count = request.args.get('marked_green_count', 'N/A')
+    marked_red_count = request.args.get('marked_red_count', 'N/A')
+    marked_blue_count = request.args.get('marked_blue_count', 'N/A')
+    marked_swap_count = request.args.get('marked_swap_count', 'N/A')
+    marked_reference_length = request.args.get('marked_reference_length', 'N/A')
+    char_diff = request.args.get('char_diff', 1, type=int)
 
     total_rows = len(df)
     total_pages = (total_rows // per_page) + (1 if total_rows % per_page else 0)
 
     start_row = (page - 1) * per_page
     end_row = start_row + per_page
-    page_data = df.iloc[start_row:end_row]
+    page_data = df.iloc[start_row:end_row].copy()
+
+    # Render the marked token lists (and the character diffs of substitutions) for the rows on this page only
+    marked = [render_html_lists(CompactAlignment.from_dict(json.loads(alignment)), char_diff=bool(char_diff),
+                                transpositions=True)
+              for alignment in page_data['Alignment']]
+    page_data['Ground Truth Line'] = [marked_gt for marked_gt, _ in marked]
+    page_data['Candidate Line (Compared)'] = [marked_cand for _, marked_cand in marked]
 
     return render_template(
         'display.html',
@@ -155,7 +162,14 @@ def display():
         overall_annotation_wer=overall_wer,
         total_substitution=green_count,
         total_omission=red_count,
-        total_addition=blue_count
+        total_addition=blue_count,
+        total_transposition=swap_count,
+        reference_length=reference_length,
+        marked_substitution=marked_green_count,
+        marked_omission=marked_red_count,
+        marked_addition=marked_blue_count,
+        marked_transposition=marked_swap_count,
+        marked_reference_length=marked_reference_length
 
     )
 
@@ -60,15 +60,15 @@ def index():
 
         # Calculate WER with the marked strategy
         calculator = WERCalculator(WERAnnotationLineByLineStrategy_marked())
-        compared_ground_truth_lines, compared_candidate_lines = calculator.mark_changes(ground_truth_lines, candidate_lines,'list')
+        evaluation = calculator.evaluate(ground_truth_lines, candidate_lines, 'list')
+        compared_ground_truth_lines, compared_candidate_lines = evaluation.marked_ground_truth, evaluation.marked_candidate
 
         # compared_candidate_lines = [' '.join(line) if isinstance(line, list) else line for line in compared_candidate_lines]
 
         calculator = WERCalculator(WERAnnotationOnlyWholeTextStrategy())
         overall_wer = calculator.calculate(ground_truth_lines, candidate_lines)
 
-        calculator = WERCalculator(WERAnnotationLineByLineStrategy_marked())
-        line_wer_list = calculator.calculate(ground_truth_lines, candidate_lines)
+        line_wer_list = evaluation.wer
 
         min_length = min(len(compared_ground_truth_lines), len(compared_candidate_lines), len(line_wer_list))
         compared_ground_truth_lines = compared_ground_truth_lines[:min_length]
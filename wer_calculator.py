@@ -12,9 +12,12 @@
 # Import necessary libraries and modules
 from wer_strategy import WERStrategy
 from utils.ASR_utils import read_file
+from utils.pair_cache import shared_pair_cache
+from utils.tokenizer_bundle import read_bundle_manifest
 
 class WERCalculator:
-    def __init__(self, strategy: WERStrategy, fixed_annotations=None, decimal_places=2, tokenizer_model_path='allenai/longformer-base-4096'):
+    def __init__(self, strategy: WERStrategy, fixed_annotations=None, decimal_places=2, tokenizer_model_path='allenai/longformer-base-4096', kernel='auto',
+                 pair_cache=None, tokenizer_bundle=None):
         """
         Initializes the WERCalculator with a specified WER calculation strategy, fixed annotations, 
         decimal precision for rounding results, and a tokenizer model path.
@@ -25,8 +28,21 @@ class WERCalculator:
           If None, the default 'fix_anotation.txt' file is loaded.
         - decimal_places (int): Number of decimal places to round the WER result to (default is 2).
         - tokenizer_model_path (str): The file path to the tokenizer model used for tokenizing text in WER calculation.
+        - kernel (str): Edit-distance kernel used for scoring: 'auto' (default, picked per pair by the
+          cost-based planner) or one of utils.edit_distance.DISTANCE_KERNELS ('python', 'numpy',
+          'bitparallel', 'banded', and 'rapidfuzz' when installed).
+        - pair_cache (PairCache or None): LRU memo of per-line-pair distances, counts and markings.
+          If None, the process-wide utils.pair_cache.shared_pair_cache is used, so repeated lines
+          are reused across calculators; pass PairCache(max_size=0) to disable caching.
+        - tokenizer_bundle (str or None): Directory written by build_tokenizer_bundle.py. When given, it
+          replaces tokenizer_model_path, the tokenizer is loaded from its local files only, and its
+          fixed annotations are the default instead of 'fix_anotation.txt'.
         """
         self.strategy = strategy
+        if tokenizer_bundle is not None:
+            tokenizer_model_path = tokenizer_bundle
+            if fixed_annotations is None:
+                fixed_annotations = read_bundle_manifest(tokenizer_bundle)['fixed_annotations']
         # Load default fixed annotations if none are provided
         if fixed_annotations is None:
             self.fixed_annotations = read_file('utils/fix_anotation.txt')  # Default annotation file
@@ -34,6 +50,8 @@ class WERCalculator:
             self.fixed_annotations = fixed_annotations
         self.decimal_places = decimal_places
         self.tokenizer_model_path = tokenizer_model_path
+        self.kernel = kernel
+        self.pair_cache = shared_pair_cache if pair_cache is None else pair_cache
 
     def set_strategy(self, strategy: WERStrategy):
         """
@@ -71,20 +89,105 @@ class WERCalculator:
         """
         self.tokenizer_model_path = tokenizer_model_path
 
-    def calculate(self, ground_truth, candidate):
+    def set_kernel(self, kernel):
+        """
+        Updates the edit-distance kernel used for WER scoring.
+
+        Args:
+        - kernel (str): Kernel name, 'auto' or a key of utils.edit_distance.DISTANCE_KERNELS.
+        """
+        self.kernel = kernel
+
+    def set_pair_cache(self, pair_cache):
+        """
+        Updates the memo cache consulted for per-line-pair results.
+
+        Args:
+        - pair_cache (PairCache): The cache to use, e.g. PairCache(max_size, path) for one backed by a file.
+        """
+        self.pair_cache = pair_cache
+
+    def calculate(self, ground_truth, candidate, max_wer=None):
         """
         Calculates the Word Error Rate (WER) between ground truth and candidate texts.
 
         Args:
         - ground_truth (str): The ground truth text.
         - candidate (str): The candidate text to compare against the ground truth.
+        - max_wer (float or None): Optional WER cutoff. When set, pairs are pruned with cheap
+          lower bounds, the kernels stop early at the cutoff, and any WER above the cutoff is returned as None
+          instead of being computed exactly (useful for line-by-line QA checks).
 
         Returns:
         - float: The calculated WER value, rounded to the specified decimal precision.
         """
-        return self.strategy.calculate_wer(ground_truth, candidate, self.tokenizer_model_path, self.fixed_annotations, self.decimal_places)
+        return self.strategy.calculate_wer(ground_truth, candidate, self.tokenizer_model_path, self.fixed_annotations, self.decimal_places,
+                                           kernel=self.kernel, max_wer=max_wer, pair_cache=self.pair_cache)
+
+    def calculate_counts(self, ground_truth, candidate):
+        """
+        Scores ground truth against candidate and returns the edit-operation breakdown.
 
-    def mark_changes(self, ground_truth, candidate, return_type):
+        Args:
+        - ground_truth (list): A list of lines containing the ground truth text.
+        - candidate (list): A list of lines containing the candidate text.
+
+        Returns:
+        - WordErrorCounts or list: Substitution, deletion, insertion and transposition counts plus
+          the reference length, taken from the scoring DP. Line-by-line strategies return one entry
+          per line; sum them (or use utils.wer_by_tokens.micro_average_wer) for corpus-level WER.
+        """
+        return self.strategy.calculate_counts(ground_truth, candidate, self.tokenizer_model_path, self.fixed_annotations,
+                                              pair_cache=self.pair_cache)
+
+    def evaluate(self, ground_truth, candidate, return_type='string', max_wer=None):
+        """
+        Scores and marks ground truth against candidate in one pass: the input is tokenized once
+        and every line is run through one counting DP, instead of separate calculate,
+        calculate_counts and mark_changes calls that each rebuild the tokenizer.
+
+        Args:
+        - ground_truth (list): A list of lines containing the ground truth text.
+        - candidate (list): A list of lines containing the candidate text.
+        - return_type (str or None): Format of the marked lines, 'list' for tokens, 'string' for marked text,
+          or None to skip rendering and only keep the CompactAlignment per line.
+        - max_wer (float or None): Optional WER cutoff; higher WERs are returned as None.
+
+        Returns:
+        - Evaluation: A namedtuple (wer, counts, marked_ground_truth, marked_candidate, alignment) with the
+          rounded WER, the WordErrorCounts, the marked lines (None when return_type is None) and the
+          CompactAlignment the marking is rendered from (see utils.alignment_render). Line-by-line
+          strategies give one entry per line.
+        """
+        return self.strategy.evaluate(ground_truth, candidate, self.tokenizer_model_path, self.fixed_annotations, self.decimal_places,
+                                      return_type=return_type, kernel=self.kernel, max_wer=max_wer, pair_cache=self.pair_cache)
+
+    def evaluate_many(self, ground_truth, candidates, return_type='string', max_wer=None, max_workers=None, use_processes=False):
+        """
+        Scores and marks several candidates (e.g. the outputs of different ASR models) against one
+        ground truth. The ground truth is prepared once: one tokenizer is built with the annotations
+        of the ground truth and of every candidate, and the ground truth is encoded once.
+
+        Args:
+        - ground_truth (list): A list of lines containing the ground truth text.
+        - candidates (dict): Candidate lines keyed by a name, e.g. {'whisper': [...], 'wav2vec': [...]}.
+        - return_type (str or None): Format of the marked lines, 'list', 'string', or None to only keep
+          the CompactAlignment per line.
+        - max_wer (float or None): Optional WER cutoff; higher WERs are returned as None.
+        - max_workers (int or None): Score the candidates in parallel with this many workers.
+        - use_processes (bool): Use worker processes instead of threads (the pair cache is then not used).
+
+        Returns:
+        - dict: One Evaluation per candidate name, in the order of candidates.
+        """
+        names = list(candidates)
+        evaluations = self.strategy.evaluate_many(ground_truth, [candidates[name] for name in names], self.tokenizer_model_path,
+                                                  self.fixed_annotations, self.decimal_places, return_type=return_type,
+                                                  kernel=self.kernel, max_wer=max_wer, pair_cache=self.pair_cache,
+                                                  max_workers=max_workers, use_processes=use_processes)
+        return dict(zip(names, evaluations))
+
+    def mark_changes(self, ground_truth, candidate, return_type, char_diff=False):
         """
         Calculates WER and marks the changes between ground truth and candidate texts.
 
@@ -92,9 +195,13 @@ class WERCalculator:
         - ground_truth (list): A list of lines containing the ground truth text.
         - candidate (list): A list of lines containing the candidate text.
         - return_type (str): Specifies the return format, either 'list' for tokens or 'string' for marked text.
+        - char_diff (bool): Also underline (<u>) the characters that differ inside each substituted word,
+          e.g. the 's' of 'rabbit' vs 'rabbits'. The character diff is computed while rendering and
+          memoized per word pair.
 
         Returns:
         - tuple: A tuple (marked_ground_truth, marked_candidate) where each element is either a list of tokens 
           or a marked-up string, depending on the specified return_type.
         """
-        return self.strategy.mark_changes_line(ground_truth, candidate, self.tokenizer_model_path, self.fixed_annotations, return_type)
+        return self.strategy.mark_changes_line(ground_truth, candidate, self.tokenizer_model_path, self.fixed_annotations, return_type,
+                                               pair_cache=self.pair_cache, char_diff=char_diff)
@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+# -*- encoding: utf-8 -*-
+'''
+@File    :   wer_compare_models.py
+@Desc    :   Score several ASR model outputs against one ground truth into a combined per-line table
+'''
+
+# here put the import lib
+import argparse
+import time
+
+import pandas as pd
+
+import wer_strategy
+from wer_calculator import WERCalculator
+from utils.anotaion_utils import extract_lines_from_file
+from utils.tokenization_cache import TokenizationCache
+from utils.wer_by_tokens import micro_average_wer
+
+
+def combined_line_table(ground_truth_lines, evaluations):
+    """
+    Build one row per ground truth line with a WER column per model.
+
+    Args:
+    - ground_truth_lines (list): The ground truth lines.
+    - evaluations (dict): Line-by-line Evaluation per model name, as from WERCalculator.evaluate_many.
+
+    Returns:
+    - DataFrame: 'Ground Truth Line' and one '<model> WER' column per model; lines a model
+      has no output for are left empty.
+    """
+    line_count = max((len(evaluation.wer) for evaluation in evaluations.values()), default=0)
+    table = {'Ground Truth Line': ground_truth_lines[:line_count]}
+    for name, evaluation in evaluations.items():
+        table[f'{name} WER'] = evaluation.wer + [None] * (line_count - len(evaluation.wer))
+    return pd.DataFrame(table)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Score several ASR model outputs against one ground truth.')
+    parser.add_argument('--ground_truth_path', type=str, default='anotation/cha_files/758_2.cha', help='Ground truth CHAT file.')
+    parser.add_argument('--ground_truth_prefix', type=str, default='*CHI:', help='Speaker prefix of the ground truth lines.')
+    parser.add_argument('--candidate', type=str, action='append', default=None,
+                        help='A model output as name=path; repeat for every model.')
+    parser.add_argument('--candidate_prefix', type=str, default='*PAR0:', help='Speaker prefix of the candidate lines.')
+    parser.add_argument('--strategy', type=str, default='WERAnnotationLineByLineStrategy', help='A line-by-line strategy of wer_strategy.')
+    parser.add_argument('--tokenizer_model_path', type=str, default='allenai/longformer-base-4096', help='Tokenizer model path.')
+    parser.add_argument('--max_workers', type=int, default=None, help='Score the models in parallel with this many workers.')
+    parser.add_argument('--token_cache', type=str, default=None,
+                        help='SQLite file caching the encoded lines across runs (created if missing).')
+    parser.add_argument('--output_path', type=str, default='wer_compare_output.csv', help='Where to save the combined table (CSV).')
+    args = parser.parse_args()
+
+    candidate_paths = dict(item.split('=', 1) for item in (args.candidate or ['AI=anotation/cha_files/758_AI.cha']))
+
+    # Extract lines from files
+    ground_truth_lines = extract_lines_from_file(args.ground_truth_path, args.ground_truth_prefix)
+    candidates = {name: extract_lines_from_file(path, args.candidate_prefix) for name, path in candidate_paths.items()}
+
+    token_cache = TokenizationCache(args.token_cache) if args.token_cache else None
+    calculator = WERCalculator(getattr(wer_strategy, args.strategy)(token_cache=token_cache), tokenizer_model_path=args.tokenizer_model_path)
+    if not calculator.strategy.line_by_line:
+        parser.error(f"{args.strategy} is not a line-by-line strategy.")
+
+    # The ground truth is tokenized once for all models; markings are rendered on demand from the alignments
+    start = time.perf_counter()
+    evaluations = calculator.evaluate_many(ground_truth_lines, candidates, return_type=None, max_workers=args.max_workers)
+    print(f"Scored {len(candidates)} models in {time.perf_counter() - start:.2f} s")
+    for name, evaluation in evaluations.items():
+        print(f"{name}: corpus WER {micro_average_wer(evaluation.counts):.4f} over {len(evaluation.wer)} lines")
+    if token_cache is not None:
+        stats = token_cache.stats()
+        print(f"Token cache: {stats['hit_rate']:.1%} of {stats['hits'] + stats['misses']} lines cached in this run, "
+              f"{stats['total_hit_rate']:.1%} over all runs, {stats['size']} of {stats['max_size']} entries used")
+
+    df = combined_line_table(ground_truth_lines, evaluations)
+    df.to_csv(args.output_path, index=False)
+    print(f"WER results saved to {args.output_path}")
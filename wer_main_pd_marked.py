@@ -51,7 +51,9 @@ if __name__ == "__main__":
     # 使用 mark_word_changes 函数处理每对 ground truth 和 candidate lines
     calculator = WERCalculator(WERAnnotationLineByLineStrategy_marked())
     # compared_candidate_lines = calculator.mark_changes(ground_truth_lines, candidate_lines)
-    compared_ground_truth_lines, compared_candidate_lines = calculator.mark_changes(ground_truth_lines, candidate_lines,'list')
+    # 一次 tokenization 同时得到标记结果和逐行 WER
+    evaluation = calculator.evaluate(ground_truth_lines, candidate_lines, 'list')
+    compared_ground_truth_lines, compared_candidate_lines = evaluation.marked_ground_truth, evaluation.marked_candidate
 
 
     # Initialize the WERCalculator with default fixed_annotations from fix_anotation.txt and decimal_places = 2
@@ -62,8 +64,7 @@ if __name__ == "__main__":
     print(f"Overall AnnotationOnlyWER (Whole Text): {overall_wer}")
 
     # Strategy 2: Calculate WER line by line and save results to CSV
-    calculator.set_strategy(WERAnnotationLineByLineStrategy_marked())
-    line_wer_list = calculator.calculate(ground_truth_lines, candidate_lines)
+    line_wer_list = evaluation.wer
     print(f'WERAnnotationLineByLineStrategy_marked{line_wer_list}')
 
     # Create a DataFrame to store the results with compared strings
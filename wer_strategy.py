@@ -11,14 +11,26 @@
 
 # here put the import lib
 import logging
-from abc import ABC, abstractmethod
-from transformers import AutoTokenizer
-from utils.wer_by_tokens import word_list_error_rate
-from utils.find_all_anotations import collect_all_matches
-import re  # Regular expressions for removing HTML tags
+from abc import ABC
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from itertools import islice
+import numpy as np
+from utils.wer_by_tokens import word_list_edit_distance_batch, word_list_error_counts_batch, max_edit_distance
+from utils.alignment import CompactAlignment, word_alignment, compact_word_alignment
+from utils.alignment_render import render_html, render_html_lists
+from utils.tokenizer_cache import shared_tokenizer_cache
+from utils.chat_tokenizer import CHAT_TOKENIZER
+from utils.token_table import TokenPairs, normalize_token, token_table
+from utils.annotation_placeholders import AnnotationPlaceholders
+from utils.annotation_index import annotation_index
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Lines per tokenizer call when the whole-text strategies encode a text line by line
+ENCODE_CHUNK_LINES = 256
+
 
 # def mark_word_changes(s2_words, s1_words):
 #     # s1_words = s1.split()
@@ -88,61 +100,51 @@ def mark_word_changes_onlys2(s2, s1):
     Returns:
     str: A string representing the highlighted transformations.
     """
-    import numpy as np
     s1 = [word.replace("Ġ", "").strip() for word in s1 if word not in ['<s>', '</s>'] and word.strip()]
     s2 = [word.replace("Ġ", "").strip() for word in s2 if word not in ['<s>', '</s>'] and word.strip()]
     s1 = list(filter(None, s1))
     s2 = list(filter(None, s2))
 
-    m, n = len(s1), len(s2)
-    dp = np.zeros((m + 1, n + 1), dtype=int)
-
-    # Fill the dp array
-    for i in range(1, m + 1):
-        dp[i][0] = i
-    for j in range(1, n + 1):
-        dp[0][j] = j
-
-    for i in range(1, m + 1):
-        for j in range(1, n + 1):
-            if s1[i - 1] == s2[j - 1]:
-                dp[i][j] = dp[i - 1][j - 1]
-            else:
-                dp[i][j] = min(dp[i - 1][j] + 1,   # Deletion
-                               dp[i][j - 1] + 1,   # Insertion
-                               dp[i - 1][j - 1] + 1)  # Replacement
-
-    # Backtrack to determine operations
-    i, j = m, n
     result = []
-
-    while i > 0 or j > 0:
-        if i > 0 and j > 0 and s1[i - 1] == s2[j - 1]:
-            result.append(s1[i - 1])
-            i -= 1
-            j -= 1
-        elif i > 0 and j > 0 and dp[i][j] == dp[i - 1][j - 1] + 1:
+    for op, i, j in word_alignment(s1, s2):
+        if op == 'equal':
+            result.append(s1[i])
+        elif op == 'replace':
             # Replacement
-            # result.append(f"<span style=\"color: green;\">{s2[j - 1]} → {s1[i - 1]}</span>")
-            result.append(f"<span style=\"color: green;\">{s1[i - 1]}</span>")
-            i -= 1
-            j -= 1
-        elif j > 0 and dp[i][j] == dp[i][j - 1] + 1:
+            # result.append(f"<span style=\"color: green;\">{s2[j]} → {s1[i]}</span>")
+            result.append(f"<span style=\"color: green;\">{s1[i]}</span>")
+        elif op == 'insert':
             # Insertion
-            result.append(f"<span style=\"color: blue;\">{s2[j - 1]}</span>")
-            j -= 1
-        elif i > 0 and dp[i][j] == dp[i - 1][j] + 1:
+            result.append(f"<span style=\"color: blue;\">{s2[j]}</span>")
+        else:
             # Deletion
-            result.append(f"<span style=\"color: red;\">{s1[i - 1]}</span>")
-            i -= 1
-
-    # Reverse the result since we built it backwards
-    result.reverse()
+            result.append(f"<span style=\"color: red;\">{s1[i]}</span>")
 
     return ' '.join(result)
 
 
-def mark_word_changes_list(s2, s1):
+def align_tokens(s2, s1, linear_space_min_cells=None):
+    """
+    Align the cleaned tokens of s2 (source) against s1 (target) without rendering anything.
+
+    <s>, </s> and empty tokens are dropped and the Ġ word-start marker is removed,
+    as in mark_word_changes_list.
+
+    Args:
+    s1 (list): Target sequence.
+    s2 (list): Source sequence.
+    linear_space_min_cells (int or None): DP size from which the linear-space aligner is used
+        (default utils.alignment.LINEAR_SPACE_MIN_CELLS).
+
+    Returns:
+    CompactAlignment: ref = cleaned s1, hyp = cleaned s2; render it with utils.alignment_render.
+    """
+    s1 = [word for word in map(normalize_token, s1) if word is not None]
+    s2 = [word for word in map(normalize_token, s2) if word is not None]
+    return compact_word_alignment(s1, s2, linear_space_min_cells)
+
+
+def mark_word_changes_list(s2, s1, linear_space_min_cells=None):
     """
     Highlight the operations (insert, delete, replace) needed to transform s2 into s1.
     - Replacement: <span style="color: green;"></span>
@@ -152,496 +154,789 @@ def mark_word_changes_list(s2, s1):
     Args:
     s1 (list): Target sequence.
     s2 (list): Source sequence.
+    linear_space_min_cells (int or None): DP size from which the linear-space aligner is used
+        (default utils.alignment.LINEAR_SPACE_MIN_CELLS).
 
     Returns:
     tuple: (marked_s1, s2modify)
     """
-    import numpy as np
-    # Helper function to escape < and > for HTML
-    def escape_html(word):
-        return word.replace("<", "&lt;").replace(">", "&gt;")
-    
-    # Helper function to remove <span> tags
-    def remove_span_tags(text):
-        return re.sub(r'<span[^>]*>(.*?)</span>', r'\1', text)
-    # Helper function to replace &lt; and &gt; with a single character
-    def replace_html_entities(text):
-        return text.replace("&lt;", "#").replace("&gt;", "#")
-
-    # Helper function to escape < and > for HTML
-    # def escape_html(word):
-    #     return word.replace("<", "&lt;").replace(">", "&gt;")
-    
-    # Preprocess s1 and s2
-    s1 = [escape_html(word.replace("Ġ", "").strip()) for word in s1 if word not in ['<s>', '</s>'] and word.strip()]
-    s2 = [escape_html(word.replace("Ġ", "").strip()) for word in s2 if word not in ['<s>', '</s>'] and word.strip()]
-    s1 = list(filter(None, s1))
-    s2 = list(filter(None, s2))
+    # Align first, then render the columns as HTML with balanced widths ('&nbsp;' padding)
+    marked_s1_list, s2modify_list = render_html_lists(align_tokens(s2, s1, linear_space_min_cells))
+    return marked_s1_list, s2modify_list
 
-    m, n = len(s1), len(s2)
-    dp = np.zeros((m + 1, n + 1), dtype=int)
-
-    # Fill the dp array
-    for i in range(1, m + 1):
-        dp[i][0] = i
-    for j in range(1, n + 1):
-        dp[0][j] = j
-
-    for i in range(1, m + 1):
-        for j in range(1, n + 1):
-            if s1[i - 1] == s2[j - 1]:
-                dp[i][j] = dp[i - 1][j - 1]
-            else:
-                dp[i][j] = min(dp[i - 1][j] + 1,   # Deletion
-                               dp[i][j - 1] + 1,   # Insertion
-                               dp[i - 1][j - 1] + 1)  # Replacement
-
-    # Backtrack to determine operations
-    i, j = m, n
-    s2modify_list = []
-    marked_s1_list = []
-
-    while i > 0 or j > 0:
-        if i > 0 and j > 0 and s1[i - 1] == s2[j - 1]:
-            s2modify_list.append(s1[i - 1])
-            marked_s1_list.append(s1[i - 1])
-            i -= 1
-            j -= 1
-        elif i > 0 and j > 0 and dp[i][j] == dp[i - 1][j - 1] + 1:
-            # Replacement
-            s2modify_list.append(f"<span style=\"color: green;\">{s2[j - 1]}</span>")
-            marked_s1_list.append(f"<span style=\"color: green;\">{s1[i - 1]}</span>")
-            i -= 1
-            j -= 1
-        elif j > 0 and dp[i][j] == dp[i][j - 1] + 1:
-            # Insertion
-            s2modify_list.append(f"<span style=\"color: blue;\">{s2[j - 1]}</span>")
-            marked_s1_list.append('-' * len(s2[j - 1]))  # Fill with '-' of same length
-            j -= 1
-        elif i > 0 and dp[i][j] == dp[i - 1][j] + 1:
-            # Deletion
-            s2modify_list.append('-' * len(s1[i - 1]))  # Fill with '-' of same length
-            marked_s1_list.append(f"<span style=\"color: red;\">{s1[i - 1]}</span>")
-            i -= 1
 
-    # Reverse the lists since we built them backwards
-    s2modify_list.reverse()
-    marked_s1_list.reverse()
-    
-    # Balance lengths of marked_s1_list and s2modify_list
-    for i in range(len(marked_s1_list)):
-        marked_length = len(replace_html_entities(remove_span_tags(marked_s1_list[i])))  # Remove <span> tags and replace entities for length
-        s2modify_length = len(replace_html_entities(remove_span_tags(s2modify_list[i])))  # Remove <span> tags and replace entities for length
-        
-        if marked_length > s2modify_length:
-            s2modify_list[i] += '-' * (marked_length - s2modify_length)
-        elif s2modify_length > marked_length:
-            marked_s1_list[i] += '-' * (s2modify_length - marked_length)
-    # Replace all '-' with '&nbsp;' after balancing lengths
-    for i in range(len(s2modify_list)):
-        s2modify_list[i] = s2modify_list[i].replace('-', '&nbsp;')
-
-    for i in range(len(marked_s1_list)):
-        marked_s1_list[i] = marked_s1_list[i].replace('-', '&nbsp;')
-
-
-     # Balance lengths of marked_s1_list and s2modify_list
-    # for i in range(len(marked_s1_list)):
-    #     marked_length = len(marked_s1_list[i])
-    #     s2modify_length = len(s2modify_list[i])
-    #     print(f's2modify_list:{s2modify_list}')
-    #     print(f'marked_length:{marked_length},s2modify_length:{s2modify_length}')
-        
-    #     if marked_length > s2modify_length:
-    #         s2modify_list[i] += '#' * (marked_length - s2modify_length)
-    #     elif s2modify_length > marked_length:
-    #         marked_s1_list[i] += '#' * (s2modify_length - marked_length)
-
-    # marked_s1 = ' '.join(marked_s1_list)
-    # s2modify = ' '.join(s2modify_list)
-    return marked_s1_list,s2modify_list
-    # return marked_s1, s2modify
-
-
-def mark_word_changes(s2, s1):
-    marked_s1_list,s2modify_list=mark_word_changes_list(s2, s1)
+def mark_word_changes(s2, s1, linear_space_min_cells=None):
+    marked_s1_list,s2modify_list=mark_word_changes_list(s2, s1, linear_space_min_cells)
     marked_s1 = ' '.join(marked_s1_list)
     s2modify = ' '.join(s2modify_list)
 
     return marked_s1, s2modify
 
 
+def align_token_pairs(token_pairs, pair_cache=None):
+    """
+    Align many (ground_truth_tokens, candidate_tokens) pairs, reusing cached alignments.
+
+    TokenPairs of token ids are aligned on their normalized word ids (see
+    utils.token_table), without converting any id to a string; the words are
+    only looked up when the alignments are rendered.
+
+    Args:
+    - token_pairs (list or TokenPairs): (ground_truth_tokens, candidate_tokens) pairs.
+    - pair_cache (PairCache or None): Memo of already aligned pairs; None disables it.
+
+    Returns:
+    - list: One CompactAlignment per pair.
+    """
+    table = getattr(token_pairs, 'table', None)
+    if table is None:
+        def align(pairs):
+            return [align_tokens(cand, gt) for gt, cand in pairs]
+
+        if pair_cache is None:
+            return align(token_pairs)
+        return pair_cache.lookup_pairs('alignment', token_pairs, align)
+
+    def align_words(pairs):
+        return [compact_word_alignment(gt, cand) for gt, cand in pairs]
+
+    # The alignment only depends on which word ids are equal, so cached ones are valid for any table
+    word_pairs = [(table.normalize(gt), table.normalize(cand)) for gt, cand in token_pairs]
+    if pair_cache is None:
+        alignments = align_words(word_pairs)
+    else:
+        alignments = pair_cache.lookup_pairs('word-alignment', word_pairs, align_words)
+    return [CompactAlignment(table.resolve(alignment.ref_tokens), table.resolve(alignment.hyp_tokens),
+                             alignment.ops, alignment.ref_index, alignment.hyp_index) for alignment in alignments]
+
+
+def render_marked(alignment, return_type='string', char_diff=False):
+    """
+    Render one alignment as (marked_gt, marked_cand): HTML token lists for 'list', joined strings for 'string'.
+    With char_diff the differing characters of substituted words are underlined as well.
+    """
+    if return_type == 'list':
+        return render_html_lists(alignment, char_diff)
+    return render_html(alignment, char_diff)
+
+
+def mark_token_pairs(token_pairs, return_type='string', pair_cache=None):
+    """
+    Mark the changes of many (ground_truth_tokens, candidate_tokens) pairs, reusing cached alignments.
+
+    Args:
+    - token_pairs (list): (ground_truth_tokens, candidate_tokens) pairs.
+    - return_type (str): 'list' for mark_word_changes_list output, 'string' for mark_word_changes.
+    - pair_cache (PairCache or None): Memo of already aligned pairs; None disables it.
+
+    Returns:
+    - list: (marked_gt, marked_cand) per pair.
+    """
+    return [render_marked(alignment, return_type) for alignment in align_token_pairs(token_pairs, pair_cache)]
 
 
 # Helper function to initialize tokenizer and add fixed annotations
-def initialize_tokenizer(tokenizer_model_path, fixed_annotations):
+def initialize_tokenizer(tokenizer_model_path, fixed_annotations, use_fast=False):
     """
     Initialize the tokenizer and add fixed annotations.
     
     Parameters:
     tokenizer_model_path (str): Path to the tokenizer model.
     fixed_annotations (list): List of fixed annotations to be added as special tokens.
+    use_fast (bool): Use the Rust-backed fast tokenizer instead of the slow Python one.
 
     Returns:
-    tokenizer: The initialized tokenizer with added tokens.
+    tokenizer: The initialized tokenizer with added tokens. It comes from the process-wide
+    utils.tokenizer_cache.shared_tokenizer_cache and is shared, so do not add tokens to it.
     """
     # logging.info(f"Initializing tokenizer from {fixed_annotations}.")
 
-    tokenizer = AutoTokenizer.from_pretrained(tokenizer_model_path,use_fast=False)
-    tokenizer.add_tokens(fixed_annotations, special_tokens=True)
-    return tokenizer
+    # The model is loaded once per path; each annotation set is a cached clone with the tokens added
+    return shared_tokenizer_cache.get(tokenizer_model_path, fixed_annotations, use_fast)
 
 
 # Helper function to filter tokens based on annotations and fixed annotations
-def filter_text_by_annotations(text_lines, fixed_annotations, tokenizer_model_path='allenai/longformer-base-4096'):
+def filter_text_by_annotations(text_lines, fixed_annotations):
     """
     Filter each line in the provided list to retain only tokens that match annotations or fixed annotations.
 
+    The lines are read from their AnnotationIndex (utils.annotation_index), which splits the
+    annotations out of each line as whole tokens, the way the tokenizer does; no tokenizer is needed.
+
     Parameters:
     text_lines (list): List of text lines to filter.
     fixed_annotations (list): List of fixed annotations.
-    tokenizer_model_path (str): Path to the tokenizer model (default is 'allenai/longformer-base-4096').
 
     Returns:
     list: List of filtered text lines, containing only matched annotations and fixed annotations.
     """
+    return annotation_index(text_lines, fixed_annotations).filtered_lines()
 
-    filtered_lines = []
 
-    all_text = ' '.join(text_lines)
+# Helper function to encode text and decode the ids back to tokens
+def encode_tokens(tokenizer, text):
+    """
+    Encode a text (truncated to the 4096-token model limit) and convert the ids back to tokens.
 
-    all_text_gt = collect_all_matches(all_text)
+    Parameters:
+    tokenizer: The initialized tokenizer.
+    text (str): The text to encode.
 
-    valid_tokens = all_text_gt + fixed_annotations
-    tokenizer = initialize_tokenizer(tokenizer_model_path, valid_tokens )
+    Returns:
+    list: Token strings, including the <s> and </s> markers.
+    """
+    # 对文本进行 tokenization
+    ids = tokenizer.encode(text, max_length=4096, truncation=True)
+    # 解码成 tokens
+    return tokenizer.convert_ids_to_tokens(ids)
 
-    for line in text_lines:
 
-        tokens = tokenizer.tokenize(line)
-        filtered_tokens = [token for token in tokens if token in valid_tokens]
-        filtered_line = ' '.join(filtered_tokens) if filtered_tokens else ' '
-        filtered_lines.append(filtered_line)
+# Helper function to encode many texts in one call
+def encode_tokens_batch(tokenizer, texts, return_offsets=False):
+    """
+    Encode many texts as encode_tokens does; a fast tokenizer encodes them all in one batched call.
 
-    return filtered_lines
+    Parameters:
+    tokenizer: The initialized tokenizer (slow or fast).
+    texts (list): The texts to encode.
+    return_offsets (bool): Also return the (start, end) character span of every token.
 
+    Returns:
+    list: Token strings per text; with return_offsets, a (tokens, offsets) tuple of lists, the
+    offsets being None per text for slow tokenizers, which do not track them.
+    """
+    texts = list(texts)
+    if not texts:
+        tokens_list, offsets_list = [], []
+    elif tokenizer.is_fast:
+        encodings = tokenizer(texts, max_length=4096, truncation=True).encodings
+        tokens_list = [encoding.tokens for encoding in encodings]
+        offsets_list = [encoding.offsets for encoding in encodings]
+    else:
+        tokens_list = [encode_tokens(tokenizer, text) for text in texts]
+        offsets_list = [None] * len(texts)
+    return (tokens_list, offsets_list) if return_offsets else tokens_list
+
+
+# Helper function to encode many texts into token id arrays
+def encode_ids_batch(tokenizer, texts):
+    """
+    Encode many texts as encode_tokens_batch does, but keep the token ids instead of converting them to strings.
 
-# Strategy interface for WER calculation
-class WERStrategy(ABC):
-    @abstractmethod
-    def calculate_wer(self, ground_truth_lines, candidate_lines, tokenizer_model_path, fixed_annotations, decimal_places):
-        pass
+    Parameters:
+    tokenizer: The initialized tokenizer (slow or fast).
+    texts (list): The texts to encode.
 
+    Returns:
+    list: One int32 NumPy array of token ids per text, including the <s> and </s> ids.
+    """
+    texts = list(texts)
+    if texts and tokenizer.is_fast:
+        encodings = tokenizer(texts, max_length=4096, truncation=True).encodings
+        return [np.asarray(encoding.ids, dtype=np.int32) for encoding in encodings]
+    return [np.asarray(tokenizer.encode(text, max_length=4096, truncation=True), dtype=np.int32) for text in texts]
 
-# Concrete strategy to calculate WER treating lists as a whole text
-class WERWholeTextStrategy(WERStrategy):
-    def calculate_wer(self, ground_truth_lines, candidate_lines, tokenizer_model_path, fixed_annotations, decimal_places):
-        ground_truth_text = ' '.join(ground_truth_lines)
-        candidate_text = ' '.join(candidate_lines)
-        # filtered_ground_truth = filter_text_by_annotations(ground_truth_lines, fixed_annotations, tokenizer_model_path)
-        # filtered_candidate = filter_text_by_annotations(candidate_lines, fixed_annotations, tokenizer_model_path)
 
-        tokenizer = initialize_tokenizer(tokenizer_model_path, fixed_annotations)
-        # ground_truth_tokens = tokenizer(ground_truth_text, max_length=4096, truncation=True).tokens()
-        # candidate_tokens = tokenizer(candidate_text, max_length=4096, truncation=True).tokens()
+# Helper function to encode pieces of a longer text, without special tokens or truncation
+def encode_pieces_batch(tokenizer, texts):
+    """
+    Encode many texts without the special tokens (<s>, </s>) and without truncating them.
 
+    Parameters:
+    tokenizer: The initialized tokenizer (slow or fast).
+    texts (list): The texts to encode.
 
-        # 对 ground truth 和 candidate 进行 tokenization
-        ground_truth_ids = tokenizer.encode(ground_truth_text, max_length=4096, truncation=True)
-        candidate_ids = tokenizer.encode(candidate_text, max_length=4096, truncation=True)
+    Returns:
+    list: One int32 NumPy array of token ids per text.
+    """
+    texts = list(texts)
+    if texts and tokenizer.is_fast:
+        encodings = tokenizer(texts, add_special_tokens=False).encodings
+        return [np.asarray(encoding.ids, dtype=np.int32) for encoding in encodings]
+    return [np.asarray(tokenizer.encode(text, add_special_tokens=False), dtype=np.int32) for text in texts]
 
-        # 解码成 tokens
-        ground_truth_tokens = tokenizer.convert_ids_to_tokens(ground_truth_ids)
-        candidate_tokens = tokenizer.convert_ids_to_tokens(candidate_ids)
 
-        wer = word_list_error_rate(ground_truth_tokens, candidate_tokens)
-        return round(wer, decimal_places)
+# Helper function to find the special tokens encode puts around a text
+def special_token_ids(tokenizer):
+    """
+    The special token ids encode adds before and after every text.
 
+    Parameters:
+    tokenizer: The initialized tokenizer.
 
-# Concrete strategy to calculate WER line by line
-class WERLineByLineStrategy(WERStrategy):
-    def calculate_wer(self, ground_truth_lines, candidate_lines, tokenizer_model_path, fixed_annotations, decimal_places):
-        min_length = min(len(ground_truth_lines), len(candidate_lines))
-        ground_truth_lines, candidate_lines = ground_truth_lines[:min_length], candidate_lines[:min_length]
+    Returns:
+    tuple: (prefix ids, suffix ids), e.g. ([<s> id], [</s> id]); empty lists for the CHAT tokenizer.
+    """
+    with_special = tokenizer.encode('a')
+    without_special = tokenizer.encode('a', add_special_tokens=False)
+    for start in range(len(with_special) - len(without_special) + 1):
+        if with_special[start:start + len(without_special)] == without_special:
+            return with_special[:start], with_special[start + len(without_special):]
+    return [], []
 
-        tokenizer = initialize_tokenizer(tokenizer_model_path, fixed_annotations)
-        wer_list = []
 
-        for gt_line, cand_line in zip(ground_truth_lines, candidate_lines):
-            ground_truth_ids = tokenizer.encode(gt_line, max_length=4096, truncation=True)
-            candidate_ids = tokenizer.encode(cand_line, max_length=4096, truncation=True)
+# Helper function to encode a joined text line by line
+def stream_text_ids(lines, encode_pieces, chunk_lines=ENCODE_CHUNK_LINES):
+    """
+    Yield the token ids of ' '.join(lines), without special tokens, chunk_lines lines at a time.
 
-            # 解码成 tokens
-            ground_truth_tokens = tokenizer.convert_ids_to_tokens(ground_truth_ids)
-            candidate_tokens = tokenizer.convert_ids_to_tokens(candidate_ids)
-            wer = word_list_error_rate(ground_truth_tokens, candidate_tokens)
-            wer_list.append(round(wer, decimal_places))
+    Every line is encoded on its own, behind the space that joins it to the
+    previous one; the byte-level BPE pre-tokenizer never merges across that
+    space, so the chunks add up to the tokens of the joined text. Only one
+    chunk of lines is held at a time, and nothing is truncated.
 
-        return wer_list
+    Parameters:
+    lines (iterable): The lines, e.g. a generator over a long transcript.
+    encode_pieces (callable): Maps a list of texts to their id arrays, as encode_pieces_batch.
+    chunk_lines (int): Lines per encode_pieces call.
 
+    Yields:
+    np.ndarray: The int32 ids of the next chunk of lines.
+    """
+    lines = iter(lines)
+    first = True
+    while True:
+        chunk = list(islice(lines, chunk_lines))
+        if not chunk:
+            return
+        pieces = [line if first and index == 0 else ' ' + line for index, line in enumerate(chunk)]
+        first = False
+        yield np.concatenate(encode_pieces(pieces)).astype(np.int32, copy=False)
+
+
+# Helper function to merge byte-level BPE pieces back into words
+def merge_word_pieces(tokens, whole_tokens):
+    """
+    Merge subword pieces into words at the Ġ (leading space) boundaries.
 
-# Concrete strategy to calculate WER on annotations treating lists as whole text
-class WERAnnotationWholeTextStrategy(WERStrategy):
-    def calculate_wer(self, ground_truth_lines, candidate_lines, tokenizer_model_path, fixed_annotations, decimal_places):
-        ground_truth_text = ' '.join(ground_truth_lines)
-        candidate_text = ' '.join(candidate_lines)
+    A word starts at a piece with a leading Ġ, after a bare Ġ, and after a token
+    of whole_tokens; the tokens of whole_tokens (<s>, </s> and the added
+    annotations) are kept as words of their own. Bare Ġ pieces are dropped.
 
-        annotations_gt = collect_all_matches(ground_truth_text)
-        annotations_cand = collect_all_matches(candidate_text)
+    Parameters:
+    tokens (list): Token strings from encode_tokens.
+    whole_tokens (set): Tokens that are never merged with their neighbours.
 
-        tokenizer = initialize_tokenizer(tokenizer_model_path, fixed_annotations + annotations_gt + annotations_cand)
-        ground_truth_ids = tokenizer.encode(ground_truth_text, max_length=4096, truncation=True)
-        candidate_ids = tokenizer.encode(candidate_text, max_length=4096, truncation=True)
+    Returns:
+    list: One string per word, e.g. ['<s>', 'Ġrabbit', "Ġrabbit's", '[/]', '</s>'].
+    """
+    words = []
+    joinable = False  # whether the next piece continues the last word
+    space = False  # a bare Ġ was seen since the last word
+    for token in tokens:
+        if token in whole_tokens:
+            words.append(token)
+            joinable = space = False
+        elif token == 'Ġ':
+            space = True
+        elif joinable and not space and not token.startswith('Ġ'):
+            words[-1] += token
+        else:
+            words.append(token if not space or token.startswith('Ġ') else 'Ġ' + token)
+            joinable, space = True, False
+    return words
+
+
+# Helper function to list the tokens a tokenizer never splits
+def whole_token_set(tokenizer):
+    """
+    The special tokens and the added (annotation) tokens of a tokenizer.
 
-        # 解码成 tokens
-        ground_truth_tokens = tokenizer.convert_ids_to_tokens(ground_truth_ids)
-        candidate_tokens = tokenizer.convert_ids_to_tokens(candidate_ids)
+    Parameters:
+    tokenizer: The initialized tokenizer.
 
-        wer = word_list_error_rate(ground_truth_tokens, candidate_tokens)
-        return round(wer, decimal_places)
+    Returns:
+    set: Token strings to keep whole in merge_word_pieces.
+    """
+    return set(tokenizer.all_special_tokens) | set(tokenizer.get_added_vocab())
 
+# Helper function to cut the ground truth and every candidate to their common line count
+def truncate_lines(ground_truth_lines, candidate_lines_list):
+    """
+    Truncate each candidate to the lines it shares with the ground truth.
 
-# Concrete strategy to calculate WER on annotations line by line
-class WERAnnotationLineByLineStrategy(WERStrategy):
-    def calculate_wer(self, ground_truth_lines, candidate_lines, tokenizer_model_path, fixed_annotations, decimal_places):
-        min_length = min(len(ground_truth_lines), len(candidate_lines))
-        ground_truth_lines, candidate_lines = ground_truth_lines[:min_length], candidate_lines[:min_length]
-        ground_truth_text = ' '.join(ground_truth_lines)
-        candidate_text = ' '.join(candidate_lines)
+    Parameters:
+    ground_truth_lines (list): Ground truth lines.
+    candidate_lines_list (list): One list of lines per candidate.
 
-        annotations_gt = collect_all_matches(ground_truth_text)
-        annotations_cand = collect_all_matches(candidate_text)
+    Returns:
+    tuple: (ground_truth_lines, candidate_lines_list), the ground truth cut to the longest
+    candidate, each candidate to min(len(ground_truth_lines), len(candidate_lines)).
+    """
+    line_counts = [min(len(ground_truth_lines), len(candidate_lines)) for candidate_lines in candidate_lines_list]
+    return (ground_truth_lines[:max(line_counts, default=0)],
+            [candidate_lines[:count] for candidate_lines, count in zip(candidate_lines_list, line_counts)])
 
-        tokenizer = initialize_tokenizer(tokenizer_model_path, fixed_annotations + annotations_gt + annotations_cand)
-        wer_list = []
 
-        for gt_line, cand_line in zip(ground_truth_lines, candidate_lines):
-            # annotations_gt = collect_all_matches(gt_line)
-            # annotations_cand = collect_all_matches(cand_line)
-            # tokenizer = initialize_tokenizer(tokenizer_model_path, fixed_annotations + annotations_gt + annotations_cand)
-            ground_truth_ids = tokenizer.encode(gt_line, max_length=4096, truncation=True)
-            candidate_ids = tokenizer.encode(cand_line, max_length=4096, truncation=True)
+# Helper function to collect the annotations of several files into one list
+def collect_annotations(lines_list, fixed_annotations=()):
+    """
+    Collect the annotations of every list of lines, for one shared tokenizer.
 
-            # 解码成 tokens
-            ground_truth_tokens = tokenizer.convert_ids_to_tokens(ground_truth_ids)
-            candidate_tokens = tokenizer.convert_ids_to_tokens(candidate_ids)
+    Parameters:
+    lines_list (list): Lists of lines (ground truth, candidates), each scanned once via annotation_index.
+    fixed_annotations (list): The fixed annotations, so the indexes are shared with filter_text_by_annotations.
 
-            wer = word_list_error_rate(ground_truth_tokens, candidate_tokens)
-            wer_list.append(round(wer, decimal_places))
+    Returns:
+    list: The annotations of all lists, concatenated.
+    """
+    annotations = []
+    for lines in lines_list:
+        annotations.extend(annotation_index(lines, fixed_annotations).annotations)
+    return annotations
 
-        return wer_list
 
+# Everything one evaluation of ground truth against candidate produces
+Evaluation = namedtuple('Evaluation', 'wer counts marked_ground_truth marked_candidate alignment')
 
-# Concrete strategy to calculate WER for annotations only, treating lists as whole text
-class WERAnnotationOnlyWholeTextStrategy(WERStrategy):
-    def calculate_wer(self, ground_truth_lines, candidate_lines, tokenizer_model_path, fixed_annotations, decimal_places):
-        filtered_ground_truth = filter_text_by_annotations(ground_truth_lines, fixed_annotations, tokenizer_model_path)
-        filtered_candidate = filter_text_by_annotations(candidate_lines, fixed_annotations, tokenizer_model_path)
 
-        ground_truth_text = ' '.join(filtered_ground_truth)
-        candidate_text = ' '.join(filtered_candidate)
+# Strategy interface for WER calculation
+class WERStrategy(ABC):
+    # Whole-text strategies score one joined pair, line-by-line strategies one pair per line
+    line_by_line = False
 
-        tokenizer = initialize_tokenizer(tokenizer_model_path, fixed_annotations)
-        ground_truth_ids = tokenizer.encode(ground_truth_text, max_length=4096, truncation=True)
-        candidate_ids = tokenizer.encode(candidate_text, max_length=4096, truncation=True)
+    def __init__(self, word_level=False, use_fast=False, tokenizer_kind='subword', token_cache=None):
+        """
+        Args:
+        - word_level (bool): Score and mark whole words instead of subword tokens: the pieces
+          of each word are merged at the Ġ boundaries (see merge_word_pieces), which makes the
+          sequences, and so the quadratic DP, shorter. Annotation tokens are kept whole.
+        - use_fast (bool): Encode with the Rust-backed fast tokenizer, all lines in one batched
+          call. Check that it gives the slow tokenizer's tokens for your model and corpus first
+          (benchmarks/check_fast_tokenizer.py).
+        - tokenizer_kind (str): 'subword' (default) for the tokenizer at tokenizer_model_path, or 'chat'
+          for the regex CHAT word tokenizer (utils.chat_tokenizer), which keeps CHAT codes such as [/],
+          &-um, <...>, [: x] and (.) whole, gives plain words without <s> / </s>, and does not need
+          transformers (it is never imported). word_level and use_fast do not apply to it.
+        - token_cache (TokenizationCache or None): Persistent cache of encoded lines
+          (utils.tokenization_cache), shared across runs and processes; only lines it does not
+          hold are encoded. Not used with the CHAT tokenizer.
+        """
+        if tokenizer_kind not in ('subword', 'chat'):
+            raise ValueError(f"Unknown tokenizer_kind '{tokenizer_kind}', use 'subword' or 'chat'.")
+        self.word_level = word_level
+        self.use_fast = use_fast
+        self.tokenizer_kind = tokenizer_kind
+        self.token_cache = token_cache
 
-        # 解码成 tokens
-        ground_truth_tokens = tokenizer.convert_ids_to_tokens(ground_truth_ids)
-        candidate_tokens = tokenizer.convert_ids_to_tokens(candidate_ids)
+    def tokenizer_path(self, tokenizer_model_path):
+        """The model path the tokenizers are initialized from, CHAT_TOKENIZER for the CHAT word tokenizer."""
+        return CHAT_TOKENIZER if self.tokenizer_kind == 'chat' else tokenizer_model_path
 
-        wer = word_list_error_rate(ground_truth_tokens, candidate_tokens)
-        return round(wer, decimal_places)
+    def merges_words(self):
+        return self.word_level and self.tokenizer_kind == 'subword'
 
+    def encode_texts(self, tokenizer, texts, placeholders=None):
+        """
+        Encode texts in one batched call, merged into words for word-level strategies.
 
-# Concrete strategy to calculate WER for annotations only, line by line
-class WERAnnotationOnlyLineByLineStrategy(WERStrategy):
-    def calculate_wer(self, ground_truth_lines, candidate_lines, tokenizer_model_path, fixed_annotations, decimal_places):
-        min_length = min(len(ground_truth_lines), len(candidate_lines))
-        ground_truth_lines, candidate_lines = ground_truth_lines[:min_length], candidate_lines[:min_length]
+        Args:
+        - placeholders (AnnotationPlaceholders or None): Keep these annotations whole without
+          adding them to the tokenizer (utils.annotation_placeholders).
 
-        filtered_ground_truth = filter_text_by_annotations(ground_truth_lines, fixed_annotations, tokenizer_model_path)
-        filtered_candidate = filter_text_by_annotations(candidate_lines, fixed_annotations, tokenizer_model_path)
+        Returns:
+        list: An int32 array of ids into id_table(tokenizer, placeholders) per text.
+        """
+        if placeholders is not None:
+            # Same special tokens and 4096-token cut as encode_ids_batch
+            prefix, suffix = special_token_ids(tokenizer)
+            limit = 4096 - len(prefix) - len(suffix)
+            ids_list = [np.concatenate([np.asarray(prefix, dtype=np.int32), ids[:limit], np.asarray(suffix, dtype=np.int32)])
+                        for ids in placeholders.encode(texts, self.piece_encoder(tokenizer))]
+        elif self.token_cache is None:
+            ids_list = encode_ids_batch(tokenizer, texts)
+        else:
+            ids_list = self.token_cache.lookup_texts(tokenizer, texts, partial(encode_ids_batch, tokenizer))
+        return self.table_ids(tokenizer, ids_list, placeholders)
+
+    def encode_joined(self, tokenizer, lines_list, chunk_lines=ENCODE_CHUNK_LINES, placeholders=None):
+        """
+        Encode each list of lines as the text ' '.join(lines), in full.
+
+        Unlike encode_texts, the text is not cut at the 4096-token model limit:
+        it is encoded line by line, chunk_lines lines per tokenizer call (see
+        stream_text_ids), and the chunks are concatenated between the special
+        tokens, so hour-long transcripts are scored completely.
+
+        Returns:
+        list: An int32 array of ids into id_table(tokenizer, placeholders) per list of lines.
+        """
+        encode_pieces = self.piece_encoder(tokenizer)
+        if placeholders is not None:
+            encode_pieces = partial(placeholders.encode, encode_pieces=encode_pieces)
+        prefix, suffix = special_token_ids(tokenizer)
+        ids_list = [np.concatenate([np.asarray(prefix, dtype=np.int32), *stream_text_ids(lines, encode_pieces, chunk_lines),
+                                    np.asarray(suffix, dtype=np.int32)]) for lines in lines_list]
+        return self.table_ids(tokenizer, ids_list, placeholders)
+
+    def piece_encoder(self, tokenizer):
+        """encode_pieces_batch for this tokenizer, through the token cache if there is one."""
+        encode_pieces = partial(encode_pieces_batch, tokenizer)
+        if self.token_cache is not None:
+            encode_pieces = partial(self.token_cache.lookup_texts, tokenizer, compute=encode_pieces, kind='piece')
+        return encode_pieces
+
+    def table_ids(self, tokenizer, ids_list, placeholders=None):
+        """The encoded ids as ids into id_table(tokenizer, placeholders): placeholders resolved, merged into words for word-level strategies."""
+        id_table = token_table(tokenizer).cover(tokenizer, ids_list)
+        if placeholders is not None:
+            ids_list = placeholders.resolve(ids_list, id_table)
+            id_table = placeholders.table(id_table)
+        if not self.merges_words():
+            return ids_list
+        whole_tokens = whole_token_set(tokenizer)
+        if placeholders is not None:
+            whole_tokens.update(placeholders.annotations)
+        # Merged words have no tokenizer id; the word-level table numbers them
+        table = token_table(tokenizer, word_level=True)
+        return [table.intern(merge_word_pieces([id_table.tokens[token_id] for token_id in ids.tolist()], whole_tokens))
+                for ids in ids_list]
+
+    def id_table(self, tokenizer, placeholders=None):
+        """The TokenTable the encode_texts ids of this tokenizer (and these placeholders) index."""
+        if self.merges_words():
+            return token_table(tokenizer, word_level=True)
+        table = token_table(tokenizer)
+        return table if placeholders is None else placeholders.table(table)
+
+    def pair_up(self, tokenizer, ground_truth_ids, candidate_ids_list, placeholders=None):
+        """
+        Pair the encoded ground truth with every encoded candidate.
 
-        tokenizer = initialize_tokenizer(tokenizer_model_path, fixed_annotations)
-        wer_list = []
+        Args:
+        - ground_truth_ids: The ground truth ids (whole text) or one id array per line (line by line).
+        - candidate_ids_list (list): The same for each candidate.
+        - placeholders (AnnotationPlaceholders or None): The placeholders they were encoded with.
 
-        for gt_line, cand_line in zip(filtered_ground_truth, filtered_candidate):
-            ground_truth_ids = tokenizer.encode(gt_line, max_length=4096, truncation=True)
-            candidate_ids = tokenizer.encode(cand_line, max_length=4096, truncation=True)
+        Returns:
+        list: TokenPairs per candidate, one pair for whole-text strategies and one per line otherwise.
+        """
+        table = self.id_table(tokenizer, placeholders)
+        if self.line_by_line:
+            return [TokenPairs(zip(ground_truth_ids, candidate_ids), table) for candidate_ids in candidate_ids_list]
+        return [TokenPairs([(ground_truth_ids, candidate_ids)], table) for candidate_ids in candidate_ids_list]
 
-            # 解码成 tokens
-            ground_truth_tokens = tokenizer.convert_ids_to_tokens(ground_truth_ids)
-            candidate_tokens = tokenizer.convert_ids_to_tokens(candidate_ids)
-            wer = word_list_error_rate(ground_truth_tokens, candidate_tokens)
-            wer_list.append(round(wer, decimal_places))
+    def encode_groups(self, tokenizer, groups, placeholders=None):
+        """
+        Encode several lists of lines (ground truth, candidates) in one encode_texts call.
 
-        return wer_list
-# Concrete strategy to calculate WER for annotations only, line by line
-class WERAnnotationOnlyLineByLineStrategy_marked(WERStrategy):
-    def calculate_wer(self, ground_truth_lines, candidate_lines, tokenizer_model_path, fixed_annotations, decimal_places):
-        min_length = min(len(ground_truth_lines), len(candidate_lines))
-        ground_truth_lines, candidate_lines = ground_truth_lines[:min_length], candidate_lines[:min_length]
+        Returns:
+        list: Per group, the id array of each of its lines.
+        """
+        tokens_list = self.encode_texts(tokenizer, [text for group in groups for text in group], placeholders)
+        tokens_groups, start = [], 0
+        for group in groups:
+            tokens_groups.append(tokens_list[start:start + len(group)])
+            start += len(group)
+        return tokens_groups
+
+    def tokenize_pairs(self, ground_truth_lines, candidate_lines, tokenizer_model_path, fixed_annotations):
+        """
+        Tokenize the input into the (ground_truth_tokens, candidate_tokens) pairs the strategy scores.
 
-        filtered_ground_truth = filter_text_by_annotations(ground_truth_lines, fixed_annotations, tokenizer_model_path)
-        filtered_candidate = filter_text_by_annotations(candidate_lines, fixed_annotations, tokenizer_model_path)
+        Returns:
+        list: TokenPairs of token id arrays (see utils.token_table), one pair for whole-text
+        strategies, one pair per line otherwise.
+        """
+        return self.tokenize_many(ground_truth_lines, [candidate_lines], self.tokenizer_path(tokenizer_model_path), fixed_annotations)[0]
 
-        tokenizer = initialize_tokenizer(tokenizer_model_path, fixed_annotations)
-        wer_list = []
+    def tokenize_many(self, ground_truth_lines, candidate_lines_list, tokenizer_model_path, fixed_annotations):
+        """
+        Tokenize one ground truth against several candidates.
 
-        for gt_line, cand_line in zip(filtered_ground_truth, filtered_candidate):
-            ground_truth_ids = tokenizer.encode(gt_line, max_length=4096, truncation=True)
-            candidate_ids = tokenizer.encode(cand_line, max_length=4096, truncation=True)
+        The concrete strategies build one tokenizer (with the annotations of the
+        ground truth and of every candidate) and encode the ground truth once;
+        subclasses implement this or tokenize_pairs. tokenizer_model_path has
+        already been resolved with tokenizer_path().
 
-            # 解码成 tokens
-            ground_truth_tokens = tokenizer.convert_ids_to_tokens(ground_truth_ids)
-            candidate_tokens = tokenizer.convert_ids_to_tokens(candidate_ids)
-            wer = word_list_error_rate(ground_truth_tokens, candidate_tokens)
-            wer_list.append(round(wer, decimal_places))
+        Returns:
+        list: The tokenize_pairs result of each candidate, in order.
+        """
+        return [self.tokenize_pairs(ground_truth_lines, candidate_lines, tokenizer_model_path, fixed_annotations)
+                for candidate_lines in candidate_lines_list]
+
+    def tokenize_mark_pairs(self, ground_truth_lines, candidate_lines, tokenizer_model_path, fixed_annotations):
+        """
+        Tokenize the input into the pairs whose changes are marked, if they differ from the scored pairs.
 
-        return wer_list
+        Returns:
+        list or None: None (the default) to mark the pairs returned by tokenize_pairs.
+        """
+        mark_pairs_list = self.tokenize_mark_many(ground_truth_lines, [candidate_lines], self.tokenizer_path(tokenizer_model_path), fixed_annotations)
+        return None if mark_pairs_list is None else mark_pairs_list[0]
 
-    # New method to mark changes
-    def mark_changes_line(self, ground_truth_lines, candidate_lines, tokenizer_model_path, fixed_annotations, return_type='string'):
+    def tokenize_mark_many(self, ground_truth_lines, candidate_lines_list, tokenizer_model_path, fixed_annotations):
         """
-        统一的标记函数，用于标记字符串或 token 列表中的更改。
-        
+        Tokenize one ground truth against several candidates for marking, see tokenize_mark_pairs.
+
+        Returns:
+        list or None: The tokenize_mark_pairs result of each candidate, or None (the default)
+        to mark the scored pairs.
+        """
+        return None
+
+    def score_pairs(self, token_pairs, mark_pairs=None, decimal_places=2, return_type='string', kernel='auto', max_wer=None,
+                    pair_cache=None, with_wer=True, with_counts=True, with_alignment=True, char_diff=False):
+        """
+        Compute the WER, the edit counts and the marked alignment of already tokenized pairs.
+
+        The WER and the S/D/I/T counts come from the same counting DP; the marking
+        aligns the cleaned tokens (no <s>, </s> or Ġ) as mark_word_changes_list does.
+        Parts that are not requested are not computed and come back as None.
+
         Args:
-        - ground_truth_lines (list): Ground truth 的文本行列表。
-        - candidate_lines (list): Candidate 的文本行列表。
-        - tokenizer_model_path (str): 用于初始化标记的 tokenizer 模型路径。
-        - fixed_annotations (list): 固定的注释列表。
-        - return_type (str): 指定返回类型，'list' 表示返回 token 列表，'string' 表示返回标记后的字符串。
+        - token_pairs (list): The tokenize_pairs result (lists of token strings are accepted as well).
+        - mark_pairs (list or None): The tokenize_mark_pairs result; None marks token_pairs.
+        - return_type (str or None): 'list' for token lists, 'string' for marked strings, None to
+          skip rendering and only return the CompactAlignment per line (render it when displayed).
+        - kernel (str): Edit-distance kernel when the WER is scored without counts.
+        - max_wer (float or None): WER cutoff; higher WERs are returned as None.
+        - pair_cache (PairCache or None): Memo of per-line-pair results (line-by-line strategies).
+        - with_wer, with_counts, with_alignment (bool): Which parts to compute.
+        - char_diff (bool): Underline the differing characters of substituted words when rendering.
 
         Returns:
-        - tuple: (marked_ground_truth, marked_candidate)，可以是 token 列表或标记后的字符串列表。
+        Evaluation: (wer, counts, marked_ground_truth, marked_candidate, alignment), one value each
+        for whole-text strategies and one list entry per line otherwise.
         """
-        # 收集所有的注释
-        annotations_gt = collect_all_matches(' '.join(ground_truth_lines))
-        annotations_cand = collect_all_matches(' '.join(candidate_lines))
-
-        # 初始化 tokenizer
-        tokenizer = initialize_tokenizer(tokenizer_model_path, fixed_annotations + annotations_gt + annotations_cand)
-
-        # 存储标记后的结果
-        marked_ground_truth = []
-        marked_candidate = []
-
-        # 遍历每一对 gt_line 和 cand_line
-        for gt_line, cand_line in zip(ground_truth_lines, candidate_lines):
-            # 收集行内注释
-            annotations_gt = collect_all_matches(gt_line)
-            annotations_cand = collect_all_matches(cand_line)
-            
-            # 编码为 ID
-            ground_truth_ids = tokenizer.encode(gt_line, max_length=4096, truncation=True)
-            candidate_ids = tokenizer.encode(cand_line, max_length=4096, truncation=True)
-
-            # 解码为 tokens
-            ground_truth_tokens = tokenizer.convert_ids_to_tokens(ground_truth_ids)
-            candidate_tokens = tokenizer.convert_ids_to_tokens(candidate_ids)
-
-            # 调用 mark_word_changes_list 或 mark_word_changes 函数
-            if return_type == 'list':
-                # 返回 token 列表
-                marked_gt, marked_cand = mark_word_changes_list(candidate_tokens, ground_truth_tokens)
+        pair_cache = pair_cache if self.line_by_line else None
+
+        counts = None
+        if with_counts:
+            if pair_cache is None:
+                counts = word_list_error_counts_batch(token_pairs)
+            else:
+                counts = pair_cache.lookup_pairs('counts', token_pairs, word_list_error_counts_batch)
+
+        wer = None
+        if with_wer:
+            if counts is not None:
+                distances = [line_counts.errors for line_counts in counts]
+            elif pair_cache is not None:
+                # Exact distances are cached (pairs over max_wer come back as None and are not)
+                distances = pair_cache.lookup_pairs('distance', token_pairs,
+                                                    lambda pairs: word_list_edit_distance_batch(pairs, kernel, max_wer))
             else:
-                # 返回标记后的字符串
-                marked_gt, marked_cand = mark_word_changes(candidate_tokens, ground_truth_tokens)
+                distances = word_list_edit_distance_batch(token_pairs, kernel, max_wer)
+
+            wer = []
+            for distance, (ground_truth_tokens, _) in zip(distances, token_pairs):
+                N = len(ground_truth_tokens)
+                if distance is None or (max_wer is not None and N > 0 and distance > max_edit_distance(max_wer, N)):
+                    wer.append(None)
+                else:
+                    wer.append(round(distance / N if N > 0 else 0, decimal_places))
+
+        alignment = marked_ground_truth = marked_candidate = None
+        if with_alignment:
+            alignment = align_token_pairs(token_pairs if mark_pairs is None else mark_pairs, pair_cache)
+            if return_type is not None:
+                marked = [render_marked(line_alignment, return_type, char_diff) for line_alignment in alignment]
+                marked_ground_truth = [marked_gt for marked_gt, _ in marked]
+                marked_candidate = [marked_cand for _, marked_cand in marked]
+
+        evaluation = Evaluation(wer, counts, marked_ground_truth, marked_candidate, alignment)
+        if not self.line_by_line:
+            evaluation = Evaluation(*(part[0] if part is not None else None for part in evaluation))
+        return evaluation
+
+    def evaluate(self, ground_truth_lines, candidate_lines, tokenizer_model_path, fixed_annotations, decimal_places=2,
+                 return_type='string', kernel='auto', max_wer=None, pair_cache=None,
+                 with_wer=True, with_counts=True, with_alignment=True, char_diff=False):
+        """
+        Tokenize once and compute the WER, the edit counts and the marked alignment together.
 
-            # 添加到结果列表中
-            marked_ground_truth.append(marked_gt)
-            marked_candidate.append(marked_cand)
+        See score_pairs for the arguments.
 
-        return marked_ground_truth, marked_candidate
+        Returns:
+        Evaluation: (wer, counts, marked_ground_truth, marked_candidate, alignment), one value each
+        for whole-text strategies and one list entry per line otherwise.
+        """
+        token_pairs = self.tokenize_pairs(ground_truth_lines, candidate_lines, tokenizer_model_path, fixed_annotations)
+        mark_pairs = None
+        if with_alignment:
+            mark_pairs = self.tokenize_mark_pairs(ground_truth_lines, candidate_lines, tokenizer_model_path, fixed_annotations)
+        return self.score_pairs(token_pairs, mark_pairs, decimal_places, return_type, kernel, max_wer, pair_cache,
+                                with_wer, with_counts, with_alignment, char_diff)
+
+    def evaluate_many(self, ground_truth_lines, candidate_lines_list, tokenizer_model_path, fixed_annotations, decimal_places=2,
+                      return_type='string', kernel='auto', max_wer=None, pair_cache=None, max_workers=None, use_processes=False,
+                      with_wer=True, with_counts=True, with_alignment=True):
+        """
+        Evaluate several candidates against one ground truth, preparing the ground truth once.
+
+        The input is tokenized by tokenize_many (one tokenizer, ground truth encoded
+        once); the candidates are then scored independently, in parallel if asked.
+        The shared tokenizer knows the annotations of every candidate, so a score can
+        only differ from a separate evaluate() run where another candidate's annotation
+        changes how this pair is split into tokens.
+
+        Args:
+        - candidate_lines_list (list): One list of lines per candidate.
+        - max_workers (int or None): Number of parallel workers; None scores the candidates in turn.
+        - use_processes (bool): Use a process pool instead of threads. Workers do not share
+          pair_cache, so it is not consulted in that case.
+        - See score_pairs for the other arguments.
+
+        Returns:
+        list: One Evaluation per candidate, in order.
+        """
+        tokenizer_model_path = self.tokenizer_path(tokenizer_model_path)
+        token_pairs_list = self.tokenize_many(ground_truth_lines, candidate_lines_list, tokenizer_model_path, fixed_annotations)
+        mark_pairs_list = None
+        if with_alignment:
+            mark_pairs_list = self.tokenize_mark_many(ground_truth_lines, candidate_lines_list, tokenizer_model_path, fixed_annotations)
+        if mark_pairs_list is None:
+            mark_pairs_list = [None] * len(token_pairs_list)
+
+        score = partial(self.score_pairs, decimal_places=decimal_places, return_type=return_type, kernel=kernel,
+                        max_wer=max_wer, pair_cache=None if use_processes else pair_cache,
+                        with_wer=with_wer, with_counts=with_counts, with_alignment=with_alignment)
+        if max_workers is None or len(token_pairs_list) <= 1:
+            return [score(token_pairs, mark_pairs) for token_pairs, mark_pairs in zip(token_pairs_list, mark_pairs_list)]
+        executor_class = ProcessPoolExecutor if use_processes else ThreadPoolExecutor
+        with executor_class(max_workers=max_workers) as executor:
+            return list(executor.map(score, token_pairs_list, mark_pairs_list))
+
+    def calculate_wer(self, ground_truth_lines, candidate_lines, tokenizer_model_path, fixed_annotations, decimal_places, kernel='auto', max_wer=None,
+                      pair_cache=None):
+        return self.evaluate(ground_truth_lines, candidate_lines, tokenizer_model_path, fixed_annotations, decimal_places,
+                             kernel=kernel, max_wer=max_wer, pair_cache=pair_cache, with_counts=False, with_alignment=False).wer
+
+    def calculate_counts(self, ground_truth_lines, candidate_lines, tokenizer_model_path, fixed_annotations, pair_cache=None):
+        """
+        Score the input and return the edit-operation breakdown instead of rounded WER values.
+
+        Returns:
+        WordErrorCounts or list: One WordErrorCounts for whole-text strategies, one per line otherwise.
+        """
+        return self.evaluate(ground_truth_lines, candidate_lines, tokenizer_model_path, fixed_annotations,
+                             pair_cache=pair_cache, with_wer=False, with_alignment=False).counts
+
+    def mark_changes_line(self, ground_truth_lines, candidate_lines, tokenizer_model_path, fixed_annotations, return_type='string', pair_cache=None,
+                          char_diff=False):
+        """
+        Mark the changes between ground truth and candidate.
+
+        Args:
+        - return_type (str): 'list' for token lists, 'string' for marked strings.
+        - char_diff (bool): Underline the differing characters of substituted words.
+
+        Returns:
+        - tuple: (marked_ground_truth, marked_candidate)
+        """
+        evaluation = self.evaluate(ground_truth_lines, candidate_lines, tokenizer_model_path, fixed_annotations,
+                                   return_type=return_type, pair_cache=pair_cache, with_wer=False, with_counts=False,
+                                   char_diff=char_diff)
+        return evaluation.marked_ground_truth, evaluation.marked_candidate
+
+
+# Concrete strategy to calculate WER treating lists as a whole text
+class WERWholeTextStrategy(WERStrategy):
+    def tokenize_many(self, ground_truth_lines, candidate_lines_list, tokenizer_model_path, fixed_annotations):
+        tokenizer = initialize_tokenizer(tokenizer_model_path, fixed_annotations, self.use_fast)
+        ground_truth_ids, *candidate_ids_list = self.encode_joined(tokenizer, [ground_truth_lines] + candidate_lines_list)
+        return self.pair_up(tokenizer, ground_truth_ids, candidate_ids_list)
+
+
+# Concrete strategy to calculate WER line by line
+class WERLineByLineStrategy(WERStrategy):
+    line_by_line = True
+
+    def tokenize_many(self, ground_truth_lines, candidate_lines_list, tokenizer_model_path, fixed_annotations):
+        ground_truth_lines, candidate_lines_list = truncate_lines(ground_truth_lines, candidate_lines_list)
+
+        tokenizer = initialize_tokenizer(tokenizer_model_path, fixed_annotations, self.use_fast)
+        ground_truth_ids, *candidate_ids_list = self.encode_groups(tokenizer, [ground_truth_lines] + candidate_lines_list)
+        return self.pair_up(tokenizer, ground_truth_ids, candidate_ids_list)
+
+
+# Concrete strategy to calculate WER on annotations treating lists as whole text
+class WERAnnotationWholeTextStrategy(WERStrategy):
+    def tokenize_many(self, ground_truth_lines, candidate_lines_list, tokenizer_model_path, fixed_annotations):
+        annotations = collect_annotations([ground_truth_lines] + candidate_lines_list, fixed_annotations)
+
+        # The annotations stay whole as placeholders, so the tokenizer is the same for every file
+        tokenizer = initialize_tokenizer(tokenizer_model_path, fixed_annotations, self.use_fast)
+        placeholders = AnnotationPlaceholders(tokenizer, annotations)
+        ground_truth_ids, *candidate_ids_list = self.encode_joined(tokenizer, [ground_truth_lines] + candidate_lines_list,
+                                                                   placeholders=placeholders)
+        return self.pair_up(tokenizer, ground_truth_ids, candidate_ids_list, placeholders)
 
 
 # Concrete strategy to calculate WER on annotations line by line
-class WERAnnotationLineByLineStrategy_marked(WERStrategy):
-    def calculate_wer(self, ground_truth_lines, candidate_lines, tokenizer_model_path, fixed_annotations, decimal_places):
-        min_length = min(len(ground_truth_lines), len(candidate_lines))
-        ground_truth_lines, candidate_lines = ground_truth_lines[:min_length], candidate_lines[:min_length]
-        ground_truth_text = ' '.join(ground_truth_lines)
-        candidate_text = ' '.join(candidate_lines)
+class WERAnnotationLineByLineStrategy(WERStrategy):
+    line_by_line = True
 
-        annotations_gt = collect_all_matches(ground_truth_text)
-        annotations_cand = collect_all_matches(candidate_text)
+    def tokenize_many(self, ground_truth_lines, candidate_lines_list, tokenizer_model_path, fixed_annotations):
+        ground_truth_lines, candidate_lines_list = truncate_lines(ground_truth_lines, candidate_lines_list)
 
-        tokenizer = initialize_tokenizer(tokenizer_model_path, fixed_annotations + annotations_gt + annotations_cand)
-        wer_list = []
+        annotations = collect_annotations([ground_truth_lines] + candidate_lines_list, fixed_annotations)
 
-        for gt_line, cand_line in zip(ground_truth_lines, candidate_lines):
-            # annotations_gt = collect_all_matches(gt_line)
-            # annotations_cand = collect_all_matches(cand_line)
+        tokenizer = initialize_tokenizer(tokenizer_model_path, fixed_annotations, self.use_fast)
+        placeholders = AnnotationPlaceholders(tokenizer, annotations)
+        ground_truth_ids, *candidate_ids_list = self.encode_groups(tokenizer, [ground_truth_lines] + candidate_lines_list,
+                                                                   placeholders)
+        return self.pair_up(tokenizer, ground_truth_ids, candidate_ids_list, placeholders)
 
-            # ground_truth_tokens = tokenizer(gt_line, max_length=4096, truncation=True).tokens()
-            # candidate_tokens = tokenizer(cand_line, max_length=4096, truncation=True).tokens()
 
-                    # 对 ground truth 和 candidate 进行 tokenization
-            ground_truth_ids = tokenizer.encode(gt_line, max_length=4096, truncation=True)
-            candidate_ids = tokenizer.encode(cand_line, max_length=4096, truncation=True)
+# Concrete strategy to calculate WER for annotations only, treating lists as whole text
+class WERAnnotationOnlyWholeTextStrategy(WERStrategy):
+    def tokenize_many(self, ground_truth_lines, candidate_lines_list, tokenizer_model_path, fixed_annotations):
+        filtered = [filter_text_by_annotations(lines, fixed_annotations)
+                    for lines in [ground_truth_lines] + candidate_lines_list]
+
+        tokenizer = initialize_tokenizer(tokenizer_model_path, fixed_annotations, self.use_fast)
+        ground_truth_ids, *candidate_ids_list = self.encode_joined(tokenizer, filtered)
+        return self.pair_up(tokenizer, ground_truth_ids, candidate_ids_list)
 
-            # 解码成 tokens
-            ground_truth_tokens = tokenizer.convert_ids_to_tokens(ground_truth_ids)
-            candidate_tokens = tokenizer.convert_ids_to_tokens(candidate_ids)
-            # print(f'ground_truth_tokens:{ground_truth_tokens}')
-            # print(f'candidate_tokens:{candidate_tokens}')
 
-            wer = word_list_error_rate(ground_truth_tokens, candidate_tokens)
-            wer_list.append(round(wer, decimal_places))
+# Concrete strategy to calculate WER for annotations only, line by line
+class WERAnnotationOnlyLineByLineStrategy(WERStrategy):
+    line_by_line = True
+
+    def tokenize_many(self, ground_truth_lines, candidate_lines_list, tokenizer_model_path, fixed_annotations):
+        ground_truth_lines, candidate_lines_list = truncate_lines(ground_truth_lines, candidate_lines_list)
 
-        return wer_list
+        filtered = [filter_text_by_annotations(lines, fixed_annotations)
+                    for lines in [ground_truth_lines] + candidate_lines_list]
 
+        tokenizer = initialize_tokenizer(tokenizer_model_path, fixed_annotations, self.use_fast)
+        ground_truth_ids, *candidate_ids_list = self.encode_groups(tokenizer, filtered)
+        return self.pair_up(tokenizer, ground_truth_ids, candidate_ids_list)
 
 
-  
-    def mark_changes_line(self, ground_truth_lines, candidate_lines, tokenizer_model_path, fixed_annotations, return_type='string'):
+# Concrete strategy to calculate WER for annotations only, line by line
+class WERAnnotationOnlyLineByLineStrategy_marked(WERAnnotationOnlyLineByLineStrategy):
+    # The WER is scored on the annotation-only text, the changes are marked on the full lines
+    def tokenize_mark_many(self, ground_truth_lines, candidate_lines_list, tokenizer_model_path, fixed_annotations):
         """
-        统一的标记函数，用于标记字符串或 token 列表中的更改。
-        
+        对完整的文本行进行 tokenization，用于标记更改。
+
         Args:
         - ground_truth_lines (list): Ground truth 的文本行列表。
-        - candidate_lines (list): Candidate 的文本行列表。
+        - candidate_lines_list (list): 每个 candidate 的文本行列表。
         - tokenizer_model_path (str): 用于初始化标记的 tokenizer 模型路径。
         - fixed_annotations (list): 固定的注释列表。
-        - return_type (str): 指定返回类型，'list' 表示返回 token 列表，'string' 表示返回标记后的字符串。
 
         Returns:
-        - tuple: (marked_ground_truth, marked_candidate)，可以是 token 列表或标记后的字符串列表。
+        - list: 每个 candidate 每一行的 (ground_truth_tokens, candidate_tokens)。
         """
         # 收集所有的注释
-        annotations_gt = collect_all_matches(' '.join(ground_truth_lines))
-        annotations_cand = collect_all_matches(' '.join(candidate_lines))
-
-        # 初始化 tokenizer
-        tokenizer = initialize_tokenizer(tokenizer_model_path, fixed_annotations + annotations_gt + annotations_cand)
-
-        # 存储标记后的结果
-        marked_ground_truth = []
-        marked_candidate = []
-
-        # 遍历每一对 gt_line 和 cand_line
-        for gt_line, cand_line in zip(ground_truth_lines, candidate_lines):
-            # 收集行内注释
-            annotations_gt = collect_all_matches(gt_line)
-            annotations_cand = collect_all_matches(cand_line)
-            
-            # 编码为 ID
-            ground_truth_ids = tokenizer.encode(gt_line, max_length=4096, truncation=True)
-            candidate_ids = tokenizer.encode(cand_line, max_length=4096, truncation=True)
-
-            # 解码为 tokens
-            ground_truth_tokens = tokenizer.convert_ids_to_tokens(ground_truth_ids)
-            candidate_tokens = tokenizer.convert_ids_to_tokens(candidate_ids)
-
-            # 调用 mark_word_changes_list 或 mark_word_changes 函数
-            if return_type == 'list':
-                # 返回 token 列表
-                marked_gt, marked_cand = mark_word_changes_list(candidate_tokens, ground_truth_tokens)
-            else:
-                # 返回标记后的字符串
-                marked_gt, marked_cand = mark_word_changes(candidate_tokens, ground_truth_tokens)
+        annotations = collect_annotations([ground_truth_lines] + candidate_lines_list, fixed_annotations)
 
-            # 添加到结果列表中
-            marked_ground_truth.append(marked_gt)
-            marked_candidate.append(marked_cand)
+        # 初始化 tokenizer（注释以占位符保持完整，不加入 tokenizer）
+        tokenizer = initialize_tokenizer(tokenizer_model_path, fixed_annotations, self.use_fast)
+        placeholders = AnnotationPlaceholders(tokenizer, annotations)
 
-        return marked_ground_truth, marked_candidate
+        # 一次批量编码所有行（ground truth 只编码一次）
+        longest = max((len(candidate_lines) for candidate_lines in candidate_lines_list), default=0)
+        ground_truth_ids, *candidate_ids_list = self.encode_groups(tokenizer, [ground_truth_lines[:longest]] + candidate_lines_list,
+                                                                   placeholders)
+        return self.pair_up(tokenizer, ground_truth_ids, candidate_ids_list, placeholders)
+
+
+# Concrete strategy to calculate WER on annotations line by line
+class WERAnnotationLineByLineStrategy_marked(WERAnnotationLineByLineStrategy):
+    # The changes are marked on the same token pairs that are scored, see WERStrategy.evaluate
+    pass